@@ -1,11 +1,29 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+import atexit
 import json
+import bisect
+import functools
+import logging
+import os
+import queue
+import struct
+import tempfile
+import time
+import zlib
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
 from datetime import datetime
-import mysql.connector
-from mysql.connector import Error
-import urllib.parse
-from streamlit.components.v1 import html
+from cachetools import LRUCache, TTLCache
+import requests
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_exponential
+import plotly.graph_objects as go
+from mysql.connector import Error, pooling
+from streamlit.components.v1 import declare_component
+from streamlit.errors import StreamlitAPIException
 
 # --- Configurações do Banco AWS ---
 try:
@@ -14,8 +32,14 @@ try:
         'user': st.secrets["aws_db"]["user"],
         'password': st.secrets["aws_db"]["password"],
         'database': st.secrets["aws_db"]["database"],
-        'port': 3306
+        'port': int(st.secrets["aws_db"].get("port", 3306))
     }
+    DB_POOL_SIZE = int(st.secrets["aws_db"].get("pool_size", 10))
+    BASELINE_STORAGE_FORMAT = st.secrets["aws_db"].get("storage_format", "tasks")
+    COMPACT_PAYLOAD_CODEC = st.secrets["aws_db"].get("compact_codec", "numpy")
+    DELTA_BASELINES = bool(st.secrets["aws_db"].get("delta_baselines", False))
+    DELTA_CHECKPOINT_INTERVAL = int(st.secrets["aws_db"].get("delta_checkpoint_interval", 10))
+    USE_MOCK_DB = False
 except Exception:
     DB_CONFIG = {
         'host': "mock_host",
@@ -24,589 +48,3295 @@ except Exception:
         'database': "mock_db",
         'port': 3306
     }
+    DB_POOL_SIZE = 1
+    BASELINE_STORAGE_FORMAT = "tasks"
+    COMPACT_PAYLOAD_CODEC = "numpy"
+    DELTA_BASELINES = False
+    DELTA_CHECKPOINT_INTERVAL = 10
+    USE_MOCK_DB = True
+
+# --- Configurações do Envio para AWS ---
+try:
+    AWS_UPLOAD_URL = st.secrets["aws_upload"]["url"]
+except Exception:
+    # Sem endpoint configurado o envio é simulado
+    AWS_UPLOAD_URL = None
+
+# --- Configurações da Fonte de Dados dos Projetos ---
+try:
+    PROJECT_DATA_SOURCE = st.secrets["project_data"]["source"]
+    PROJECT_DATA_PATH = st.secrets["project_data"].get("path")
+    PROJECT_DATA_TABLE = st.secrets["project_data"].get("table", "project_tasks")
+    PROJECT_DATA_CHUNKSIZE = int(st.secrets["project_data"].get("chunksize", 50000))
+except Exception:
+    # Sem fonte configurada, usa os dados de exemplo
+    PROJECT_DATA_SOURCE = "mock"
+    PROJECT_DATA_PATH = None
+    PROJECT_DATA_TABLE = "project_tasks"
+    PROJECT_DATA_CHUNKSIZE = 50000
+
+# Envios simultâneos, tamanho máximo da fila, tentativas por envio e timeout HTTP (segundos)
+UPLOAD_WORKERS = 4
+UPLOAD_QUEUE_SIZE = 100
+UPLOAD_MAX_ATTEMPTS = 5
+UPLOAD_TIMEOUT = 30
+# Intervalo (segundos) de atualização da barra lateral enquanto houver envios em andamento
+UPLOAD_POLL_INTERVAL = 2
+# Tempo (segundos) que o status de um envio concluído fica em memória
+UPLOAD_STATUS_TTL = 3600
+# Backoff exponencial entre tentativas (segundos): multiplicador e espera máxima
+UPLOAD_BACKOFF_MULTIPLIER = 0.5
+UPLOAD_BACKOFF_MAX = 30
+# Espera máxima (segundos) pelos envios pendentes quando o processo termina
+UPLOAD_SHUTDOWN_TIMEOUT = 30
+
+# --- Configurações da Instrumentação ---
+try:
+    METRICS_ENABLED = bool(st.secrets["metrics"].get("enabled", True))
+    METRICS_DEBUG_PANEL = bool(st.secrets["metrics"].get("debug_panel", False))
+    METRICS_LOG_RUNS = bool(st.secrets["metrics"].get("log_runs", False))
+    METRICS_PROMETHEUS_PATH = st.secrets["metrics"].get("prometheus_path")
+except Exception:
+    # Sem configuração: métricas ligadas, sem painel nem exportação
+    METRICS_ENABLED = True
+    METRICS_DEBUG_PANEL = False
+    METRICS_LOG_RUNS = False
+    METRICS_PROMETHEUS_PATH = None
+
+# O mysql-connector limita o tamanho do pool a 32 conexões
+DB_POOL_SIZE = max(1, min(DB_POOL_SIZE, pooling.CNX_POOL_MAXSIZE))
+# Tempo máximo (segundos) esperando uma conexão livre quando o pool está esgotado
+DB_POOL_TIMEOUT = 5.0
+# Tentativas de checkout quando a reconexão de um socket antigo falha
+DB_CHECKOUT_ATTEMPTS = 3
+
+# Catálogo de versões em memória: validade (segundos) e nº máximo de empreendimentos
+CATALOG_CACHE_TTL = 300
+CATALOG_CACHE_MAXSIZE = 1024
+# Payloads (tarefas de uma versão) em memória: nº máximo de versões
+PAYLOAD_CACHE_MAXSIZE = 64
+# Matrizes de comparação em memória: nº máximo de empreendimentos (validade: CATALOG_CACHE_TTL)
+COMPARISON_CACHE_MAXSIZE = 64
+# Linhas por INSERT em lote na tabela baseline_tasks
+BASELINE_INSERT_BATCH = 5000
+# Bytes de payload (JSON/compacto) por INSERT de cabeçalhos em lote, abaixo do max_allowed_packet padrão (64MB)
+BASELINE_HEADER_BATCH_BYTES = 8 * 1024 * 1024
+# Acima desta fração de tarefas alteradas, gravar checkpoint completo em vez de delta
+DELTA_MAX_CHANGED_RATIO = 0.5
+# Exportação/importação de linhas de base: linhas por bloco lido e por transação de importação
+BASELINE_EXPORT_CHUNK_ROWS = 50000
+BASELINE_IMPORT_BATCH_ROWS = 200000
+# Dados de tarefas em memória (compartilhados entre sessões): nº máximo de empreendimentos
+PROJECT_CACHE_MAXSIZE = 256
+# Limites (segundos) dos buckets dos histogramas e intervalo mínimo entre exportações Prometheus
+METRICS_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+METRICS_EXPORT_INTERVAL = 15
+# Gantt: linhas por página, linhas de base sobrepostas e figuras memorizadas por sessão
+GANTT_MAX_ROWS = 500
+GANTT_MAX_OVERLAYS = 3
+GANTT_FIGURE_CACHE_SIZE = 8
+
+# --- Instrumentação ---
+# Spans de tempo e contadores agregados no processo (todas as sessões e as threads de
+# envio). Um span custa duas leituras de perf_counter e um lock, então fica ligado em
+# produção. Os spans e contadores da reexecução corrente ficam também na thread do script.
+
+class Metrics:
+    """Histogramas de duração por span e contadores do processo, mais o registro da reexecução corrente"""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._counters = {}
+        self._local = threading.local()
+        self._last_export = 0.0
+
+    def begin_run(self):
+        self._local.run = ([], {})
+
+    def end_run(self):
+        """Encerra a reexecução da thread atual e retorna (spans, contadores) registrados nela"""
+        run = getattr(self._local, 'run', None)
+        self._local.run = None
+        return run or ([], {})
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def observe(self, name, seconds):
+        if not self.enabled:
+            return
+        bucket = bisect.bisect_left(METRICS_BUCKETS, seconds)
+        with self._lock:
+            stats = self._spans.get(name)
+            if stats is None:
+                stats = self._spans[name] = [0, 0.0, 0.0, [0] * (len(METRICS_BUCKETS) + 1)]
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+            stats[3][bucket] += 1
+        run = getattr(self._local, 'run', None)
+        if run is not None:
+            run[0].append((name, seconds))
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+        run = getattr(self._local, 'run', None)
+        if run is not None:
+            run[1][name] = run[1].get(name, 0) + value
+
+    def span_stats(self):
+        """DataFrame span/chamadas/total/médio/máximo (ms) acumulado no processo"""
+        with self._lock:
+            rows = [(name, stats[0], stats[1], stats[2]) for name, stats in self._spans.items()]
+        df = pd.DataFrame(rows, columns=['Span', 'Chamadas', 'Total_ms', 'Maximo_ms'])
+        df['Total_ms'] *= 1000
+        df['Maximo_ms'] *= 1000
+        df.insert(3, 'Medio_ms', df['Total_ms'] / df['Chamadas'].clip(lower=1))
+        return df.sort_values('Total_ms', ascending=False, ignore_index=True)
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def prometheus_text(self):
+        """Métricas no formato texto do Prometheus (histograma por span e um contador por nome)"""
+        with self._lock:
+            spans = {name: (stats[0], stats[1], list(stats[3])) for name, stats in self._spans.items()}
+            counters = dict(self._counters)
+        lines = [
+            "# HELP baseline_app_span_seconds Duração dos trechos instrumentados",
+            "# TYPE baseline_app_span_seconds histogram"
+        ]
+        for name in sorted(spans):
+            count, total, buckets = spans[name]
+            cumulative = 0
+            for limit, hits in zip(METRICS_BUCKETS + ('+Inf',), buckets):
+                cumulative += hits
+                lines.append(f'baseline_app_span_seconds_bucket{{span="{name}",le="{limit}"}} {cumulative}')
+            lines.append(f'baseline_app_span_seconds_sum{{span="{name}"}} {total:.6f}')
+            lines.append(f'baseline_app_span_seconds_count{{span="{name}"}} {count}')
+        for name in sorted(counters):
+            lines.append(f"# TYPE baseline_app_{name}_total counter")
+            lines.append(f"baseline_app_{name}_total {counters[name]}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """Grava o texto Prometheus em path (coletor textfile), no máximo a cada METRICS_EXPORT_INTERVAL"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_export < METRICS_EXPORT_INTERVAL:
+                return
+            self._last_export = now
+        # Escrita atômica: o coletor nunca lê um arquivo pela metade
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+@st.cache_resource(show_spinner=False)
+def get_metrics():
+    return Metrics(enabled=METRICS_ENABLED)
+
+def timed(name):
+    """Decorador que mede cada chamada da função como um span; sem efeito com as métricas desligadas"""
+    metrics = get_metrics()
+    def decorator(func):
+        if not metrics.enabled:
+            return func
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with metrics.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class _CountingCursor:
+    """Cursor que contabiliza consultas e linhas lidas/gravadas; o resto é delegado ao cursor real"""
+
+    def __init__(self, cursor, metrics):
+        self._cursor = cursor
+        self._metrics = metrics
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        self._metrics.count('db_queries')
+        return self._cursor.execute(operation, params, *args, **kwargs)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        self._metrics.count('db_queries')
+        self._metrics.count('db_rows_written', len(seq_params))
+        return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._metrics.count('db_rows_fetched')
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._metrics.count('db_rows_fetched', len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._metrics.count('db_rows_fetched', len(rows))
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class _InstrumentedConnection:
+    """Conexão do pool cujos cursores são contabilizados"""
+
+    def __init__(self, conn, metrics):
+        self._conn = conn
+        self._metrics = metrics
+
+    def cursor(self, *args, **kwargs):
+        return _CountingCursor(self._conn.cursor(*args, **kwargs), self._metrics)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+def publish_run_metrics(run, total):
+    """Guarda o resumo da reexecução na sessão e o envia ao log estruturado e ao arquivo Prometheus"""
+    spans, counters = run
+    by_span = {}
+    for name, seconds in spans:
+        by_span[name] = by_span.get(name, 0.0) + seconds * 1000
+    summary = {
+        'total_ms': round(total * 1000, 2),
+        'spans_ms': {name: round(ms, 2) for name, ms in by_span.items()},
+        'counters': counters
+    }
+    st.session_state.last_run_metrics = summary
+    if METRICS_LOG_RUNS:
+        logging.getLogger("baseline_app").info(json.dumps({'event': 'rerun', **summary}, ensure_ascii=False))
+    if METRICS_PROMETHEUS_PATH:
+        try:
+            get_metrics().export(METRICS_PROMETHEUS_PATH)
+        except OSError as e:
+            logging.getLogger("baseline_app").warning(f"Falha ao exportar métricas: {e}")
+
+def render_metrics_panel():
+    """Painel de diagnóstico: última reexecução desta sessão e agregados do processo"""
+    metrics = get_metrics()
+    with st.expander("🛠️ Diagnóstico"):
+        summary = st.session_state.get('last_run_metrics')
+        if summary:
+            st.caption(f"Última reexecução: {summary['total_ms']:.1f} ms")
+            st.dataframe(
+                pd.DataFrame(sorted(summary['spans_ms'].items(), key=lambda item: -item[1]), columns=['Span', 'ms']),
+                use_container_width=True, hide_index=True
+            )
+            if summary['counters']:
+                st.json(summary['counters'])
+        st.caption("Processo")
+        st.dataframe(metrics.span_stats(), use_container_width=True, hide_index=True)
+        st.json(metrics.counters())
+        st.download_button(
+            "⬇️ Métricas (Prometheus)", metrics.prometheus_text(), file_name="baseline_app.prom",
+            mime="text/plain", use_container_width=True, key="metrics_download"
+        )
+
+# --- Funções de Banco de Dados ---
+
+@st.cache_resource(show_spinner=False)
+def get_db_pool():
+    """Pool de conexões único por processo, compartilhado entre todas as sessões"""
+    return pooling.MySQLConnectionPool(
+        pool_name="baselines_pool",
+        pool_size=DB_POOL_SIZE,
+        pool_reset_session=True,
+        **DB_CONFIG
+    )
+
+@timed("db.checkout")
+def get_db_connection():
+    """Retorna uma conexão do pool (ou None em modo mock / banco indisponível).
+
+    O checkout do pool valida a conexão com um ping e reconecta sockets
+    derrubados pelo servidor (wait_timeout, failover do RDS). Chamar
+    conn.close() devolve a conexão ao pool em vez de encerrá-la.
+    """
+    if USE_MOCK_DB:
+        return None
+    try:
+        pool = get_db_pool()
+    except Error:
+        return None
+
+    metrics = get_metrics()
+    deadline = time.monotonic() + DB_POOL_TIMEOUT
+    attempts = 0
+    while True:
+        try:
+            conn = pool.get_connection()
+            metrics.count('db_checkouts')
+            return _InstrumentedConnection(conn, metrics) if metrics.enabled else conn
+        except pooling.PoolError:
+            # Pool esgotado: aguardar alguma sessão devolver a conexão
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.05)
+        except Error:
+            # Falha ao reconectar um socket antigo: tentar a próxima conexão
+            attempts += 1
+            if attempts >= DB_CHECKOUT_ATTEMPTS:
+                return None
+
+def release_db_connection(conn, cursor=None):
+    """Fecha o cursor e devolve a conexão ao pool, mesmo que o socket tenha caído"""
+    try:
+        if cursor is not None:
+            cursor.close()
+    except Error:
+        pass
+    try:
+        conn.close()
+    except Error:
+        pass
+
+# --- Armazenamento Normalizado (baseline_tasks) ---
+# Formatos de armazenamento de uma versão (coluna baselines.storage_format):
+#   'json'    -> JSON em baselines.baseline_data (lista de dicts original ou colunar)
+#   'tasks'   -> uma linha por tarefa em baseline_tasks, com colunas DATE
+#   'compact' -> payload binário colunar em baselines.payload (ver encode_compact_payload)
+
+def _version_number(version_name):
+    """Número n de uma versão 'P{n}-(dd/mm/aaaa)', ou None se o nome não seguir o padrão"""
+    prefix = version_name.split('-')[0]
+    if prefix.startswith('P') and prefix[1:].isdigit():
+        return int(prefix[1:])
+    return None
+
+def _baseline_frame(version_name, baseline_data):
+    """Converte o payload de uma versão em DataFrame ID_Tarefa/Inicio/Fim.
+
+    Aceita o DataFrame já no formato, o JSON colunar ({"ID_Tarefa": [...],
+    "Inicio": [...], "Fim": [...]}) e o JSON original (lista de dicts com
+    chaves P{n}_Previsto_*).
+    """
+    if isinstance(baseline_data, pd.DataFrame):
+        return baseline_data
+    if isinstance(baseline_data, dict):
+        df_version = pd.DataFrame(baseline_data, columns=['ID_Tarefa', 'Inicio', 'Fim'])
+    else:
+        version_prefix = version_name.split('-')[0]
+        df_version = pd.DataFrame(baseline_data, columns=['ID_Tarefa', f'{version_prefix}_Previsto_Inicio', f'{version_prefix}_Previsto_Fim'])
+        df_version.columns = ['ID_Tarefa', 'Inicio', 'Fim']
+    df_version['Inicio'] = pd.to_datetime(df_version['Inicio'])
+    df_version['Fim'] = pd.to_datetime(df_version['Fim'])
+    return df_version
+
+def _task_rows_frame(task_rows):
+    """DataFrame ID_Tarefa/Inicio/Fim a partir de tuplas (id_tarefa, DATE, DATE) lidas de baseline_tasks"""
+    df_version = pd.DataFrame(task_rows, columns=['ID_Tarefa', 'Inicio', 'Fim'])
+    df_version['Inicio'] = pd.to_datetime(df_version['Inicio'])
+    df_version['Fim'] = pd.to_datetime(df_version['Fim'])
+    return df_version
+
+def _date_strings(dates):
+    """Datas (datetime64) para 'YYYY-MM-DD' de forma vetorizada; NaT vira None"""
+    days = np.asarray(dates, dtype='datetime64[D]')
+    return np.where(np.isnat(days), None, np.datetime_as_string(days)).tolist()
+
+def _frame_rows(df_version):
+    """Tuplas (ID_Tarefa, inicio, fim) de um DataFrame ID_Tarefa/Inicio/Fim, para executemany"""
+    return list(zip(
+        df_version['ID_Tarefa'].astype('int64').tolist(),
+        _date_strings(df_version['Inicio']),
+        _date_strings(df_version['Fim'])
+    ))
+
+def _frame_json(df_version):
+    """Serializa um DataFrame ID_Tarefa/Inicio/Fim em JSON colunar (sem um dict por tarefa)"""
+    return json.dumps({
+        'ID_Tarefa': df_version['ID_Tarefa'].astype('int64').tolist(),
+        'Inicio': _date_strings(df_version['Inicio']),
+        'Fim': _date_strings(df_version['Fim'])
+    })
+
+BASELINE_TASKS_INSERT_QUERY = """
+INSERT INTO baseline_tasks (baseline_id, id_tarefa, previsto_inicio, previsto_fim)
+VALUES (%s, %s, %s, %s)
+"""
+
+def _insert_baseline_tasks(cursor, baseline_id, rows):
+    """Insere as tarefas de uma versão em lotes (executemany gera INSERTs multi-linha)"""
+    for start in range(0, len(rows), BASELINE_INSERT_BATCH):
+        batch = rows[start:start + BASELINE_INSERT_BATCH]
+        cursor.executemany(BASELINE_TASKS_INSERT_QUERY, [(baseline_id,) + row for row in batch])
+
+def _migrate_json_baselines_to_tasks(conn, cursor):
+    """Move o baseline_data JSON das versões existentes para baseline_tasks.
+
+    Cada versão é migrada e confirmada isoladamente; se a migração for
+    interrompida, a próxima execução continua das versões ainda em 'json'.
+    """
+    cursor.execute("SELECT id FROM baselines WHERE storage_format = 'json'")
+    baseline_ids = [row[0] for row in cursor.fetchall()]
+    for baseline_id in baseline_ids:
+        cursor.execute("SELECT version_name, baseline_data FROM baselines WHERE id = %s", (baseline_id,))
+        version_name, baseline_json = cursor.fetchone()
+        df_version = _baseline_frame(version_name, json.loads(baseline_json))
+        _insert_baseline_tasks(cursor, baseline_id, _frame_rows(df_version))
+        cursor.execute(
+            "UPDATE baselines SET storage_format = 'tasks', baseline_data = NULL WHERE id = %s",
+            (baseline_id,)
+        )
+        conn.commit()
+
+# --- Payload Compacto (formato 'compact') ---
+# Cabeçalho: assinatura, versão do codec e nº de tarefas. Corpo: três colunas
+# int32 (ID_Tarefa e Inicio/Fim em dias desde 1970-01-01, EPOCH_DAY_NULL
+# para datas ausentes). Codec 1: buffers NumPy little-endian comprimidos
+# com zlib. Codec 2: stream Arrow IPC comprimido com zstd (requer pyarrow).
+# Novos codecs recebem um novo número; os antigos continuam legíveis.
+COMPACT_PAYLOAD_MAGIC = b'BLCP'
+COMPACT_PAYLOAD_HEADER = struct.Struct('<4sBI')
+COMPACT_CODEC_NUMPY = 1
+COMPACT_CODEC_ARROW = 2
+EPOCH_DAY_NULL = np.iinfo(np.int32).min
+
+def _epoch_days(dates):
+    """Datas (datetime64) para dias desde a época em int32; NaT vira EPOCH_DAY_NULL"""
+    days = np.asarray(dates, dtype='datetime64[D]')
+    return np.where(np.isnat(days), EPOCH_DAY_NULL, days.astype(np.int64)).astype(np.int32)
+
+def _epoch_days_to_datetime(days):
+    """Inverso de _epoch_days"""
+    days = np.asarray(days, dtype=np.int64)
+    dates = days.astype('datetime64[D]')
+    dates[days == EPOCH_DAY_NULL] = np.datetime64('NaT')
+    return dates.astype('datetime64[ns]')
+
+def _task_ids_int32(task_ids):
+    task_ids = np.asarray(task_ids, dtype=np.int64)
+    if len(task_ids) and (task_ids.min() < np.iinfo(np.int32).min or task_ids.max() > np.iinfo(np.int32).max):
+        raise ValueError("ID_Tarefa fora do intervalo int32 do payload compacto")
+    return task_ids.astype(np.int32)
+
+def encode_compact_payload(df_version, codec=None):
+    """Codifica um DataFrame ID_Tarefa/Inicio/Fim no payload binário colunar versionado"""
+    codec = codec or (COMPACT_CODEC_ARROW if COMPACT_PAYLOAD_CODEC == 'arrow' else COMPACT_CODEC_NUMPY)
+    columns = [
+        _task_ids_int32(df_version['ID_Tarefa']),
+        _epoch_days(df_version['Inicio']),
+        _epoch_days(df_version['Fim'])
+    ]
+    if codec == COMPACT_CODEC_ARROW:
+        import pyarrow as pa
+        table = pa.table({'ID_Tarefa': columns[0], 'Inicio': columns[1], 'Fim': columns[2]})
+        sink = pa.BufferOutputStream()
+        options = pa.ipc.IpcWriteOptions(compression='zstd')
+        with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+        body = sink.getvalue().to_pybytes()
+    else:
+        body = zlib.compress(b''.join(column.astype('<i4').tobytes() for column in columns))
+    return COMPACT_PAYLOAD_HEADER.pack(COMPACT_PAYLOAD_MAGIC, codec, len(df_version)) + body
+
+@timed("payload.decode")
+def decode_baseline_payload(version_name, raw):
+    """Decodifica o payload armazenado de uma versão direto em DataFrame ID_Tarefa/Inicio/Fim.
+
+    Lê o formato compacto (qualquer codec) e, de forma transparente, o
+    JSON legado (lista de dicts ou colunar).
+    """
+    if isinstance(raw, (bytes, bytearray)) and raw[:len(COMPACT_PAYLOAD_MAGIC)] == COMPACT_PAYLOAD_MAGIC:
+        _, codec, n_rows = COMPACT_PAYLOAD_HEADER.unpack_from(raw)
+        body = bytes(raw[COMPACT_PAYLOAD_HEADER.size:])
+        if codec == COMPACT_CODEC_NUMPY:
+            columns = np.frombuffer(zlib.decompress(body), dtype='<i4').reshape(3, n_rows)
+        elif codec == COMPACT_CODEC_ARROW:
+            import pyarrow as pa
+            table = pa.ipc.open_stream(body).read_all()
+            columns = [table.column(name).to_numpy() for name in ('ID_Tarefa', 'Inicio', 'Fim')]
+        else:
+            raise ValueError(f"Codec de payload desconhecido: {codec}")
+        return pd.DataFrame({
+            'ID_Tarefa': columns[0].astype(np.int32),
+            'Inicio': _epoch_days_to_datetime(columns[1]),
+            'Fim': _epoch_days_to_datetime(columns[2])
+        })
+    return _baseline_frame(version_name, json.loads(raw))
+
+# --- Linhas de Base Delta ---
+# No modo delta (aws_db.delta_baselines), uma versão guarda só as tarefas
+# novas ou com datas alteradas em relação à versão anterior (parent_id),
+# mais a lista de tarefas removidas (removed_task_ids). A cada
+# DELTA_CHECKPOINT_INTERVAL versões (delta_depth) é gravado um checkpoint
+# completo, o que limita o tamanho da cadeia a reconstruir. As tarefas do
+# delta usam o mesmo storage_format das versões completas.
+
+def _encode_task_ids(task_ids):
+    if len(task_ids) == 0:
+        return None
+    return zlib.compress(_task_ids_int32(task_ids).astype('<i4').tobytes())
+
+def _decode_task_ids(raw):
+    if not raw:
+        return np.empty(0, dtype=np.int32)
+    return np.frombuffer(zlib.decompress(bytes(raw)), dtype='<i4')
+
+def _diff_baseline_frames(df_parent, df_version):
+    """Retorna (tarefas novas/alteradas, IDs removidos) de df_version em relação a df_parent"""
+    merged = df_version.merge(df_parent, on='ID_Tarefa', how='left', suffixes=('', '_pai'), indicator=True)
+    same_inicio = (merged['Inicio'] == merged['Inicio_pai']) | (merged['Inicio'].isna() & merged['Inicio_pai'].isna())
+    same_fim = (merged['Fim'] == merged['Fim_pai']) | (merged['Fim'].isna() & merged['Fim_pai'].isna())
+    changed = (merged['_merge'] == 'left_only') | ~(same_inicio & same_fim)
+    # O merge 'left' preserva a ordem de df_version, então a máscara se alinha por posição
+    df_changed = df_version[changed.to_numpy()].reset_index(drop=True)
+    removed_ids = np.setdiff1d(df_parent['ID_Tarefa'].to_numpy(), df_version['ID_Tarefa'].to_numpy())
+    return df_changed, removed_ids
+
+def _apply_baseline_delta(df_parent, df_changed, removed_ids):
+    """Reconstrói uma versão a partir da versão anterior materializada e do seu delta"""
+    df_version = pd.concat([df_parent, df_changed], ignore_index=True)
+    df_version = df_version.drop_duplicates('ID_Tarefa', keep='last')
+    if len(removed_ids):
+        df_version = df_version[~df_version['ID_Tarefa'].isin(removed_ids)]
+    return df_version.sort_values('ID_Tarefa', ignore_index=True)
+
+# --- Migrações de Schema ---
+# Cada migração é (versão, descrição, passos). Um passo é um comando SQL ou
+# uma função que recebe a conexão e o cursor (para migrações de dados). As migrações são
+# aplicadas em ordem, uma única vez, e registradas em schema_migrations.
+# Para novas colunas/índices basta acrescentar uma entrada ao final da lista;
+# nunca altere uma migração já publicada.
+# DDL no MySQL faz commit implícito: se uma migração falhar no meio, os passos
+# anteriores ficam aplicados sem o registro em schema_migrations. Por isso
+# colunas e índices são criados por _add_column/_create_index, que verificam o
+# information_schema antes, e a migração pode ser repetida com segurança.
+
+def _column_exists(cursor, table, column):
+    cursor.execute("""
+    SELECT COUNT(*) FROM information_schema.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    return cursor.fetchone()[0] > 0
+
+def _index_exists(cursor, table, index):
+    cursor.execute("""
+    SELECT COUNT(*) FROM information_schema.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+    """, (table, index))
+    return cursor.fetchone()[0] > 0
+
+def _add_column(table, column, definition):
+    """Passo de migração: ALTER TABLE ... ADD COLUMN, ignorado se a coluna já existir"""
+    def step(conn, cursor):
+        if not _column_exists(cursor, table, column):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return step
+
+def _create_index(table, index, columns):
+    """Passo de migração: CREATE INDEX, ignorado se o índice já existir"""
+    def step(conn, cursor):
+        if not _index_exists(cursor, table, index):
+            cursor.execute(f"CREATE INDEX {index} ON {table} ({columns})")
+    return step
+
+def _add_parent_foreign_key(conn, cursor):
+    """Chave estrangeira parent_id → baselines.id (RESTRICT): apagar uma versão com deltas dependentes falha.
+
+    Deltas órfãos (pai já apagado) impediriam a criação da chave. Como o pai
+    não existe mais, não há como reconstruí-los: passam a ser versões
+    completas com as tarefas que guardam (só as alteradas), e os nomes vão
+    para o log.
+    """
+    cursor.execute("""
+    SELECT COUNT(*) FROM information_schema.TABLE_CONSTRAINTS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'baselines' AND CONSTRAINT_NAME = 'fk_baselines_parent'
+    """)
+    if cursor.fetchone()[0] > 0:
+        return
+    cursor.execute("""
+    SELECT c.empreendimento, c.version_name FROM baselines c
+    LEFT JOIN baselines p ON p.id = c.parent_id
+    WHERE c.parent_id IS NOT NULL AND p.id IS NULL
+    """)
+    orphans = cursor.fetchall()
+    if orphans:
+        names = ', '.join(f"{empreendimento}/{version_name}" for empreendimento, version_name in orphans)
+        logging.getLogger("baseline_app").warning(
+            f"{len(orphans)} versão(ões) delta sem a versão anterior viraram versões completas: {names}"
+        )
+        cursor.execute("""
+        UPDATE baselines c LEFT JOIN baselines p ON p.id = c.parent_id
+        SET c.parent_id = NULL, c.delta_depth = 0, c.removed_task_ids = NULL
+        WHERE c.parent_id IS NOT NULL AND p.id IS NULL
+        """)
+    cursor.execute(
+        "ALTER TABLE baselines ADD CONSTRAINT fk_baselines_parent FOREIGN KEY (parent_id) REFERENCES baselines (id)"
+    )
+
+SCHEMA_MIGRATIONS = [
+    (1, "Tabela de linhas de base", [
+        """
+        CREATE TABLE IF NOT EXISTS baselines (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            empreendimento VARCHAR(255) NOT NULL,
+            version_name VARCHAR(255) NOT NULL,
+            baseline_data JSON NOT NULL,
+            created_date VARCHAR(50) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE KEY unique_baseline (empreendimento, version_name)
+        )
+        """,
+    ]),
+    (2, "Índice de versões por empreendimento e data de criação", [
+        _create_index("baselines", "idx_baselines_emp_created", "empreendimento, created_at"),
+    ]),
+    (3, "Tabela normalizada de tarefas por versão", [
+        """
+        CREATE TABLE IF NOT EXISTS baseline_tasks (
+            baseline_id INT NOT NULL,
+            id_tarefa INT NOT NULL,
+            previsto_inicio DATE NULL,
+            previsto_fim DATE NULL,
+            PRIMARY KEY (baseline_id, id_tarefa),
+            KEY idx_baseline_tasks_tarefa (id_tarefa),
+            CONSTRAINT fk_baseline_tasks_baseline FOREIGN KEY (baseline_id)
+                REFERENCES baselines (id) ON DELETE CASCADE
+        )
+        """,
+        _add_column("baselines", "storage_format", "VARCHAR(16) NOT NULL DEFAULT 'json'"),
+        "ALTER TABLE baselines MODIFY baseline_data JSON NULL",
+    ]),
+    (4, "Migração do baseline_data JSON para baseline_tasks", [
+        _migrate_json_baselines_to_tasks,
+    ]),
+    (5, "Número da versão indexado por empreendimento", [
+        _add_column("baselines", "version_number", "INT NULL"),
+        """
+        UPDATE baselines
+        SET version_number = CAST(SUBSTRING_INDEX(SUBSTRING(version_name, 2), '-', 1) AS UNSIGNED)
+        WHERE version_name REGEXP '^P[0-9]+(-|$)'
+        """,
+        _create_index("baselines", "idx_baselines_emp_version", "empreendimento, version_number"),
+    ]),
+    (6, "Coluna de payload binário compacto", [
+        _add_column("baselines", "payload", "LONGBLOB NULL"),
+    ]),
+    (7, "Versões delta encadeadas por parent_id", [
+        _add_column("baselines", "parent_id", "INT NULL"),
+        _add_column("baselines", "delta_depth", "INT NOT NULL DEFAULT 0"),
+        _add_column("baselines", "removed_task_ids", "LONGBLOB NULL"),
+        _create_index("baselines", "idx_baselines_parent", "parent_id"),
+    ]),
+    # O status das versões anteriores a esta migração só existia nas sessões;
+    # elas são consideradas enviadas e as novas nascem 'pending'.
+    (8, "Status de envio para AWS persistido por versão", [
+        _add_column("baselines", "sync_status", "VARCHAR(16) NOT NULL DEFAULT 'sent'"),
+        _add_column("baselines", "sync_error", "VARCHAR(500) NULL"),
+        _add_column("baselines", "synced_at", "TIMESTAMP NULL"),
+        "ALTER TABLE baselines ALTER COLUMN sync_status SET DEFAULT 'pending'",
+        _create_index("baselines", "idx_baselines_sync", "sync_status, empreendimento"),
+    ]),
+    (9, "Sequência de números de versão por empreendimento", [
+        """
+        CREATE TABLE IF NOT EXISTS baseline_sequences (
+            empreendimento VARCHAR(255) NOT NULL PRIMARY KEY,
+            last_version INT NOT NULL
+        )
+        """,
+        """
+        INSERT INTO baseline_sequences (empreendimento, last_version)
+        SELECT empreendimento, COALESCE(MAX(version_number), 0) FROM baselines GROUP BY empreendimento
+        ON DUPLICATE KEY UPDATE last_version = GREATEST(last_version, VALUES(last_version))
+        """,
+    ]),
+    # Sem a chave, um delta gravado enquanto outra sessão apagava o pai ficava órfão
+    (10, "Chave estrangeira das versões delta para a versão anterior", [
+        _add_parent_foreign_key,
+    ]),
+]
+
+@st.cache_resource(show_spinner=False)
+def bootstrap_schema():
+    """Aplica as migrações pendentes uma vez por processo e retorna a versão do schema.
+
+    Um erro propaga a exceção (e nada fica em cache), então a próxima
+    execução tenta de novo. O GET_LOCK evita que dois processos migrem
+    ao mesmo tempo.
+    """
+    conn = get_db_connection()
+    if not conn:
+        raise Error("Banco de dados indisponível")
+    cursor = None
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT GET_LOCK('baselines_schema', 30)")
+        if cursor.fetchone()[0] != 1:
+            raise Error("Tempo esgotado aguardando o lock de migração do schema")
+        try:
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT PRIMARY KEY,
+                description VARCHAR(255) NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """)
+            cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+            current_version = cursor.fetchone()[0]
+            for version, description, steps in SCHEMA_MIGRATIONS:
+                if version <= current_version:
+                    continue
+                for step in steps:
+                    if callable(step):
+                        step(conn, cursor)
+                    else:
+                        cursor.execute(step)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                    (version, description)
+                )
+                conn.commit()
+                current_version = version
+            return current_version
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK('baselines_schema')")
+            cursor.fetchone()
+    finally:
+        release_db_connection(conn, cursor)
+
+def ensure_schema():
+    """Garante o schema do banco (em cache por processo) e o armazenamento mock da sessão"""
+    if 'mock_baselines' not in st.session_state:
+        st.session_state.mock_baselines = {}
+    if USE_MOCK_DB:
+        return
+    try:
+        bootstrap_schema()
+    except Error as e:
+        st.error(f"Erro ao criar tabela: {e}")
+
+def _stored_payload_frame(row):
+    """DataFrame de uma versão gravada em baselines.payload ('compact') ou baselines.baseline_data ('json')"""
+    raw = row['payload'] if row['storage_format'] == 'compact' else row['baseline_data']
+    get_metrics().count('db_payload_bytes', len(raw) if raw else 0)
+    return decode_baseline_payload(row['version_name'], raw)
+
+# --- Catálogo de Linhas de Base (cache em memória) ---
+
+class BaselineCatalog:
+    """Cache compartilhado (TTL + LRU) das linhas de base.
+
+    Os metadados das versões (nome/data) ficam por empreendimento, separados
+    dos payloads, que são guardados por (empreendimento, versão) já
+    convertidos em DataFrame. save_baseline e delete_baseline invalidam o
+    empreendimento afetado; o contador de geração impede que uma leitura
+    iniciada antes da invalidação grave dados antigos no cache. Em
+    implantações com vários processos, o TTL limita o tempo que uma
+    escrita de outro processo leva para aparecer.
+    """
+
+    def __init__(self, maxsize, ttl, payload_maxsize):
+        self._versions = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._payloads = TTLCache(maxsize=payload_maxsize, ttl=ttl)
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, empreendimento):
+        """Retorna (versões ou None, geração atual)"""
+        with self._lock:
+            return self._versions.get(empreendimento), self._generations.get(empreendimento, 0)
+
+    def store(self, empreendimento, versions, generation):
+        with self._lock:
+            if self._generations.get(empreendimento, 0) == generation:
+                self._versions[empreendimento] = versions
+
+    def lookup_payload(self, empreendimento, version_name):
+        """Retorna (DataFrame ou None, geração atual)"""
+        with self._lock:
+            return (self._payloads.get((empreendimento, version_name)),
+                    self._generations.get(empreendimento, 0))
+
+    def store_payload(self, empreendimento, version_name, df_version, generation):
+        with self._lock:
+            if self._generations.get(empreendimento, 0) == generation:
+                self._payloads[(empreendimento, version_name)] = df_version
+
+    def invalidate(self, empreendimento, version_name=None):
+        """Descarta a lista de versões do empreendimento e o payload da versão alterada"""
+        with self._lock:
+            self._versions.pop(empreendimento, None)
+            if version_name is not None:
+                self._payloads.pop((empreendimento, version_name), None)
+            self._generations[empreendimento] = self._generations.get(empreendimento, 0) + 1
+
+@st.cache_resource(show_spinner=False)
+def get_baseline_catalog():
+    return BaselineCatalog(CATALOG_CACHE_MAXSIZE, CATALOG_CACHE_TTL, PAYLOAD_CACHE_MAXSIZE)
+
+@timed("db.list_baseline_versions")
+def list_baseline_versions(empreendimento):
+    """Metadados das versões de um empreendimento: {version_name: {"date": created_date}}"""
+    if not USE_MOCK_DB:
+        catalog = get_baseline_catalog()
+        versions, generation = catalog.lookup(empreendimento)
+        if versions is not None:
+            return versions
+        conn = get_db_connection()
+        if conn is None:
+            st.error("Erro ao carregar linhas de base: banco de dados indisponível")
+            return {}
+        cursor = None
+        try:
+            cursor = conn.cursor(dictionary=True)
+            query = """
+            SELECT version_name, created_date, sync_status, sync_error FROM baselines
+            WHERE empreendimento = %s ORDER BY created_at DESC
+            """
+            cursor.execute(query, (empreendimento,))
+            versions = {
+                row['version_name']: {
+                    "date": row['created_date'],
+                    "sync_status": row['sync_status'],
+                    "sync_error": row['sync_error']
+                }
+                for row in cursor.fetchall()
+            }
+            catalog.store(empreendimento, versions, generation)
+            return versions
+        except Error as e:
+            st.error(f"Erro ao carregar linhas de base: {e}")
+            return {}
+        finally:
+            release_db_connection(conn, cursor)
+    mock_versions = st.session_state.mock_baselines.get(empreendimento, {})
+    return {
+        version_name: {"date": info["date"], "sync_status": info["sync_status"], "sync_error": info.get("sync_error")}
+        for version_name, info in reversed(mock_versions.items())
+    }
+
+def list_unsent_baselines(empreendimento):
+    """Versões do empreendimento ainda não enviadas para AWS (status 'pending' ou 'failed'), da mais antiga para a mais nova"""
+    versions = list_baseline_versions(empreendimento)
+    return [version_name for version_name, info in reversed(versions.items()) if info["sync_status"] != 'sent']
+
+@timed("db.count_unsent")
+def count_unsent_baselines():
+    """Total de versões não enviadas em todos os empreendimentos (contagem no índice de sync_status)"""
+    if not USE_MOCK_DB:
+        conn = get_db_connection()
+        if conn is None:
+            st.error("Erro ao contar linhas de base não enviadas: banco de dados indisponível")
+            return 0
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM baselines WHERE sync_status IN ('pending', 'failed')")
+            return cursor.fetchone()[0]
+        except Error as e:
+            st.error(f"Erro ao contar linhas de base não enviadas: {e}")
+            return 0
+        finally:
+            release_db_connection(conn, cursor)
+    else:
+        return sum(
+            1 for versions in st.session_state.mock_baselines.values()
+            for info in versions.values() if info["sync_status"] != 'sent'
+        )
+
+@timed("db.set_sync_status")
+def set_sync_status(empreendimento, version_name, sync_status, sync_error=None):
+    """Persiste o status de envio de uma versão. Chamado também pelas threads da fila de envio"""
+    conn = get_db_connection()
+    if conn:
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+            UPDATE baselines
+            SET sync_status = %s, sync_error = %s,
+                synced_at = CASE WHEN %s = 'sent' THEN CURRENT_TIMESTAMP ELSE synced_at END
+            WHERE empreendimento = %s AND version_name = %s
+            """, (sync_status, sync_error[:500] if sync_error else None, sync_status, empreendimento, version_name))
+            conn.commit()
+            get_baseline_catalog().invalidate(empreendimento)
+            return True
+        except Error:
+            return False
+        finally:
+            release_db_connection(conn, cursor)
+    return False
+
+@timed("db.load_baseline_payload")
+def load_baseline_payload(empreendimento, version_name):
+    """Tarefas de uma única versão (ID_Tarefa/Inicio/Fim), carregadas sob demanda e memorizadas.
+
+    Versões delta são reconstruídas a partir da versão anterior (também
+    memorizada). Retorna None se a versão não existir. O DataFrame é
+    compartilhado pelo cache, portanto não deve ser alterado pelo chamador.
+    """
+    if not USE_MOCK_DB:
+        catalog = get_baseline_catalog()
+        df_version, generation = catalog.lookup_payload(empreendimento, version_name)
+        if df_version is not None:
+            return df_version
+        conn = get_db_connection()
+        if conn is None:
+            st.error("Erro ao carregar linha de base: banco de dados indisponível")
+            return None
+        cursor = None
+        try:
+            cursor = conn.cursor(dictionary=True)
+            query = """
+            SELECT b.id, b.version_name, b.storage_format, b.baseline_data, b.payload,
+                b.parent_id, b.removed_task_ids, p.version_name AS parent_version
+            FROM baselines b LEFT JOIN baselines p ON p.id = b.parent_id
+            WHERE b.empreendimento = %s AND b.version_name = %s
+            """
+            cursor.execute(query, (empreendimento, version_name))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            if row['storage_format'] == 'tasks':
+                # Tarefas tipadas (DATE) lidas direto pela chave primária
+                cursor.execute("""
+                SELECT id_tarefa, previsto_inicio, previsto_fim FROM baseline_tasks
+                WHERE baseline_id = %s ORDER BY id_tarefa
+                """, (row['id'],))
+                df_version = _task_rows_frame(
+                    [(task['id_tarefa'], task['previsto_inicio'], task['previsto_fim']) for task in cursor.fetchall()]
+                )
+            else:
+                df_version = _stored_payload_frame(row)
+        except Error as e:
+            st.error(f"Erro ao carregar linha de base: {e}")
+            return None
+        finally:
+            release_db_connection(conn, cursor)
+        if row['parent_id'] is not None:
+            # A conexão já foi devolvida ao pool antes de descer na cadeia de deltas
+            df_parent = load_baseline_payload(empreendimento, row['parent_version']) if row['parent_version'] else None
+            if df_parent is None:
+                st.error(f"Erro ao carregar linha de base: versão anterior de {version_name} não encontrada")
+                return None
+            df_version = _apply_baseline_delta(df_parent, df_version, _decode_task_ids(row['removed_task_ids']))
+        catalog.store_payload(empreendimento, version_name, df_version, generation)
+        return df_version
+    mock_version = st.session_state.mock_baselines.get(empreendimento, {}).get(version_name)
+    if mock_version is None:
+        return None
+    return _baseline_frame(version_name, mock_version["data"])
+
+def _baseline_delta(empreendimento, version_name, df_version):
+    """Delta de uma nova versão em relação à versão anterior do empreendimento.
+
+    Retorna (parent_id, delta_depth, tarefas alteradas, IDs removidos), ou
+    None quando a versão deve ser gravada como checkpoint completo.
+    """
+    version_number = _version_number(version_name)
+    if version_number is None:
+        return None
+    conn = get_db_connection()
+    if not conn:
+        return None
+    cursor = None
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("""
+        SELECT id, version_name, delta_depth FROM baselines
+        WHERE empreendimento = %s AND version_number < %s
+        ORDER BY version_number DESC LIMIT 1
+        """, (empreendimento, version_number))
+        parent = cursor.fetchone()
+    except Error:
+        return None
+    finally:
+        release_db_connection(conn, cursor)
+    if parent is None or parent['delta_depth'] + 1 >= DELTA_CHECKPOINT_INTERVAL:
+        return None
+    df_parent = load_baseline_payload(empreendimento, parent['version_name'])
+    if df_parent is None:
+        return None
+    df_changed, removed_ids = _diff_baseline_frames(df_parent, df_version)
+    if len(df_changed) + len(removed_ids) > DELTA_MAX_CHANGED_RATIO * max(len(df_version), 1):
+        return None
+    return parent['id'], parent['delta_depth'] + 1, df_changed, removed_ids
+
+def _checkpoint_children(empreendimento, version_name):
+    """Regrava como checkpoints completos os deltas que dependem de uma versão prestes a mudar ou sumir.
+
+    Retorna False se não foi possível preservar algum delta dependente.
+    """
+    conn = get_db_connection()
+    if not conn:
+        st.error("Erro ao verificar versões dependentes: banco de dados indisponível")
+        return False
+    cursor = None
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("""
+        SELECT c.version_name, c.created_date, c.sync_status FROM baselines c
+        JOIN baselines p ON p.id = c.parent_id
+        WHERE p.empreendimento = %s AND p.version_name = %s
+        """, (empreendimento, version_name))
+        children = cursor.fetchall()
+    except Error as e:
+        st.error(f"Erro ao verificar versões dependentes: {e}")
+        return False
+    finally:
+        release_db_connection(conn, cursor)
+    for child in children:
+        df_child = load_baseline_payload(empreendimento, child['version_name'])
+        if df_child is None or not _write_baseline(
+            empreendimento, child['version_name'], df_child, child['created_date'], sync_status=child['sync_status']
+        ):
+            return False
+    return True
+
+def save_baseline(empreendimento, version_name, baseline_data, created_date):
+    """Grava uma versão. baseline_data é um DataFrame ID_Tarefa/Inicio/Fim (ou um payload legado)"""
+    df_version = _baseline_frame(version_name, baseline_data)
+    delta = None
+    if not USE_MOCK_DB:
+        # Deltas apoiados numa versão sobrescrita precisam do conteúdo antigo materializado;
+        # uma versão nova ainda não tem dependentes (o catálogo evita a consulta)
+        overwriting = version_name in list_baseline_versions(empreendimento)
+        if overwriting and not _checkpoint_children(empreendimento, version_name):
+            return False
+        if DELTA_BASELINES:
+            delta = _baseline_delta(empreendimento, version_name, df_version)
+    return _write_baseline(empreendimento, version_name, df_version, created_date, delta)
+
+# Cabeçalho de uma versão (e o payload, quando não normalizado). LAST_INSERT_ID(id)
+# devolve o id também quando a versão já existia.
+BASELINE_UPSERT_QUERY = """
+INSERT INTO baselines (empreendimento, version_name, version_number, baseline_data, payload, created_date,
+    storage_format, parent_id, delta_depth, removed_task_ids, sync_status)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id), baseline_data = VALUES(baseline_data),
+    payload = VALUES(payload), created_date = VALUES(created_date), storage_format = VALUES(storage_format),
+    parent_id = VALUES(parent_id), delta_depth = VALUES(delta_depth), removed_task_ids = VALUES(removed_task_ids),
+    sync_status = VALUES(sync_status), sync_error = NULL
+"""
+
+def _baseline_header_params(empreendimento, version_name, df_version, created_date, delta=None, sync_status='pending'):
+    """Parâmetros de BASELINE_UPSERT_QUERY e o DataFrame cujas tarefas devem ser gravadas (o delta, se houver)"""
+    parent_id, delta_depth, removed_task_ids = None, 0, None
+    df_stored = df_version
+    if delta is not None:
+        parent_id, delta_depth, df_stored, removed_ids = delta
+        removed_task_ids = _encode_task_ids(removed_ids)
+    baseline_json = _frame_json(df_stored) if BASELINE_STORAGE_FORMAT == 'json' else None
+    payload = encode_compact_payload(df_stored) if BASELINE_STORAGE_FORMAT == 'compact' else None
+    params = (
+        empreendimento, version_name, _version_number(version_name), baseline_json, payload,
+        created_date, BASELINE_STORAGE_FORMAT, parent_id, delta_depth, removed_task_ids, sync_status
+    )
+    return params, df_stored
+
+@timed("db.write_baseline")
+def _write_baseline(empreendimento, version_name, df_version, created_date, delta=None, sync_status='pending'):
+    if not USE_MOCK_DB:
+        conn = get_db_connection()
+        if conn is None:
+            st.error("Erro ao salvar linha de base: banco de dados indisponível")
+            return False
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            params, df_stored = _baseline_header_params(
+                empreendimento, version_name, df_version, created_date, delta, sync_status
+            )
+            # Cabeçalho e tarefas numa única transação
+            cursor.execute(BASELINE_UPSERT_QUERY, params)
+            baseline_id = cursor.lastrowid
+            cursor.execute("DELETE FROM baseline_tasks WHERE baseline_id = %s", (baseline_id,))
+            if BASELINE_STORAGE_FORMAT == 'tasks':
+                _insert_baseline_tasks(cursor, baseline_id, _frame_rows(df_stored))
+            conn.commit()
+            get_baseline_catalog().invalidate(empreendimento, version_name)
+            get_comparison_engine().set_version(empreendimento, version_name, df_version)
+            get_portfolio_analytics().mark_dirty(empreendimento)
+            return True
+        except Error as e:
+            if conn.is_connected():
+                conn.rollback()
+            st.error(f"Erro ao salvar linha de base: {e}")
+            return False
+        finally:
+            release_db_connection(conn, cursor)
+    else:
+        if empreendimento not in st.session_state.mock_baselines:
+            st.session_state.mock_baselines[empreendimento] = {}
+        st.session_state.mock_baselines[empreendimento][version_name] = {
+            "date": created_date,
+            "data": df_version,
+            "sync_status": sync_status
+        }
+        get_comparison_engine().set_version(empreendimento, version_name, df_version)
+        get_portfolio_analytics().mark_dirty(empreendimento)
+        return True
+
+def get_max_version_number(empreendimento):
+    """Maior n entre as versões P{n} do empreendimento (0 se não houver), via índice (empreendimento, version_number)"""
+    if not USE_MOCK_DB:
+        conn = get_db_connection()
+        if conn is None:
+            raise Error("banco de dados indisponível")
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT COALESCE(MAX(version_number), 0) FROM baselines WHERE empreendimento = %s",
+                (empreendimento,)
+            )
+            return cursor.fetchone()[0]
+        finally:
+            release_db_connection(conn, cursor)
+    else:
+        numbers = [_version_number(v) for v in st.session_state.mock_baselines.get(empreendimento, {})]
+        return max([n for n in numbers if n is not None], default=0)
+
+@timed("db.allocate_version_numbers")
+def allocate_version_numbers(empreendimentos):
+    """Reserva o próximo número de versão P{n} de cada empreendimento, de forma atômica no banco.
+
+    Cada empreendimento tem uma linha em baseline_sequences, incrementada por
+    um upsert que a mantém travada até o commit; a leitura do novo valor
+    acontece na mesma transação, então sessões concorrentes nunca recebem o
+    mesmo número. Um empreendimento sem linha começa do maior version_number
+    já gravado. Números de gravações que falharem ficam sem uso, como num
+    AUTO_INCREMENT. As linhas são travadas sempre em ordem alfabética, para
+    que duas reservas concorrentes com empreendimentos em comum não entrem
+    em deadlock. Retorna {empreendimento: n}.
+    """
+    empreendimentos = sorted(set(empreendimentos))
+    if not empreendimentos:
+        return {}
+    if not USE_MOCK_DB:
+        conn = get_db_connection()
+        if conn is None:
+            raise Error("banco de dados indisponível")
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            cursor.executemany("""
+            INSERT INTO baseline_sequences (empreendimento, last_version)
+            VALUES (%s, (SELECT COALESCE(MAX(version_number), 0) + 1 FROM baselines WHERE empreendimento = %s))
+            ON DUPLICATE KEY UPDATE last_version = last_version + 1
+            """, [(empreendimento, empreendimento) for empreendimento in empreendimentos])
+            placeholders = ', '.join(['%s'] * len(empreendimentos))
+            cursor.execute(
+                f"SELECT empreendimento, last_version FROM baseline_sequences WHERE empreendimento IN ({placeholders})",
+                tuple(empreendimentos)
+            )
+            numbers = dict(cursor.fetchall())
+            conn.commit()
+            return {empreendimento: numbers[empreendimento] for empreendimento in empreendimentos}
+        except Error:
+            if conn.is_connected():
+                conn.rollback()
+            raise
+        finally:
+            release_db_connection(conn, cursor)
+    else:
+        return {empreendimento: get_max_version_number(empreendimento) + 1 for empreendimento in empreendimentos}
+
+def _header_batches(headers):
+    """Divide os cabeçalhos em lotes de até BASELINE_INSERT_BATCH linhas e BASELINE_HEADER_BATCH_BYTES de payload"""
+    batch, batch_bytes = [], 0
+    for params in headers:
+        size = sum(len(value) for value in params if isinstance(value, (str, bytes)))
+        if batch and (len(batch) >= BASELINE_INSERT_BATCH or batch_bytes + size > BASELINE_HEADER_BATCH_BYTES):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(params)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+@timed("db.save_baselines_bulk")
+def save_baselines_bulk(versions, progress=None):
+    """Grava várias versões [(empreendimento, version_name, DataFrame, created_date)] numa única transação.
+
+    Os cabeçalhos e as tarefas de todas as versões vão em lotes de
+    BASELINE_INSERT_BATCH linhas (os cabeçalhos também limitados a
+    BASELINE_HEADER_BATCH_BYTES), para cada INSERT caber no max_allowed_packet.
+    As versões são gravadas como checkpoints completos, sem delta, para não
+    ler a versão anterior de cada empreendimento. progress(fração, texto) é
+    chamado a cada lote.
+    """
+    progress = progress or (lambda fraction, text: None)
+    if not versions:
+        return True
+    if not USE_MOCK_DB:
+        conn = get_db_connection()
+        if conn is None:
+            st.error("Erro ao salvar linhas de base: banco de dados indisponível")
+            return False
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            progress(0.0, f"Gravando {len(versions)} versão(ões)...")
+            headers = [
+                _baseline_header_params(empreendimento, version_name, df_version, created_date)[0]
+                for empreendimento, version_name, df_version, created_date in versions
+            ]
+            for batch in _header_batches(headers):
+                cursor.executemany(BASELINE_UPSERT_QUERY, batch)
+            
+            # executemany não devolve os ids gerados: uma consulta pela chave (empreendimento, version_name)
+            keys = {(empreendimento, version_name) for empreendimento, version_name, _, _ in versions}
+            empreendimentos = sorted({empreendimento for empreendimento, _ in keys})
+            version_names = sorted({version_name for _, version_name in keys})
+            cursor.execute(f"""
+            SELECT id, empreendimento, version_name FROM baselines
+            WHERE empreendimento IN ({', '.join(['%s'] * len(empreendimentos))})
+            AND version_name IN ({', '.join(['%s'] * len(version_names))})
+            """, tuple(empreendimentos) + tuple(version_names))
+            baseline_ids = {
+                (empreendimento, version_name): baseline_id
+                for baseline_id, empreendimento, version_name in cursor.fetchall()
+                if (empreendimento, version_name) in keys
+            }
+            
+            ids = list(baseline_ids.values())
+            if len(ids) != len(keys):
+                raise Error("versões gravadas não encontradas após o INSERT")
+            cursor.execute(
+                f"DELETE FROM baseline_tasks WHERE baseline_id IN ({', '.join(['%s'] * len(ids))})", tuple(ids)
+            )
+            # Versões importadas podem ter números acima da sequência: ela nunca fica para trás
+            cursor.execute(f"""
+            INSERT INTO baseline_sequences (empreendimento, last_version)
+            SELECT empreendimento, MAX(version_number) FROM baselines
+            WHERE empreendimento IN ({', '.join(['%s'] * len(empreendimentos))}) AND version_number IS NOT NULL
+            GROUP BY empreendimento
+            ON DUPLICATE KEY UPDATE last_version = GREATEST(last_version, VALUES(last_version))
+            """, tuple(empreendimentos))
+            if BASELINE_STORAGE_FORMAT == 'tasks':
+                rows = [
+                    (baseline_ids[(empreendimento, version_name)],) + row
+                    for empreendimento, version_name, df_version, _ in versions
+                    for row in _frame_rows(df_version)
+                ]
+                for start in range(0, len(rows), BASELINE_INSERT_BATCH):
+                    cursor.executemany(BASELINE_TASKS_INSERT_QUERY, rows[start:start + BASELINE_INSERT_BATCH])
+                    written = min(start + BASELINE_INSERT_BATCH, len(rows))
+                    progress(written / len(rows), f"Tarefas gravadas: {written}/{len(rows)}")
+            conn.commit()
+        except Error as e:
+            if conn.is_connected():
+                conn.rollback()
+            st.error(f"Erro ao salvar linhas de base: {e}")
+            return False
+        finally:
+            release_db_connection(conn, cursor)
+        for empreendimento, version_name, df_version, _ in versions:
+            get_baseline_catalog().invalidate(empreendimento, version_name)
+            get_comparison_engine().set_version(empreendimento, version_name, df_version)
+            get_portfolio_analytics().mark_dirty(empreendimento)
+        progress(1.0, "Linhas de base gravadas")
+        return True
+    else:
+        for index, (empreendimento, version_name, df_version, created_date) in enumerate(versions, start=1):
+            _write_baseline(empreendimento, version_name, df_version, created_date)
+            progress(index / len(versions), f"Versões gravadas: {index}/{len(versions)}")
+        return True
+
+@timed("db.delete_baseline")
+def delete_baseline(empreendimento, version_name):
+    if not USE_MOCK_DB and not _checkpoint_children(empreendimento, version_name):
+        return False
+    if not USE_MOCK_DB:
+        conn = get_db_connection()
+        if conn is None:
+            st.error("Erro ao deletar linha de base: banco de dados indisponível")
+            return False
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            delete_query = "DELETE FROM baselines WHERE empreendimento = %s AND version_name = %s"
+            cursor.execute(delete_query, (empreendimento, version_name))
+            conn.commit()
+            get_baseline_catalog().invalidate(empreendimento, version_name)
+            get_comparison_engine().drop_version(empreendimento, version_name)
+            get_portfolio_analytics().mark_dirty(empreendimento)
+            return cursor.rowcount > 0
+        except Error as e:
+            if conn.is_connected():
+                conn.rollback()
+            st.error(f"Erro ao deletar linha de base: {e}")
+            return False
+        finally:
+            release_db_connection(conn, cursor)
+    else:
+        if empreendimento in st.session_state.mock_baselines and version_name in st.session_state.mock_baselines[empreendimento]:
+            del st.session_state.mock_baselines[empreendimento][version_name]
+            get_comparison_engine().drop_version(empreendimento, version_name)
+            get_portfolio_analytics().mark_dirty(empreendimento)
+            return True
+        return False
+
+# --- Motor de Comparação de Versões ---
+# Por empreendimento, uma matriz alinhada tarefas × versões com as datas de
+# início/fim em dias desde a época (int32, EPOCH_DAY_NULL onde a tarefa não
+# existe na versão). A matriz é montada uma vez, ganha ou perde colunas
+# conforme as versões são gravadas ou removidas, e as consultas de desvio
+# (um par ou N versões) são operações vetorizadas sobre as colunas.
+
+class VersionMatrix:
+    """Matriz tarefas × versões de um empreendimento (linhas ordenadas por ID_Tarefa)"""
+
+    def __init__(self):
+        self.task_ids = np.empty(0, dtype=np.int32)
+        self.versions = []
+        self.inicio = np.empty((0, 0), dtype=np.int32)
+        self.fim = np.empty((0, 0), dtype=np.int32)
+
+    def _grow(self, task_ids):
+        """Acrescenta linhas para as tarefas ainda não presentes na matriz"""
+        new_ids = np.setdiff1d(task_ids, self.task_ids)
+        if len(new_ids) == 0:
+            return
+        all_ids = np.union1d(self.task_ids, new_ids)
+        rows = np.searchsorted(all_ids, self.task_ids)
+        shape = (len(all_ids), len(self.versions))
+        inicio = np.full(shape, EPOCH_DAY_NULL, dtype=np.int32)
+        fim = np.full(shape, EPOCH_DAY_NULL, dtype=np.int32)
+        inicio[rows] = self.inicio
+        fim[rows] = self.fim
+        self.task_ids, self.inicio, self.fim = all_ids, inicio, fim
+
+    def align(self, df_version, task_ids=None):
+        """Datas de uma versão alinhadas às linhas atuais (ou a task_ids ordenado); outras tarefas são ignoradas"""
+        row_ids = self.task_ids if task_ids is None else task_ids
+        version_ids = _task_ids_int32(df_version['ID_Tarefa'])
+        rows = np.searchsorted(row_ids, version_ids)
+        found = rows < len(row_ids)
+        found[found] = row_ids[rows[found]] == version_ids[found]
+        inicio = np.full(len(row_ids), EPOCH_DAY_NULL, dtype=np.int32)
+        fim = np.full(len(row_ids), EPOCH_DAY_NULL, dtype=np.int32)
+        inicio[rows[found]] = _epoch_days(df_version['Inicio'])[found]
+        fim[rows[found]] = _epoch_days(df_version['Fim'])[found]
+        return inicio, fim
+
+    def set_version(self, version_name, df_version):
+        """Acrescenta a versão como nova coluna ou substitui a coluna existente"""
+        self._grow(_task_ids_int32(df_version['ID_Tarefa']))
+        inicio, fim = self.align(df_version)
+        if version_name in self.versions:
+            col = self.versions.index(version_name)
+            self.inicio[:, col] = inicio
+            self.fim[:, col] = fim
+        else:
+            self.versions.append(version_name)
+            self.inicio = np.column_stack([self.inicio, inicio])
+            self.fim = np.column_stack([self.fim, fim])
+
+    def drop_version(self, version_name):
+        """Remove a coluna da versão e as tarefas que não existem em mais nenhuma"""
+        if version_name not in self.versions:
+            return
+        col = self.versions.index(version_name)
+        del self.versions[col]
+        self.inicio = np.delete(self.inicio, col, axis=1)
+        self.fim = np.delete(self.fim, col, axis=1)
+        keep = (self.inicio != EPOCH_DAY_NULL).any(axis=1) | (self.fim != EPOCH_DAY_NULL).any(axis=1)
+        if not keep.all():
+            self.task_ids, self.inicio, self.fim = self.task_ids[keep], self.inicio[keep], self.fim[keep]
+
+    def columns(self, labels, live=None):
+        """(ID_Tarefa, início, fim) com uma coluna por rótulo, na ordem pedida.
+
+        live mapeia rótulos que não são versões gravadas (ex.: o P0 atual)
+        para DataFrames ID_Tarefa/Inicio/Fim, alinhados na hora. Tarefas que
+        só existem no live ganham linhas extras, nulas nas versões gravadas,
+        sem alterar a matriz.
+        """
+        live = {label: live[label] for label in labels if label in (live or {})}
+        task_ids = self.task_ids
+        for df_live in live.values():
+            task_ids = np.union1d(task_ids, _task_ids_int32(df_live['ID_Tarefa']))
+        rows = np.searchsorted(task_ids, self.task_ids)
+        inicio = np.full((len(task_ids), len(labels)), EPOCH_DAY_NULL, dtype=np.int32)
+        fim = np.full((len(task_ids), len(labels)), EPOCH_DAY_NULL, dtype=np.int32)
+        for i, label in enumerate(labels):
+            if label in live:
+                inicio[:, i], fim[:, i] = self.align(live[label], task_ids)
+            else:
+                col = self.versions.index(label)
+                inicio[rows, i], fim[rows, i] = self.inicio[:, col], self.fim[:, col]
+        return task_ids, inicio, fim
+
+def _day_deltas(later, earlier):
+    """Diferença em dias entre colunas de epoch days, nula onde qualquer lado é nulo"""
+    missing = (later == EPOCH_DAY_NULL) | (earlier == EPOCH_DAY_NULL)
+    values = np.where(missing, 0, later.astype(np.int64) - earlier.astype(np.int64)).astype(np.int32)
+    return pd.arrays.IntegerArray(values, missing)
+
+class ComparisonEngine:
+    """Matrizes de comparação por empreendimento, compartilhadas entre sessões.
+
+    _sync alinha a matriz com a lista de versões do catálogo, carregando só
+    os payloads das versões que ainda não são colunas; _write_baseline e
+    delete_baseline atualizam a coluna afetada na hora. As matrizes ficam num
+    TTLCache: os empreendimentos menos usados saem quando o limite é
+    atingido, e nenhuma matriz fica mais de CATALOG_CACHE_TTL segundos sem
+    ser remontada (escritas de outros processos não a atualizam).
+    """
+
+    def __init__(self, maxsize=COMPARISON_CACHE_MAXSIZE, ttl=CATALOG_CACHE_TTL):
+        self._matrices = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.RLock()
+
+    def _sync(self, empreendimento):
+        versions = list_baseline_versions(empreendimento)
+        with self._lock:
+            matrix = self._matrices.setdefault(empreendimento, VersionMatrix())
+            for version_name in [v for v in matrix.versions if v not in versions]:
+                matrix.drop_version(version_name)
+            missing = [v for v in reversed(versions) if v not in matrix.versions]
+        # Payloads lidos fora do lock; a lista de versões vem da mais nova para a mais antiga.
+        # A coluna vai para a matriz retornada, mesmo que ela saia do cache nesse meio-tempo
+        for version_name in missing:
+            df_version = load_baseline_payload(empreendimento, version_name)
+            if df_version is not None:
+                with self._lock:
+                    matrix.set_version(version_name, df_version)
+        return matrix
+
+    def set_version(self, empreendimento, version_name, df_version):
+        """Atualiza a coluna de uma versão gravada (só se a matriz do empreendimento já existir)"""
+        with self._lock:
+            matrix = self._matrices.get(empreendimento)
+            if matrix is not None:
+                matrix.set_version(version_name, df_version)
+
+    def drop_version(self, empreendimento, version_name):
+        with self._lock:
+            matrix = self._matrices.get(empreendimento)
+            if matrix is not None:
+                matrix.drop_version(version_name)
+
+    def _columns(self, empreendimento, labels, live):
+        matrix = self._sync(empreendimento)
+        with self._lock:
+            unknown = [label for label in labels if label not in matrix.versions and label not in (live or {})]
+            if unknown:
+                return None
+            return matrix.columns(labels, live)
+
+    @timed("comparacao.compare")
+    def compare(self, empreendimento, version_a, version_b, live=None):
+        """Par A × B para as tarefas presentes em qualquer uma das versões; None se alguma versão não existir.
+
+        Situacao indica se a tarefa está nas duas versões ('Mantida'), só em
+        B ('Adicionada') ou só em A ('Removida'); os desvios ficam nulos nas
+        duas últimas.
+        """
+        columns = self._columns(empreendimento, [version_a, version_b], live)
+        if columns is None:
+            return None
+        task_ids, inicio, fim = columns
+        present = (inicio != EPOCH_DAY_NULL) | (fim != EPOCH_DAY_NULL)
+        in_any = present.any(axis=1)
+        task_ids, inicio, fim, present = task_ids[in_any], inicio[in_any], fim[in_any], present[in_any]
+        duracao_a = _day_deltas(fim[:, 0], inicio[:, 0])
+        duracao_b = _day_deltas(fim[:, 1], inicio[:, 1])
+        return pd.DataFrame({
+            'ID_Tarefa': task_ids,
+            'Situacao': np.select([present.all(axis=1), present[:, 1]], ['Mantida', 'Adicionada'], 'Removida'),
+            'Inicio_A': _epoch_days_to_datetime(inicio[:, 0]),
+            'Fim_A': _epoch_days_to_datetime(fim[:, 0]),
+            'Inicio_B': _epoch_days_to_datetime(inicio[:, 1]),
+            'Fim_B': _epoch_days_to_datetime(fim[:, 1]),
+            'Duracao_A': duracao_a,
+            'Duracao_B': duracao_b,
+            'Diferenca_Duracao': duracao_b - duracao_a,
+            'Desvio_Inicio': _day_deltas(inicio[:, 1], inicio[:, 0]),
+            'Desvio_Fim': _day_deltas(fim[:, 1], fim[:, 0])
+        })
+
+    @timed("comparacao.drift")
+    def drift(self, empreendimento, versions, live=None):
+        """Desvios de início/fim e de duração de cada versão em relação à primeira.
+
+        Uma linha por tarefa da versão de referência; os desvios ficam nulos
+        nas versões em que a tarefa não existe. None se alguma versão não existir.
+        """
+        columns = self._columns(empreendimento, versions, live)
+        if columns is None:
+            return None
+        task_ids, inicio, fim = columns
+        in_reference = (inicio[:, 0] != EPOCH_DAY_NULL) | (fim[:, 0] != EPOCH_DAY_NULL)
+        task_ids, inicio, fim = task_ids[in_reference], inicio[in_reference], fim[in_reference]
+        duracao = [_day_deltas(fim[:, i], inicio[:, i]) for i in range(len(versions))]
+        result = {'ID_Tarefa': task_ids}
+        for i, version_name in enumerate(versions[1:], start=1):
+            result[f'Desvio_Inicio {version_name}'] = _day_deltas(inicio[:, i], inicio[:, 0])
+            result[f'Desvio_Fim {version_name}'] = _day_deltas(fim[:, i], fim[:, 0])
+            result[f'Diferenca_Duracao {version_name}'] = duracao[i] - duracao[0]
+        return pd.DataFrame(result)
+
+    @timed("comparacao.task_history")
+    def task_history(self, empreendimento, task_id, p0=None):
+        """Datas de uma tarefa em todas as versões gravadas, em ordem cronológica.
+
+        Uma busca binária nas linhas da matriz (ordenadas por ID_Tarefa), sem
+        ler payloads. p0 = (início, fim) entra como primeira linha. Versões sem
+        a tarefa ficam de fora; os desvios são contra a linha anterior e contra
+        a primeira. None se a tarefa não estiver em nenhuma versão nem no p0.
+        """
+        matrix = self._sync(empreendimento)
+        with self._lock:
+            row = np.searchsorted(matrix.task_ids, task_id)
+            if row < len(matrix.task_ids) and matrix.task_ids[row] == task_id:
+                versions = list(matrix.versions)
+                inicio, fim = matrix.inicio[row].copy(), matrix.fim[row].copy()
+            else:
+                versions = []
+                inicio = fim = np.empty(0, dtype=np.int32)
+        
+        order = sorted(range(len(versions)), key=lambda i: _version_sort_key(versions[i]))
+        present = [i for i in order if inicio[i] != EPOCH_DAY_NULL or fim[i] != EPOCH_DAY_NULL]
+        labels = [versions[i] for i in present]
+        numbers = [_version_number(versions[i]) for i in present]
+        inicio, fim = inicio[present], fim[present]
+        if p0 is not None:
+            labels.insert(0, P0_VERSION_LABEL)
+            numbers.insert(0, 0)
+            inicio = np.concatenate([_epoch_days(pd.Series([p0[0]], dtype='datetime64[ns]')), inicio])
+            fim = np.concatenate([_epoch_days(pd.Series([p0[1]], dtype='datetime64[ns]')), fim])
+        if not labels:
+            return None
+        
+        previous = np.arange(len(labels)) - 1
+        previous[0] = 0
+        first = np.zeros(len(labels), dtype=np.intp)
+        return pd.DataFrame({
+            'Versao': labels,
+            'Numero_Versao': numbers,
+            'Inicio': _epoch_days_to_datetime(inicio),
+            'Fim': _epoch_days_to_datetime(fim),
+            'Desvio_Inicio': _day_deltas(inicio, inicio[previous]),
+            'Desvio_Fim': _day_deltas(fim, fim[previous]),
+            'Desvio_Fim_Acumulado': _day_deltas(fim, fim[first])
+        })
+
+@st.cache_resource(show_spinner=False)
+def _shared_comparison_engine():
+    return ComparisonEngine()
+
+def get_comparison_engine():
+    """Motor de comparação: compartilhado no modo banco; por sessão no modo mock, como as próprias versões"""
+    if not USE_MOCK_DB:
+        return _shared_comparison_engine()
+    if 'comparison_engine' not in st.session_state:
+        st.session_state.comparison_engine = ComparisonEngine()
+    return st.session_state.comparison_engine
+
+# --- Análise de Desvios do Portfólio ---
+# Agregados por (empreendimento, versão) para todos os empreendimentos. O
+# desvio de uma tarefa é medido contra a versão imediatamente anterior do
+# mesmo empreendimento (e, no acumulado, contra a primeira versão em que a
+# tarefa aparece). Todas as versões de todos os empreendimentos são
+# processadas numa única passada vetorizada sobre arrays concatenados.
+
+PORTFOLIO_STATS_COLUMNS = [
+    'Empreendimento', 'Versao', 'Numero_Versao', 'Tarefas', 'Tarefas_Comparadas',
+    'Desvio_Inicio_Total', 'Desvio_Fim_Total', 'Desvio_Fim_Medio',
+    'Tarefas_Atrasadas', 'Tarefas_Adiantadas', 'Desvio_Acumulado_Medio'
+]
+
+def _version_sort_key(version_name):
+    """Ordem cronológica das versões P{n} de um empreendimento"""
+    return (_version_number(version_name) or 0, version_name)
+
+def _slippage_stats(projects):
+    """Agregados de desvio de {empreendimento: [(versão, DataFrame), ...]} em ordem cronológica"""
+    labels, frames, lengths = [], [], []
+    n_ranks = max((len(versions) for versions in projects.values()), default=0)
+    for emp_code, (empreendimento, versions) in enumerate(projects.items()):
+        for rank, (version_name, df_version) in enumerate(versions):
+            labels.append((empreendimento, version_name, emp_code * n_ranks + rank))
+            frames.append(df_version)
+            lengths.append(len(df_version))
+    if not labels:
+        return pd.DataFrame(columns=PORTFOLIO_STATS_COLUMNS)
+    # Uma única concatenação e conversão de colunas para o portfólio inteiro
+    df_all = pd.concat(frames, ignore_index=True)
+    label_keys = np.array([key for _, _, key in labels])
+    keys = np.repeat(label_keys, lengths)
+    emp_codes, ranks = keys // n_ranks, keys % n_ranks
+    task_ids = _task_ids_int32(df_all['ID_Tarefa'])
+    inicio, fim = _epoch_days(df_all['Inicio']), _epoch_days(df_all['Fim'])
+    
+    # Ordena por (empreendimento, tarefa, versão): a linha anterior de cada
+    # tarefa é a mesma tarefa na versão anterior, se ela existir lá
+    order = np.lexsort((ranks, task_ids, emp_codes))
+    emp_codes, ranks, task_ids = emp_codes[order], ranks[order], task_ids[order]
+    inicio, fim = inicio[order].astype(np.int64), fim[order].astype(np.int64)
+    n = len(order)
+    positions = np.arange(n)
+    new_task = np.ones(n, dtype=bool)
+    new_task[1:] = (emp_codes[1:] != emp_codes[:-1]) | (task_ids[1:] != task_ids[:-1])
+    consecutive = np.zeros(n, dtype=bool)
+    consecutive[1:] = ~new_task[1:] & (ranks[1:] == ranks[:-1] + 1)
+    prev = np.maximum(positions - 1, 0)
+    first = np.maximum.accumulate(np.where(new_task, positions, 0))
+    
+    has_inicio, has_fim = inicio != EPOCH_DAY_NULL, fim != EPOCH_DAY_NULL
+    valid_inicio = consecutive & has_inicio & has_inicio[prev]
+    valid_fim = consecutive & has_fim & has_fim[prev]
+    valid_acum = ~new_task & has_fim & has_fim[first]
+    slip_inicio = np.where(valid_inicio, inicio - inicio[prev], 0)
+    slip_fim = np.where(valid_fim, fim - fim[prev], 0)
+    slip_acum = np.where(valid_acum, fim - fim[first], 0)
+    
+    keys = keys[order]
+    size = len(projects) * n_ranks
+    def per_version(weights=None):
+        return np.bincount(keys, weights=weights, minlength=size)
+    
+    tarefas = per_version()[label_keys]
+    comparadas = per_version(valid_fim)[label_keys]
+    desvio_fim = per_version(slip_fim)[label_keys]
+    acumuladas = per_version(valid_acum)[label_keys]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        desvio_fim_medio = np.where(comparadas > 0, desvio_fim / comparadas, np.nan)
+        desvio_acumulado_medio = np.where(acumuladas > 0, per_version(slip_acum)[label_keys] / acumuladas, np.nan)
+    return pd.DataFrame({
+        'Empreendimento': [empreendimento for empreendimento, _, _ in labels],
+        'Versao': [version_name for _, version_name, _ in labels],
+        'Numero_Versao': [_version_number(version_name) for _, version_name, _ in labels],
+        'Tarefas': tarefas.astype(np.int64),
+        'Tarefas_Comparadas': comparadas.astype(np.int64),
+        'Desvio_Inicio_Total': per_version(slip_inicio)[label_keys].astype(np.int64),
+        'Desvio_Fim_Total': desvio_fim.astype(np.int64),
+        'Desvio_Fim_Medio': desvio_fim_medio,
+        'Tarefas_Atrasadas': per_version(slip_fim > 0)[label_keys].astype(np.int64),
+        'Tarefas_Adiantadas': per_version(slip_fim < 0)[label_keys].astype(np.int64),
+        'Desvio_Acumulado_Medio': desvio_acumulado_medio
+    })
+
+def _baseline_version_frames(empreendimento=None):
+    """{empreendimento: [(versão, DataFrame ID_Tarefa/Inicio/Fim)]} em ordem cronológica, lidos em blocos.
+
+    Uma única passada pela exportação (iter_baseline_export_chunks): um
+    empreendimento, ou o portfólio inteiro se None.
+    """
+    parts = {}
+    for chunk in iter_baseline_export_chunks(empreendimento):
+        tasks = chunk[['ID_Tarefa', 'Inicio', 'Fim']]
+        for key, rows in chunk.groupby(['Empreendimento', 'Versao'], sort=False).indices.items():
+            parts.setdefault(key, []).append(tasks.iloc[rows])
+    projects = {}
+    for (project, version_name), frames in parts.items():
+        projects.setdefault(project, []).append((version_name, pd.concat(frames, ignore_index=True)))
+    for versions in projects.values():
+        versions.sort(key=lambda item: _version_sort_key(item[0]))
+    return projects
+
+class PortfolioAnalytics:
+    """Agregados de desvio do portfólio, pré-calculados e memorizados.
+
+    A primeira leitura (e cada expiração do TTL) processa o portfólio inteiro
+    numa única passada, com as tarefas lidas em blocos do banco. Depois,
+    _write_baseline e delete_baseline só marcam o empreendimento alterado,
+    que é relido sozinho na leitura seguinte. Em implantações com vários processos, o TTL limita o tempo que
+    uma escrita de outro processo leva para aparecer.
+
+    A leitura do banco acontece fora do lock dos agregados: enquanto uma
+    sessão recalcula, as demais continuam vendo os agregados anteriores.
+    Uma falha de leitura não é memorizada; a próxima leitura tenta de novo.
+    """
+
+    def __init__(self, ttl):
+        self._ttl = ttl
+        self._projects = None
+        self._built_at = 0.0
+        self._dirty = set()
+        self._stats = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def mark_dirty(self, empreendimento):
+        with self._lock:
+            self._dirty.add(empreendimento)
+            self._stats = None
+
+    def _stale(self):
+        with self._lock:
+            expired = self._projects is None or time.monotonic() - self._built_at > self._ttl
+            return expired or bool(self._dirty)
+
+    @timed("portfolio.refresh")
+    def _refresh(self):
+        with self._lock:
+            full = self._projects is None or time.monotonic() - self._built_at > self._ttl
+            dirty, self._dirty = self._dirty, set()
+        try:
+            if full:
+                projects = _baseline_version_frames()
+            else:
+                projects = {}
+                for empreendimento in dirty:
+                    projects.update(_baseline_version_frames(empreendimento))
+            stats = _slippage_stats(projects)
+        except Error as e:
+            # Nada é memorizado: as marcações voltam e a próxima leitura tenta de novo
+            with self._lock:
+                self._dirty |= dirty
+            st.error(f"Erro ao carregar linhas de base do portfólio: {e}")
+            return
+        updates = {empreendimento: df for empreendimento, df in stats.groupby('Empreendimento', sort=False)}
+        with self._lock:
+            if full:
+                self._projects = updates
+                self._built_at = time.monotonic()
+            else:
+                # Empreendimentos marcados que ficaram sem versões saem dos agregados
+                for empreendimento in dirty:
+                    self._projects.pop(empreendimento, None)
+                self._projects.update(updates)
+            self._stats = None
+
+    def version_stats(self):
+        """Uma linha por (empreendimento, versão). Compartilhado pelo cache: não alterar"""
+        if self._stale():
+            # Sem agregados ainda, espera o cálculo em andamento; senão, quem chega depois usa os anteriores
+            if self._build_lock.acquire(blocking=self._projects is None):
+                try:
+                    self._refresh()
+                finally:
+                    self._build_lock.release()
+        with self._lock:
+            if self._stats is None:
+                frames = list((self._projects or {}).values())
+                if not frames:
+                    return pd.DataFrame(columns=PORTFOLIO_STATS_COLUMNS)
+                self._stats = pd.concat(frames, ignore_index=True)
+            return self._stats
+
+    def trend(self):
+        """Tendência do portfólio por número de versão (P1, P2, ...), somando todos os empreendimentos"""
+        stats = self.version_stats()
+        trend = stats.groupby('Numero_Versao').agg(
+            Empreendimentos=('Empreendimento', 'nunique'),
+            Tarefas=('Tarefas', 'sum'),
+            Tarefas_Comparadas=('Tarefas_Comparadas', 'sum'),
+            Desvio_Fim_Total=('Desvio_Fim_Total', 'sum'),
+            Tarefas_Atrasadas=('Tarefas_Atrasadas', 'sum'),
+            Tarefas_Adiantadas=('Tarefas_Adiantadas', 'sum'),
+            Desvio_Acumulado_Medio=('Desvio_Acumulado_Medio', 'mean')
+        )
+        trend['Desvio_Fim_Medio'] = trend['Desvio_Fim_Total'] / trend['Tarefas_Comparadas'].where(trend['Tarefas_Comparadas'] > 0)
+        return trend.reset_index()
+
+    def projects(self):
+        """Última versão de cada empreendimento, do maior para o menor desvio acumulado"""
+        stats = self.version_stats()
+        latest = stats.sort_values('Numero_Versao').groupby('Empreendimento', sort=False).tail(1)
+        return latest.sort_values('Desvio_Acumulado_Medio', ascending=False, na_position='last', ignore_index=True)
+
+@st.cache_resource(show_spinner=False)
+def _shared_portfolio_analytics():
+    return PortfolioAnalytics(CATALOG_CACHE_TTL)
+
+def get_portfolio_analytics():
+    """Análise do portfólio: compartilhada no modo banco; por sessão no modo mock"""
+    if not USE_MOCK_DB:
+        return _shared_portfolio_analytics()
+    if 'portfolio_analytics' not in st.session_state:
+        st.session_state.portfolio_analytics = PortfolioAnalytics(CATALOG_CACHE_TTL)
+    return st.session_state.portfolio_analytics
+
+# --- Fonte de Dados dos Projetos ---
+# As tarefas vêm de uma fonte configurável (aws_db não é necessário para
+# CSV/Parquet): exemplo em memória, tabela MySQL, CSV ou Parquet. As fontes
+# leem em blocos e filtram por empreendimento na própria leitura; os
+# DataFrames por empreendimento ficam num cache único do processo.
+
+def create_mock_dataframe():
+    data = {
+        'ID_Tarefa': [1, 2, 3, 4, 5, 6],
+        'Empreendimento': ['Projeto A', 'Projeto A', 'Projeto B', 'Projeto B', 'Projeto A', 'Projeto B'],
+        'Tarefa': ['Fase 1', 'Fase 2', 'Design', 'Implementação', 'Teste', 'Deploy'],
+        'Real_Inicio': [pd.to_datetime('2025-10-01'), pd.to_datetime('2025-10-15'), pd.to_datetime('2025-11-01'), pd.to_datetime('2025-11-10'), pd.to_datetime('2025-10-26'), pd.to_datetime('2025-11-21')],
+        'Real_Fim': [pd.to_datetime('2025-10-10'), pd.to_datetime('2025-10-25'), pd.to_datetime('2025-11-05'), pd.to_datetime('2025-11-20'), pd.to_datetime('2025-11-05'), pd.to_datetime('2025-11-25')],
+        'P0_Previsto_Inicio': [pd.to_datetime('2025-09-25'), pd.to_datetime('2025-10-12'), pd.to_datetime('2025-10-28'), pd.to_datetime('2025-11-08'), pd.to_datetime('2025-10-20'), pd.to_datetime('2025-11-18')],
+        'P0_Previsto_Fim': [pd.to_datetime('2025-10-05'), pd.to_datetime('2025-10-20'), pd.to_datetime('2025-11-03'), pd.to_datetime('2025-11-15'), pd.to_datetime('2025-10-30'), pd.to_datetime('2025-11-22')],
+    }
+    return pd.DataFrame(data)
+
+TASK_DATE_COLUMNS = ['Real_Inicio', 'Real_Fim', 'P0_Previsto_Inicio', 'P0_Previsto_Fim']
+TASK_COLUMNS = ['ID_Tarefa', 'Empreendimento', 'Tarefa'] + TASK_DATE_COLUMNS
+
+def _normalize_task_chunk(chunk):
+    """Tipos canônicos de um bloco de tarefas, qualquer que seja a fonte"""
+    for column in TASK_DATE_COLUMNS:
+        if not pd.api.types.is_datetime64_any_dtype(chunk[column]):
+            chunk[column] = pd.to_datetime(chunk[column])
+    if chunk['ID_Tarefa'].dtype != np.int32:
+        chunk['ID_Tarefa'] = _task_ids_int32(chunk['ID_Tarefa'])
+    return chunk
+
+def _compact_task_frame(df):
+    """Esquema compacto das tarefas: nomes categóricos, ID_Tarefa int32 e uma única coluna por data.
+
+    O planejamento vigente é P0_Previsto_*; não há mais as cópias Previsto_*.
+    """
+    return pd.DataFrame({
+        'ID_Tarefa': _task_ids_int32(df['ID_Tarefa']),
+        'Empreendimento': df['Empreendimento'].astype('category'),
+        'Tarefa': df['Tarefa'].astype('category'),
+        **{column: df[column].to_numpy() for column in TASK_DATE_COLUMNS}
+    })
+
+def _empty_task_frame():
+    return _compact_task_frame(_normalize_task_chunk(pd.DataFrame(columns=TASK_COLUMNS)))
+
+class ProjectDataSource(ABC):
+    """Interface das fontes de dados de tarefas.
+
+    iter_chunks produz blocos de até `chunksize` linhas, já filtrados pelo
+    empreendimento quando informado; list_empreendimentos lê só a coluna
+    Empreendimento. Fontes com writable = True aceitam write_planned.
+    """
+
+    writable = False
+
+    def __init__(self, chunksize):
+        self.chunksize = chunksize
+
+    @abstractmethod
+    def list_empreendimentos(self):
+        """Empreendimentos disponíveis, em ordem"""
+
+    @abstractmethod
+    def iter_chunks(self, empreendimento=None):
+        """Blocos de tarefas (DataFrames com TASK_COLUMNS) de um empreendimento ou de todos"""
+
+    def load(self, empreendimento=None):
+        """Todas as tarefas (do empreendimento) no esquema compacto"""
+        chunks = [_normalize_task_chunk(chunk) for chunk in self.iter_chunks(empreendimento)]
+        if not chunks:
+            return _empty_task_frame()
+        return _compact_task_frame(pd.concat(chunks, ignore_index=True))
+
+    def write_planned(self, empreendimento, df_planned):
+        """Grava P0_Previsto_Inicio/Fim das tarefas de df_planned (ID_Tarefa/Inicio/Fim) na fonte"""
+        raise NotImplementedError(f"A fonte de dados ({type(self).__name__}) é somente leitura")
+
+class MockDataSource(ProjectDataSource):
+    """Dados de exemplo em memória, indexados por empreendimento na criação"""
+
+    def __init__(self, chunksize):
+        super().__init__(chunksize)
+        df = _compact_task_frame(_normalize_task_chunk(create_mock_dataframe()))
+        self._projects = {
+            empreendimento: df.iloc[positions].reset_index(drop=True)
+            for empreendimento, positions in df.groupby('Empreendimento', observed=True).indices.items()
+        }
+
+    def list_empreendimentos(self):
+        return sorted(self._projects)
+
+    def iter_chunks(self, empreendimento=None):
+        if empreendimento is None:
+            frames = list(self._projects.values())
+        else:
+            frames = [self._projects[empreendimento]] if empreendimento in self._projects else []
+        for df in frames:
+            for start in range(0, len(df), self.chunksize):
+                yield df.iloc[start:start + self.chunksize]
+
+class MySQLDataSource(ProjectDataSource):
+    """Tabela de tarefas no MySQL (colunas com os nomes do DataFrame); filtro e DISTINCT executados no banco"""
+
+    writable = True
+
+    def __init__(self, chunksize, table):
+        super().__init__(chunksize)
+        self.table = table.replace('`', '')
+
+    def list_empreendimentos(self):
+        conn = get_db_connection()
+        if not conn:
+            raise Error("banco de dados indisponível")
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT DISTINCT Empreendimento FROM `{self.table}` ORDER BY Empreendimento")
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            release_db_connection(conn, cursor)
+
+    def iter_chunks(self, empreendimento=None):
+        conn = get_db_connection()
+        if not conn:
+            raise Error("banco de dados indisponível")
+        cursor = None
+        try:
+            # Cursor sem buffer: as linhas chegam do servidor aos blocos, sem materializar o resultado inteiro
+            cursor = conn.cursor(buffered=False)
+            query = f"SELECT {', '.join(TASK_COLUMNS)} FROM `{self.table}`"
+            params = ()
+            if empreendimento is not None:
+                query += " WHERE Empreendimento = %s"
+                params = (empreendimento,)
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(self.chunksize)
+                if not rows:
+                    break
+                yield pd.DataFrame(rows, columns=TASK_COLUMNS)
+        finally:
+            # Leitura interrompida no meio: descarta o restante antes de devolver a conexão
+            try:
+                if conn.unread_result:
+                    conn.consume_results()
+            except Error:
+                pass
+            release_db_connection(conn, cursor)
+
+    def write_planned(self, empreendimento, df_planned):
+        conn = get_db_connection()
+        if not conn:
+            raise Error("banco de dados indisponível")
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            # As datas vão para uma tabela temporária em INSERTs multi-linha e a tabela
+            # de tarefas é atualizada num único UPDATE com JOIN, na mesma transação
+            cursor.execute("""
+            CREATE TEMPORARY TABLE planned_restore (
+                ID_Tarefa INT PRIMARY KEY, Inicio DATE NULL, Fim DATE NULL
+            )
+            """)
+            rows = _frame_rows(df_planned)
+            for start in range(0, len(rows), BASELINE_INSERT_BATCH):
+                cursor.executemany(
+                    "INSERT INTO planned_restore (ID_Tarefa, Inicio, Fim) VALUES (%s, %s, %s)",
+                    rows[start:start + BASELINE_INSERT_BATCH]
+                )
+            cursor.execute(f"""
+            UPDATE `{self.table}` t JOIN planned_restore r ON r.ID_Tarefa = t.ID_Tarefa
+            SET t.P0_Previsto_Inicio = r.Inicio, t.P0_Previsto_Fim = r.Fim
+            WHERE t.Empreendimento = %s
+            """, (empreendimento,))
+            conn.commit()
+        except Error:
+            if conn.is_connected():
+                conn.rollback()
+            raise
+        finally:
+            try:
+                if cursor is not None:
+                    cursor.execute("DROP TEMPORARY TABLE IF EXISTS planned_restore")
+            except Error:
+                pass
+            release_db_connection(conn, cursor)
+
+class CSVDataSource(ProjectDataSource):
+    """Arquivo CSV lido em blocos; o filtro por empreendimento é aplicado a cada bloco durante a leitura"""
+
+    def __init__(self, chunksize, path):
+        super().__init__(chunksize)
+        self.path = path
+
+    def list_empreendimentos(self):
+        names = set()
+        for chunk in pd.read_csv(self.path, usecols=['Empreendimento'], chunksize=self.chunksize):
+            names.update(chunk['Empreendimento'].unique().tolist())
+        return sorted(names)
+
+    def iter_chunks(self, empreendimento=None):
+        for chunk in pd.read_csv(self.path, usecols=TASK_COLUMNS, parse_dates=TASK_DATE_COLUMNS, chunksize=self.chunksize):
+            if empreendimento is not None:
+                chunk = chunk[chunk['Empreendimento'] == empreendimento]
+            if len(chunk):
+                yield chunk
+
+class ParquetDataSource(ProjectDataSource):
+    """Arquivo ou diretório Parquet (requer pyarrow).
+
+    O filtro por empreendimento vai para o leitor do pyarrow, que pula row
+    groups e partições (hive) que não podem conter o empreendimento.
+    """
+
+    def __init__(self, chunksize, path):
+        super().__init__(chunksize)
+        self.path = path
+
+    def _dataset(self):
+        import pyarrow.dataset as ds
+        return ds.dataset(self.path, format='parquet', partitioning='hive')
+
+    def list_empreendimentos(self):
+        import pyarrow.compute as pc
+        column = self._dataset().to_table(columns=['Empreendimento'])['Empreendimento']
+        return sorted(str(name) for name in pc.unique(column).to_pylist())
+
+    def iter_chunks(self, empreendimento=None):
+        import pyarrow.dataset as ds
+        predicate = ds.field('Empreendimento') == empreendimento if empreendimento is not None else None
+        for batch in self._dataset().to_batches(columns=TASK_COLUMNS, filter=predicate, batch_size=self.chunksize):
+            if batch.num_rows:
+                yield batch.to_pandas()
+
+def create_project_data_source():
+    """Fonte configurada em project_data.source: 'mock' (padrão), 'mysql', 'csv' ou 'parquet'"""
+    if PROJECT_DATA_SOURCE == 'mysql':
+        return MySQLDataSource(PROJECT_DATA_CHUNKSIZE, PROJECT_DATA_TABLE)
+    if PROJECT_DATA_SOURCE == 'csv':
+        return CSVDataSource(PROJECT_DATA_CHUNKSIZE, PROJECT_DATA_PATH)
+    if PROJECT_DATA_SOURCE == 'parquet':
+        return ParquetDataSource(PROJECT_DATA_CHUNKSIZE, PROJECT_DATA_PATH)
+    return MockDataSource(PROJECT_DATA_CHUNKSIZE)
+
+class ProjectDataCache:
+    """Cache compartilhado (TTL + LRU) das tarefas, um DataFrame por empreendimento.
+
+    Todas as sessões leem os mesmos DataFrames, que portanto não devem ser
+    alterados pelo chamador. O TTL limita o tempo que uma mudança na fonte
+    leva para aparecer.
+    """
+
+    def __init__(self, source, maxsize, ttl):
+        self.source = source
+        self._projects = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._names = TTLCache(maxsize=1, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def empreendimentos(self):
+        with self._lock:
+            names = self._names.get('all')
+        if names is None:
+            names = self.source.list_empreendimentos()
+            with self._lock:
+                self._names['all'] = names
+        return names
+
+    def project(self, empreendimento):
+        with self._lock:
+            df = self._projects.get(empreendimento)
+        if df is None:
+            # Leitura fora do lock: sessões com empreendimentos diferentes não se bloqueiam
+            df = self.source.load(empreendimento)
+            with self._lock:
+                self._projects[empreendimento] = df
+        return df
+
+    def invalidate(self, empreendimento):
+        with self._lock:
+            self._projects.pop(empreendimento, None)
+
+@st.cache_resource(show_spinner=False)
+def get_project_data_cache():
+    return ProjectDataCache(create_project_data_source(), PROJECT_CACHE_MAXSIZE, CATALOG_CACHE_TTL)
+
+@timed("projeto.list")
+def list_empreendimentos():
+    """Empreendimentos da fonte de dados (consulta DISTINCT, memorizada)"""
+    try:
+        return get_project_data_cache().empreendimentos()
+    except (Error, OSError, ValueError, KeyError) as e:
+        st.error(f"Erro ao carregar empreendimentos: {e}")
+        return []
+
+@timed("projeto.load_tasks")
+def load_project_tasks(empreendimento):
+    """Tarefas de um empreendimento, com o planejamento ajustado pelas linhas de base tiradas nesta sessão.
+
+    Sem ajustes, devolve o DataFrame compartilhado do cache (não alterar).
+    """
+    try:
+        df = get_project_data_cache().project(empreendimento)
+    except (Error, OSError, ValueError, KeyError) as e:
+        st.error(f"Erro ao carregar tarefas do empreendimento: {e}")
+        return _empty_task_frame()
+    planned = st.session_state.planned_overrides.get(empreendimento)
+    if planned is None:
+        return df
+    # O DataFrame ajustado é montado uma vez por (dados do cache, linha de base) e reaproveitado nas reexecuções
+    cached = st.session_state.planned_frames.get(empreendimento)
+    if cached is not None and cached[0] is df and cached[1] is planned:
+        return cached[2]
+    # Só as duas colunas de planejamento são novas; as demais são compartilhadas com o cache
+    positions = pd.Index(planned['ID_Tarefa']).get_indexer(df['ID_Tarefa'])
+    rows = positions >= 0
+    inicio = df['P0_Previsto_Inicio'].to_numpy().copy()
+    fim = df['P0_Previsto_Fim'].to_numpy().copy()
+    inicio[rows] = planned['Inicio'].to_numpy()[positions[rows]]
+    fim[rows] = planned['Fim'].to_numpy()[positions[rows]]
+    columns = {column: df[column] for column in df.columns}
+    columns.update({'P0_Previsto_Inicio': inicio, 'P0_Previsto_Fim': fim})
+    df_planned = pd.DataFrame(columns, copy=False)
+    st.session_state.planned_frames[empreendimento] = (df, planned, df_planned)
+    return df_planned
+
+# --- Lógica de Linha de Base ---
+
+@timed("baseline.take")
+def take_baseline(empreendimento):
+    df = load_project_tasks(empreendimento)
+    real_dates = df[['Real_Inicio', 'Real_Fim']].to_numpy()
+    
+    next_n = allocate_version_numbers([empreendimento])[empreendimento]
+    
+    version_prefix = f"P{next_n}"
+    current_date_str = datetime.now().strftime("%d/%m/%Y")
+    version_name = f"{version_prefix}-({current_date_str})"
+    
+    # Linha de base colunar (sem um dict por tarefa)
+    baseline_data = pd.DataFrame({
+        'ID_Tarefa': df['ID_Tarefa'].to_numpy(),
+        'Inicio': real_dates[:, 0],
+        'Fim': real_dates[:, 1]
+    })
+
+    success = save_baseline(empreendimento, version_name, baseline_data, current_date_str)
+    
+    if success:
+        # ✅ O planejamento (P0_Previsto_*) da sessão passa a refletir os valores REAIS atuais,
+        # sem copiar os dados compartilhados dos demais empreendimentos
+        st.session_state.planned_overrides[empreendimento] = baseline_data
+        # A versão nasce com sync_status 'pending' (aguardando envio para AWS)
+        return version_name
+    else:
+        raise Exception("Falha ao salvar linha de base no banco de dados")
+
+def _real_dates_by_project(empreendimentos):
+    """Datas reais das tarefas de vários empreendimentos, lidas pelo cache compartilhado de tarefas.
+
+    Cada empreendimento vem do ProjectDataCache (consulta filtrada só em caso
+    de falta), sem varrer a fonte inteira. Os sem tarefas ficam de fora.
+    """
+    frames = {}
+    for empreendimento in empreendimentos:
+        df = load_project_tasks(empreendimento)
+        if df.empty:
+            continue
+        frames[empreendimento] = pd.DataFrame({
+            'ID_Tarefa': df['ID_Tarefa'].to_numpy(),
+            'Inicio': df['Real_Inicio'].to_numpy(),
+            'Fim': df['Real_Fim'].to_numpy(),
+        })
+    return frames
+
+@timed("baseline.take_bulk")
+def take_baselines(empreendimentos, progress=None):
+    """Linha de base de vários empreendimentos de uma vez (ex.: fechamento do mês).
+
+    Tarefas lidas pelo cache compartilhado, uma reserva atômica dos próximos
+    números de versão e uma única transação para gravar tudo. Empreendimentos
+    sem tarefas na fonte são ignorados (não recebem versão vazia). Retorna
+    {empreendimento: version_name} só dos empreendimentos gravados.
+    """
+    empreendimentos = list(empreendimentos)
+    progress = progress or (lambda fraction, text: None)
+    progress(0.0, "Lendo tarefas dos empreendimentos...")
+    frames = _real_dates_by_project(empreendimentos)
+    skipped = [
+        empreendimento for empreendimento in empreendimentos
+        if frames.get(empreendimento) is None or frames[empreendimento].empty
+    ]
+    empreendimentos = [empreendimento for empreendimento in empreendimentos if empreendimento not in skipped]
+    next_numbers = allocate_version_numbers(empreendimentos) if empreendimentos else {}
+    
+    current_date_str = datetime.now().strftime("%d/%m/%Y")
+    versions = []
+    for empreendimento in empreendimentos:
+        version_name = f"P{next_numbers[empreendimento]}-({current_date_str})"
+        versions.append((empreendimento, version_name, frames[empreendimento], current_date_str))
+    
+    # A leitura responde por ~10% do progresso; a gravação, pelo restante
+    success = save_baselines_bulk(versions, progress=lambda fraction, text: progress(0.1 + 0.9 * fraction, text))
+    if not success:
+        raise Exception("Falha ao salvar linhas de base no banco de dados")
+    for empreendimento, version_name, baseline_data, _ in versions:
+        st.session_state.planned_overrides[empreendimento] = baseline_data
+    summary = f"{len(versions)} linha(s) de base gravada(s)"
+    if skipped:
+        summary += f"; sem tarefas, ignorado(s): {', '.join(skipped)}"
+    progress(1.0, summary)
+    return {empreendimento: version_name for empreendimento, version_name, _, _ in versions}
+
+# --- Restauração e Linha do Tempo ---
+
+def _version_created_on(info):
+    """Data de criação ('dd/mm/aaaa') de uma versão do catálogo; None se não reconhecida"""
+    try:
+        return datetime.strptime(str(info["date"]), "%d/%m/%Y").date()
+    except ValueError:
+        return None
+
+@timed("baseline.restore")
+def restore_baseline(empreendimento, version_name):
+    """Volta o planejamento (P0_Previsto_*) para as datas de uma versão gravada.
+
+    Só o payload dessa versão é carregado; load_project_tasks aplica as
+    datas alinhadas por ID_Tarefa. Tarefas fora da versão mantêm o P0. Se a
+    fonte de dados aceita escrita, as datas são gravadas nela (e valem para
+    todas as sessões); senão, só para esta sessão. Retorna True se gravou na fonte.
+    """
+    df_version = load_baseline_payload(empreendimento, version_name)
+    if df_version is None:
+        raise Exception(f"Linha de base {version_name} não encontrada")
+    cache = get_project_data_cache()
+    persisted = cache.source.writable
+    if persisted:
+        cache.source.write_planned(empreendimento, df_version)
+        cache.invalidate(empreendimento)
+    st.session_state.planned_overrides[empreendimento] = df_version
+    return persisted
+
+@timed("baseline.as_of")
+def planned_as_of(empreendimento, as_of):
+    """Planejamento de cada tarefa como estava na data as_of (ID_Tarefa/Tarefa/Inicio/Fim/Versao).
+
+    Cada tarefa recebe as datas da versão mais recente criada até as_of que
+    a contém. As versões são lidas da mais nova para a mais antiga e a busca
+    para quando todas as tarefas estão resolvidas, então versões posteriores
+    à data (ou já cobertas por uma mais nova) não são carregadas. Tarefas sem
+    versão até a data ficam com o P0 da fonte de dados.
+    """
+    df = get_project_data_cache().project(empreendimento)
+    versions = list_baseline_versions(empreendimento)
+    candidates = sorted(
+        (name for name, info in versions.items()
+         if (created := _version_created_on(info)) is not None and created <= as_of),
+        key=_version_sort_key, reverse=True
+    )
+    
+    task_index = pd.Index(df['ID_Tarefa'])
+    inicio = df['P0_Previsto_Inicio'].to_numpy().copy()
+    fim = df['P0_Previsto_Fim'].to_numpy().copy()
+    # Código da versão de origem de cada tarefa (0 = P0 da fonte)
+    origin = np.zeros(len(df), dtype=np.int32)
+    pending = np.ones(len(df), dtype=bool)
+    resolved = []
+    for version_name in candidates:
+        if not pending.any():
+            break
+        df_version = load_baseline_payload(empreendimento, version_name)
+        if df_version is None:
+            continue
+        positions = task_index.get_indexer(df_version['ID_Tarefa'])
+        take = positions >= 0
+        take[take] = pending[positions[take]]
+        rows = positions[take]
+        inicio[rows] = df_version['Inicio'].to_numpy()[take]
+        fim[rows] = df_version['Fim'].to_numpy()[take]
+        resolved.append(version_name)
+        origin[rows] = len(resolved)
+        pending[rows] = False
+    
+    return pd.DataFrame({
+        'ID_Tarefa': df['ID_Tarefa'],
+        'Tarefa': df['Tarefa'],
+        'Inicio': inicio,
+        'Fim': fim,
+        'Versao': pd.Categorical.from_codes(origin, categories=[P0_VERSION_LABEL] + resolved)
+    })
+
+# --- Exportação e Importação de Linhas de Base ---
+# Formato longo, uma linha por tarefa de cada versão. A exportação lê o banco em blocos
+# (as versões completas em baseline_tasks numa única consulta sem buffer; as demais uma a
+# uma pelo payload) e grava cada bloco assim que chega; a importação lê o arquivo em blocos
+# e grava em lotes de versões. A memória fica limitada ao bloco e à versão em montagem.
 
-# --- Funções de Banco de Dados ---
+BASELINE_EXPORT_COLUMNS = ['Empreendimento', 'Versao', 'Numero_Versao', 'Data_Criacao', 'ID_Tarefa', 'Inicio', 'Fim']
+BASELINE_EXPORT_FORMATS = {
+    'parquet': ('Parquet', 'application/vnd.apache.parquet'),
+    'csv': ('CSV', 'text/csv'),
+    'xlsx': ('Excel', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+# Linhas de dados por planilha no XLSX (limite do Excel menos o cabeçalho)
+XLSX_MAX_DATA_ROWS = 1048575
 
-def get_db_connection():
-    try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        return conn
-    except Error as e:
-        return None
+def _export_frame(empreendimento, version_name, created_date, df_version):
+    """Bloco no formato de exportação para as tarefas de uma versão"""
+    n_rows = len(df_version)
+    return pd.DataFrame({
+        'Empreendimento': np.full(n_rows, empreendimento, dtype=object),
+        'Versao': np.full(n_rows, version_name, dtype=object),
+        'Numero_Versao': pd.array([_version_number(version_name)] * n_rows, dtype='Int32'),
+        'Data_Criacao': np.full(n_rows, created_date, dtype=object),
+        'ID_Tarefa': _task_ids_int32(df_version['ID_Tarefa']),
+        'Inicio': pd.to_datetime(df_version['Inicio']).to_numpy(),
+        'Fim': pd.to_datetime(df_version['Fim']).to_numpy()
+    })
 
-def create_baselines_table():
+def _iter_stored_task_chunks(empreendimento, chunk_rows):
+    """Tarefas das versões completas gravadas em baseline_tasks, lidas do servidor em blocos"""
     conn = get_db_connection()
-    if conn:
+    if not conn:
+        raise Error("banco de dados indisponível")
+    cursor = None
+    try:
+        cursor = conn.cursor(buffered=False)
+        query = """
+        SELECT b.empreendimento, b.version_name, b.version_number, b.created_date,
+            t.id_tarefa, t.previsto_inicio, t.previsto_fim
+        FROM baselines b JOIN baseline_tasks t ON t.baseline_id = b.id
+        WHERE b.storage_format = 'tasks' AND b.parent_id IS NULL
+        """
+        params = ()
+        if empreendimento is not None:
+            query += " AND b.empreendimento = %s"
+            params = (empreendimento,)
+        cursor.execute(query + " ORDER BY b.id, t.id_tarefa", params)
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            chunk = pd.DataFrame(rows, columns=BASELINE_EXPORT_COLUMNS)
+            chunk['Numero_Versao'] = chunk['Numero_Versao'].astype('Int32')
+            chunk['ID_Tarefa'] = _task_ids_int32(chunk['ID_Tarefa'])
+            chunk['Inicio'] = pd.to_datetime(chunk['Inicio'])
+            chunk['Fim'] = pd.to_datetime(chunk['Fim'])
+            yield chunk
+    finally:
         try:
-            cursor = conn.cursor()
-            create_table_query = """
-            CREATE TABLE IF NOT EXISTS baselines (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                empreendimento VARCHAR(255) NOT NULL,
-                version_name VARCHAR(255) NOT NULL,
-                baseline_data JSON NOT NULL,
-                created_date VARCHAR(50) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE KEY unique_baseline (empreendimento, version_name)
-            )
-            """
-            cursor.execute(create_table_query)
-            conn.commit()
-        except Error as e:
-            st.error(f"Erro ao criar tabela: {e}")
-        finally:
-            if conn.is_connected():
-                cursor.close()
-                conn.close()
-    else:
-        if 'mock_baselines' not in st.session_state:
-            st.session_state.mock_baselines = {}
+            if conn.unread_result:
+                conn.consume_results()
+        except Error:
+            pass
+        release_db_connection(conn, cursor)
 
-def load_baselines():
+def _list_payload_versions(empreendimento):
+    """(empreendimento, version_name, created_date) das versões que não estão como tarefas completas"""
     conn = get_db_connection()
-    if conn:
-        baselines = {}
-        try:
-            cursor = conn.cursor(dictionary=True)
-            query = "SELECT empreendimento, version_name, baseline_data, created_date FROM baselines ORDER BY created_at DESC"
-            cursor.execute(query)
-            results = cursor.fetchall()
-            for row in results:
-                empreendimento = row['empreendimento']
-                version_name = row['version_name']
-                if empreendimento not in baselines:
-                    baselines[empreendimento] = {}
-                baseline_data = json.loads(row['baseline_data'])
-                baselines[empreendimento][version_name] = {
-                    "date": row['created_date'],
-                    "data": baseline_data
-                }
-            return baselines
-        except Error as e:
-            st.error(f"Erro ao carregar linhas de base: {e}")
-            return {}
-        finally:
-            if conn.is_connected():
-                cursor.close()
-                conn.close()
+    if not conn:
+        raise Error("banco de dados indisponível")
+    cursor = None
+    try:
+        cursor = conn.cursor()
+        query = """
+        SELECT empreendimento, version_name, created_date FROM baselines
+        WHERE NOT (storage_format = 'tasks' AND parent_id IS NULL)
+        """
+        params = ()
+        if empreendimento is not None:
+            query += " AND empreendimento = %s"
+            params = (empreendimento,)
+        cursor.execute(query + " ORDER BY id", params)
+        return cursor.fetchall()
+    finally:
+        release_db_connection(conn, cursor)
+
+def iter_baseline_export_chunks(empreendimento=None, chunk_rows=BASELINE_EXPORT_CHUNK_ROWS):
+    """Blocos (BASELINE_EXPORT_COLUMNS) com todas as versões de um empreendimento, ou do portfólio se None.
+
+    As linhas de cada versão saem contíguas. Nenhum bloco passa de chunk_rows linhas.
+    """
+    if not USE_MOCK_DB:
+        yield from _iter_stored_task_chunks(empreendimento, chunk_rows)
+        versions = _list_payload_versions(empreendimento)
     else:
-        return st.session_state.mock_baselines
+        projects = st.session_state.mock_baselines
+        if empreendimento is not None:
+            projects = {empreendimento: projects.get(empreendimento, {})}
+        versions = [
+            (project, version_name, info["date"])
+            for project, project_versions in projects.items() for version_name, info in project_versions.items()
+        ]
+    for project, version_name, created_date in versions:
+        df_version = load_baseline_payload(project, version_name)
+        if df_version is None:
+            continue
+        for start in range(0, len(df_version), chunk_rows):
+            yield _export_frame(project, version_name, created_date, df_version.iloc[start:start + chunk_rows])
 
-def save_baseline(empreendimento, version_name, baseline_data, created_date):
-    conn = get_db_connection()
-    if conn:
+def _export_arrow_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ('Empreendimento', pa.string()), ('Versao', pa.string()), ('Numero_Versao', pa.int32()),
+        ('Data_Criacao', pa.string()), ('ID_Tarefa', pa.int32()), ('Inicio', pa.date32()), ('Fim', pa.date32())
+    ])
+
+def _write_parquet(chunks, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = _export_arrow_schema()
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk, preserve_index=False).cast(schema))
+            yield len(chunk)
+
+def _write_csv(chunks, path):
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    # Escritor do pyarrow: datas como AAAA-MM-DD e nulos vazios, bem mais rápido que DataFrame.to_csv
+    schema = _export_arrow_schema()
+    with pa_csv.CSVWriter(path, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk, preserve_index=False).cast(schema))
+            yield len(chunk)
+
+def _write_xlsx(chunks, path):
+    from openpyxl import Workbook
+    # Modo write-only: as linhas vão direto para o arquivo temporário de cada planilha
+    workbook = Workbook(write_only=True)
+    sheet, sheet_rows, n_sheets = None, XLSX_MAX_DATA_ROWS, 0
+    for chunk in chunks:
+        # Datas sem hora e nulos (NaT/NA) como células vazias
+        rows = chunk.assign(Inicio=chunk['Inicio'].dt.date, Fim=chunk['Fim'].dt.date).astype(object)
+        rows = rows.where(rows.notna(), None)
+        for row in rows.itertuples(index=False, name=None):
+            if sheet_rows >= XLSX_MAX_DATA_ROWS:
+                n_sheets += 1
+                sheet = workbook.create_sheet(f"Linhas de Base {n_sheets}" if n_sheets > 1 else "Linhas de Base")
+                sheet.append(BASELINE_EXPORT_COLUMNS)
+                sheet_rows = 0
+            sheet.append(row)
+            sheet_rows += 1
+        yield len(chunk)
+    if sheet is None:
+        workbook.create_sheet("Linhas de Base").append(BASELINE_EXPORT_COLUMNS)
+    workbook.save(path)
+
+@timed("baseline.export")
+def export_baselines(path, fmt, empreendimento=None, progress=None):
+    """Exporta as versões de um empreendimento (ou do portfólio) para path em 'parquet', 'csv' ou 'xlsx'.
+
+    Retorna o número de linhas (tarefa × versão) gravadas.
+    """
+    writers = {'parquet': _write_parquet, 'csv': _write_csv, 'xlsx': _write_xlsx}
+    if fmt not in writers:
+        raise ValueError(f"Formato de exportação desconhecido: {fmt}")
+    progress = progress or (lambda rows: None)
+    total = 0
+    for n_rows in writers[fmt](iter_baseline_export_chunks(empreendimento), path):
+        total += n_rows
+        progress(total)
+    return total
+
+def _iter_import_chunks(source, fmt, chunk_rows):
+    """Blocos do arquivo a importar (caminho ou arquivo aberto), com as colunas de exportação"""
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_rows, columns=BASELINE_EXPORT_COLUMNS):
+            yield batch.to_pandas()
+    elif fmt == 'csv':
+        yield from pd.read_csv(
+            source, chunksize=chunk_rows, usecols=BASELINE_EXPORT_COLUMNS,
+            dtype={'Empreendimento': str, 'Versao': str, 'Data_Criacao': str}
+        )
+    elif fmt == 'xlsx':
+        from openpyxl import load_workbook
+        workbook = load_workbook(source, read_only=True)
         try:
-            cursor = conn.cursor()
-            baseline_json = json.dumps(baseline_data)
-            insert_query = """
-            INSERT INTO baselines (empreendimento, version_name, baseline_data, created_date)
-            VALUES (%s, %s, %s, %s)
-            ON DUPLICATE KEY UPDATE baseline_data = VALUES(baseline_data), created_date = VALUES(created_date)
-            """
-            cursor.execute(insert_query, (empreendimento, version_name, baseline_json, created_date))
-            conn.commit()
-            return True
-        except Error as e:
-            st.error(f"Erro ao salvar linha de base: {e}")
-            return False
+            for sheet in workbook.worksheets:
+                rows = sheet.iter_rows(values_only=True)
+                header = next(rows, None)
+                if header is None:
+                    continue
+                batch = []
+                for row in rows:
+                    batch.append(row)
+                    if len(batch) >= chunk_rows:
+                        yield pd.DataFrame(batch, columns=header)[BASELINE_EXPORT_COLUMNS]
+                        batch = []
+                if batch:
+                    yield pd.DataFrame(batch, columns=header)[BASELINE_EXPORT_COLUMNS]
         finally:
-            if conn.is_connected():
-                cursor.close()
-                conn.close()
+            workbook.close()
     else:
-        if empreendimento not in st.session_state.mock_baselines:
-            st.session_state.mock_baselines[empreendimento] = {}
-        st.session_state.mock_baselines[empreendimento][version_name] = {
-            "date": created_date,
-            "data": baseline_data
-        }
+        raise ValueError(f"Formato de importação desconhecido: {fmt}")
+
+@timed("baseline.import")
+def import_baselines(source, fmt, progress=None):
+    """Importa versões de um arquivo exportado (caminho ou arquivo aberto).
+
+    As linhas de cada versão devem estar contíguas, como na exportação.
+    Versões já existentes são mantidas e informadas como ignoradas. As
+    versões são gravadas em lotes de até BASELINE_IMPORT_BATCH_ROWS tarefas,
+    cada lote numa transação. Retorna (versões importadas, versões ignoradas).
+    """
+    progress = progress or (lambda rows: None)
+    imported, skipped, finished = [], [], set()
+    batch, batch_rows = [], 0
+    existing = {}
+    current, parts = None, []
+
+    def finish_version():
+        nonlocal batch_rows
+        if current is None:
+            return
+        empreendimento, version_name, created_date = current
+        finished.add((empreendimento, version_name))
+        if empreendimento not in existing:
+            existing[empreendimento] = set(list_baseline_versions(empreendimento))
+        if version_name in existing[empreendimento]:
+            skipped.append((empreendimento, version_name))
+            return
+        df_version = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0].reset_index(drop=True)
+        batch.append((empreendimento, version_name, df_version, created_date))
+        batch_rows += len(df_version)
+
+    def flush():
+        nonlocal batch, batch_rows
+        if batch and not save_baselines_bulk(batch):
+            raise Exception("Falha ao gravar linhas de base importadas no banco de dados")
+        imported.extend((empreendimento, version_name) for empreendimento, version_name, _, _ in batch)
+        batch, batch_rows = [], 0
+
+    total = 0
+    for chunk in _iter_import_chunks(source, fmt, BASELINE_EXPORT_CHUNK_ROWS):
+        if chunk.empty:
+            continue
+        chunk = chunk.reset_index(drop=True)
+        tasks = pd.DataFrame({
+            'ID_Tarefa': _task_ids_int32(chunk['ID_Tarefa']),
+            'Inicio': pd.to_datetime(chunk['Inicio']).astype('datetime64[ns]'),
+            'Fim': pd.to_datetime(chunk['Fim']).astype('datetime64[ns]')
+        })
+        # Fronteiras de versão dentro do bloco, sem percorrer linha a linha
+        keys = chunk['Empreendimento'].astype(str) + '\x00' + chunk['Versao'].astype(str)
+        starts = np.concatenate([[0], np.flatnonzero(keys.to_numpy()[1:] != keys.to_numpy()[:-1]) + 1])
+        ends = np.append(starts[1:], len(chunk))
+        for start, end in zip(starts, ends):
+            key = (str(chunk.at[start, 'Empreendimento']), str(chunk.at[start, 'Versao']))
+            if current is None or key != current[:2]:
+                finish_version()
+                if key in finished:
+                    raise ValueError(f"As linhas da versão {key[1]} de {key[0]} não estão contíguas no arquivo")
+                current, parts = key + (str(chunk.at[start, 'Data_Criacao']),), []
+                if batch_rows >= BASELINE_IMPORT_BATCH_ROWS:
+                    flush()
+            parts.append(tasks.iloc[start:end])
+        total += len(chunk)
+        progress(total)
+    finish_version()
+    flush()
+    return imported, skipped
+
+# --- Função para enviar dados para AWS ---
+
+@timed("aws.upload")
+def _upload_baseline(empreendimento, version_name, payload):
+    """Envia o payload compacto de uma versão para o endpoint configurado"""
+    if AWS_UPLOAD_URL is None:
+        time.sleep(1)  # Simular delay de rede
+        return
+    response = requests.post(
+        AWS_UPLOAD_URL,
+        params={'empreendimento': empreendimento, 'version_name': version_name},
+        data=payload,
+        headers={'Content-Type': 'application/octet-stream'},
+        timeout=UPLOAD_TIMEOUT
+    )
+    response.raise_for_status()
+
+def _is_transient_upload_error(exc):
+    """Falhas que valem nova tentativa: conexão, timeout ou erro 5xx do servidor"""
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
         return True
+    return (
+        isinstance(exc, requests.HTTPError) and exc.response is not None and exc.response.status_code >= 500
+    )
+
+def _upload_scope():
+    """Escopo do status na fila: o processo (com banco) ou a sessão (armazenamento mock)"""
+    if not USE_MOCK_DB:
+        return None
+    if 'upload_scope' not in st.session_state:
+        st.session_state.upload_scope = uuid.uuid4().hex
+    return st.session_state.upload_scope
+
+class UploadQueue:
+    """Fila limitada de envios para a AWS, processada por threads em segundo plano.
+
+    O número de threads limita os envios simultâneos. Falhas transitórias
+    (conexão, timeout, 5xx) são repetidas com backoff exponencial
+    (tenacity); as demais falham na hora. O resultado final é gravado em
+    baselines.sync_status; o status em memória por (escopo, empreendimento,
+    versão) mostra o andamento e é descartado UPLOAD_STATUS_TTL segundos
+    após o término. Com banco o escopo é o processo; sem banco, cada sessão
+    tem seu armazenamento mock e, portanto, seu próprio escopo. As threads
+    não acessam o session_state: o payload é preparado no script.
+    shutdown esvazia a fila antes de encerrar as threads.
+    """
+
+    def __init__(self, workers, maxsize):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._status = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"aws-upload-{i}", daemon=True) for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def shutdown(self, timeout=None):
+        """Recusa novos envios, espera os já enfileirados terminarem e encerra as threads.
+
+        Retorna True se todas as threads terminaram dentro do timeout.
+        """
+        with self._lock:
+            self._closed = True
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def remaining():
+            return None if deadline is None else max(0.0, deadline - time.monotonic())
 
-def delete_baseline(empreendimento, version_name):
-    conn = get_db_connection()
-    if conn:
         try:
-            cursor = conn.cursor()
-            delete_query = "DELETE FROM baselines WHERE empreendimento = %s AND version_name = %s"
-            cursor.execute(delete_query, (empreendimento, version_name))
-            conn.commit()
-            return cursor.rowcount > 0
-        except Error as e:
-            st.error(f"Erro ao deletar linha de base: {e}")
+            # Um marcador por thread, atrás dos envios pendentes (a fila é FIFO)
+            for _ in self._threads:
+                self._queue.put(None, timeout=remaining())
+        except queue.Full:
             return False
-        finally:
-            if conn.is_connected():
-                cursor.close()
-                conn.close()
-    else:
-        if empreendimento in st.session_state.mock_baselines and version_name in st.session_state.mock_baselines[empreendimento]:
-            del st.session_state.mock_baselines[empreendimento][version_name]
-            return True
-        return False
+        for thread in self._threads:
+            thread.join(remaining())
+        return not any(thread.is_alive() for thread in self._threads)
 
-# --- Função para criar DataFrame de exemplo ---
+    def _prune(self):
+        """Descarta o status de envios concluídos há mais de UPLOAD_STATUS_TTL segundos (com o lock)"""
+        cutoff = time.monotonic() - UPLOAD_STATUS_TTL
+        for key in [key for key, entry in self._status.items() if entry.get('finished_at', cutoff) < cutoff]:
+            del self._status[key]
 
-def create_mock_dataframe():
-    data = {
-        'ID_Tarefa': [1, 2, 3, 4, 5, 6],
-        'Empreendimento': ['Projeto A', 'Projeto A', 'Projeto B', 'Projeto B', 'Projeto A', 'Projeto B'],
-        'Tarefa': ['Fase 1', 'Fase 2', 'Design', 'Implementação', 'Teste', 'Deploy'],
-        'Real_Inicio': [pd.to_datetime('2025-10-01'), pd.to_datetime('2025-10-15'), pd.to_datetime('2025-11-01'), pd.to_datetime('2025-11-10'), pd.to_datetime('2025-10-26'), pd.to_datetime('2025-11-21')],
-        'Real_Fim': [pd.to_datetime('2025-10-10'), pd.to_datetime('2025-10-25'), pd.to_datetime('2025-11-05'), pd.to_datetime('2025-11-20'), pd.to_datetime('2025-11-05'), pd.to_datetime('2025-11-25')],
-        'P0_Previsto_Inicio': [pd.to_datetime('2025-09-25'), pd.to_datetime('2025-10-12'), pd.to_datetime('2025-10-28'), pd.to_datetime('2025-11-08'), pd.to_datetime('2025-10-20'), pd.to_datetime('2025-11-18')],
-        'P0_Previsto_Fim': [pd.to_datetime('2025-10-05'), pd.to_datetime('2025-10-20'), pd.to_datetime('2025-11-03'), pd.to_datetime('2025-11-15'), pd.to_datetime('2025-10-30'), pd.to_datetime('2025-11-22')],
-    }
-    df = pd.DataFrame(data)
-    df['Previsto_Inicio'] = df['P0_Previsto_Inicio']
-    df['Previsto_Fim'] = df['P0_Previsto_Fim']
-    return df
+    def submit(self, scope, empreendimento, version_name, payload):
+        """Enfileira um envio; retorna False se a fila estiver cheia"""
+        key = (scope, empreendimento, version_name)
+        with self._lock:
+            if self._closed:
+                return False
+            self._prune()
+            if self._status.get(key, {}).get('status') in ('pending', 'sending'):
+                return True
+            self._status[key] = {'status': 'pending', 'attempts': 0, 'error': None}
+        try:
+            self._queue.put_nowait((key, payload))
+        except queue.Full:
+            with self._lock:
+                self._status.pop(key, None)
+            return False
+        return True
 
-# --- Lógica de Linha de Base ---
+    def status(self, scope, empreendimento, version_name):
+        """Status do envio ('pending', 'sending', 'sent', 'failed') ou None se nunca enviado (ou já descartado)"""
+        with self._lock:
+            entry = self._status.get((scope, empreendimento, version_name))
+            return dict(entry) if entry else None
 
-def take_baseline(df, empreendimento):
-    df_empreendimento = df[df['Empreendimento'] == empreendimento].copy()
-    
-    # ✅ MODIFICAÇÃO: Atualizar P0_Previsto com os valores REAIS atuais
-    df_empreendimento['P0_Previsto_Inicio'] = df_empreendimento['Real_Inicio']
-    df_empreendimento['P0_Previsto_Fim'] = df_empreendimento['Real_Fim']
-    
-    # ✅ MODIFICAÇÃO: Atualizar também as colunas Previsto_Inicio/Previsto_Fim
-    df_empreendimento['Previsto_Inicio'] = df_empreendimento['Real_Inicio']
-    df_empreendimento['Previsto_Fim'] = df_empreendimento['Real_Fim']
-    
-    # ✅ MODIFICAÇÃO: Atualizar o DataFrame original na session_state
-    mask = df['Empreendimento'] == empreendimento
-    df.loc[mask, 'P0_Previsto_Inicio'] = df_empreendimento['Real_Inicio'].values
-    df.loc[mask, 'P0_Previsto_Fim'] = df_empreendimento['Real_Fim'].values
-    df.loc[mask, 'Previsto_Inicio'] = df_empreendimento['Real_Inicio'].values
-    df.loc[mask, 'Previsto_Fim'] = df_empreendimento['Real_Fim'].values
-    
-    existing_baselines = load_baselines()
-    empreendimento_baselines = existing_baselines.get(empreendimento, {})
-    existing_versions = [k for k in empreendimento_baselines.keys() if k.startswith('P') and k.split('-')[0][1:].isdigit()]
-    
-    next_n = 1
-    if existing_versions:
-        max_n = 0
-        for version_name in existing_versions:
+    def has_active(self, scope, empreendimento=None):
+        with self._lock:
+            return any(
+                entry['status'] in ('pending', 'sending')
+                for (entry_scope, emp, _), entry in self._status.items()
+                if entry_scope == scope and (empreendimento is None or emp == empreendimento)
+            )
+
+    def _update(self, key, **fields):
+        with self._lock:
+            self._status[key].update(fields)
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            key, payload = item
             try:
-                n_str = version_name.split('-')[0][1:]
-                n = int(n_str)
-                if n > max_n:
-                    max_n = n
-            except ValueError:
+                self._update(key, status='sending')
+                retrying = Retrying(
+                    stop=stop_after_attempt(UPLOAD_MAX_ATTEMPTS),
+                    wait=wait_exponential(multiplier=UPLOAD_BACKOFF_MULTIPLIER, max=UPLOAD_BACKOFF_MAX),
+                    retry=retry_if_exception(_is_transient_upload_error),
+                    reraise=True
+                )
+                for attempt in retrying:
+                    with attempt:
+                        self._update(key, attempts=attempt.retry_state.attempt_number)
+                        _upload_baseline(key[1], key[2], payload)
+                # Persistir antes de publicar o status em memória, para que quem
+                # o leia já encontre o banco (e o catálogo) atualizados
+                set_sync_status(key[1], key[2], 'sent')
+                self._update(key, status='sent', error=None, finished_at=time.monotonic())
+            except Exception as e:
+                set_sync_status(key[1], key[2], 'failed', str(e))
+                self._update(key, status='failed', error=str(e), finished_at=time.monotonic())
+            finally:
+                self._queue.task_done()
+
+@st.cache_resource(show_spinner=False)
+def get_upload_queue():
+    upload_queue = UploadQueue(UPLOAD_WORKERS, UPLOAD_QUEUE_SIZE)
+    # Ao encerrar o processo, os envios já enfileirados terminam em vez de ficarem 'pending'
+    atexit.register(upload_queue.shutdown, UPLOAD_SHUTDOWN_TIMEOUT)
+    return upload_queue
+
+def send_to_aws(empreendimento, version_name):
+    """Enfileira o envio da linha de base para AWS; o envio acontece em segundo plano"""
+    df_version = load_baseline_payload(empreendimento, version_name)
+    if df_version is None:
+        st.error(f"Erro ao enviar para AWS: {version_name} não encontrada")
+        return False
+    payload = encode_compact_payload(df_version)
+    if not get_upload_queue().submit(_upload_scope(), empreendimento, version_name, payload):
+        st.error("Erro ao enviar para AWS: fila de envio cheia, tente novamente em instantes")
+        return False
+    return True
+
+def send_all_to_aws(empreendimento):
+    """Enfileira todas as linhas de base não enviadas do empreendimento; retorna quantas foram enfileiradas"""
+    queued = 0
+    for version_name in list_unsent_baselines(empreendimento):
+        status = get_upload_queue().status(_upload_scope(), empreendimento, version_name)
+        if status and status['status'] in ('pending', 'sending'):
+            continue
+        if not send_to_aws(empreendimento, version_name):
+            break
+        queued += 1
+    return queued
+
+def sync_mock_upload_status():
+    """Sem banco, aplica ao armazenamento mock da sessão o resultado dos envios feitos pela fila"""
+    upload_queue = get_upload_queue()
+    scope = _upload_scope()
+    for empreendimento, versions in st.session_state.mock_baselines.items():
+        for version_name, info in versions.items():
+            if info["sync_status"] == 'sent':
                 continue
-        next_n = max_n + 1
+            status = upload_queue.status(scope, empreendimento, version_name)
+            if status and status['status'] in ('sent', 'failed'):
+                info["sync_status"] = status['status']
+                info["sync_error"] = status['error']
+
+# --- Exportação e Importação na Barra Lateral ---
+
+def render_export_import(selected_empreendimento):
+    """Exporta as versões para arquivo (download) e importa versões de um arquivo exportado"""
+    scope = st.radio(
+        "Abrangência", ["Empreendimento selecionado", "Portfólio inteiro"], key="export_scope", horizontal=True
+    )
+    fmt = st.selectbox(
+        "Formato", list(BASELINE_EXPORT_FORMATS), format_func=lambda key: BASELINE_EXPORT_FORMATS[key][0],
+        key="export_format"
+    )
+    if st.button("📤 Gerar arquivo", use_container_width=True, key="export_generate"):
+        empreendimento = selected_empreendimento if scope == "Empreendimento selecionado" else None
+        # Gravado em disco bloco a bloco; só o download final passa pela memória
+        fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+        os.close(fd)
+        status = st.empty()
+        try:
+            total = export_baselines(
+                path, fmt, empreendimento, progress=lambda rows: status.caption(f"Linhas exportadas: {rows}")
+            )
+            previous = st.session_state.get('export_file')
+            if previous and os.path.exists(previous['path']):
+                os.remove(previous['path'])
+            name = (empreendimento or "portfolio").replace(' ', '_')
+            st.session_state.export_file = {
+                'path': path, 'name': f"linhas_de_base_{name}.{fmt}", 'mime': BASELINE_EXPORT_FORMATS[fmt][1], 'rows': total
+            }
+        except Exception as e:
+            os.remove(path)
+            st.error(f"❌ Erro ao exportar: {e}")
     
-    version_prefix = f"P{next_n}"
-    current_date_str = datetime.now().strftime("%d/%m/%Y")
-    version_name = f"{version_prefix}-({current_date_str})"
+    export_file = st.session_state.get('export_file')
+    if export_file and os.path.exists(export_file['path']):
+        with open(export_file['path'], 'rb') as f:
+            st.download_button(
+                f"⬇️ {export_file['name']} ({export_file['rows']} linhas)", f, file_name=export_file['name'],
+                mime=export_file['mime'], use_container_width=True, key="export_download"
+            )
     
-    # Criar baseline com os dados atualizados
-    df_baseline = df_empreendimento[['ID_Tarefa', 'P0_Previsto_Inicio', 'P0_Previsto_Fim']].copy()
-    df_baseline['P0_Previsto_Inicio'] = df_baseline['P0_Previsto_Inicio'].dt.strftime('%Y-%m-%d')
-    df_baseline['P0_Previsto_Fim'] = df_baseline['P0_Previsto_Fim'].dt.strftime('%Y-%m-%d')
+    uploaded = st.file_uploader("Importar arquivo", type=list(BASELINE_EXPORT_FORMATS), key="import_file")
+    if st.button("📥 Importar", use_container_width=True, key="import_apply", disabled=uploaded is None):
+        status = st.empty()
+        try:
+            imported, skipped = import_baselines(
+                uploaded, uploaded.name.rsplit('.', 1)[-1].lower(),
+                progress=lambda rows: status.caption(f"Linhas lidas: {rows}")
+            )
+            st.success(f"✅ {len(imported)} versão(ões) importada(s)")
+            if skipped:
+                st.warning(f"⚠️ {len(skipped)} versão(ões) já existente(s) ignorada(s)")
+        except Exception as e:
+            st.error(f"❌ Erro ao importar: {e}")
+
+# --- Gestão de Linhas de Base na Barra Lateral (fragmentos) ---
+
+def _rerun_fragment():
+    """Reexecuta só o fragmento atual; se ele rodou dentro de uma execução completa, reexecuta a página"""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+def render_upload_progress(selected_empreendimento):
+    """Andamento dos envios em segundo plano; roda como fragmento que se atualiza sozinho enquanto há envios na fila"""
+    upload_queue = get_upload_queue()
+    active = upload_queue.has_active(_upload_scope())
+    if st.session_state.get('upload_active') and not active:
+        # Os envios terminaram: os marcadores ⏳/✅ da área principal também mudam
+        st.session_state.upload_active = False
+        st.rerun()
+    st.session_state.upload_active = active
     
-    baseline_data = df_baseline.rename(
-        columns={'P0_Previsto_Inicio': f'{version_prefix}_Previsto_Inicio', 
-                 'P0_Previsto_Fim': f'{version_prefix}_Previsto_Fim'}
-    ).to_dict('records')
+    for version_name in list_unsent_baselines(selected_empreendimento):
+        status = upload_queue.status(_upload_scope(), selected_empreendimento, version_name)
+        if status and status['status'] == 'pending':
+            st.caption(f"⏫ `{version_name}` na fila de envio")
+        elif status and status['status'] == 'sending':
+            st.caption(f"⏫ `{version_name}` enviando (tentativa {status['attempts']})")
 
-    success = save_baseline(empreendimento, version_name, baseline_data, current_date_str)
+@st.fragment
+def render_baseline_sidebar(selected_empreendimento):
+    """Listas e ações de linhas de base da barra lateral, renderizadas como fragmento.
+
+    O fragmento carrega seus próprios dados (catálogo em cache) e os envios
+    para a AWS reexecutam só ele; o andamento dos envios é atualizado por um
+    fragmento interno, sem reexecutar a página. Deletar uma versão muda
+    também a área principal (lista de versões e comparação), então essa
+    ação reexecuta a página inteira.
+    """
+    sync_mock_upload_status()
+    upload_queue = get_upload_queue()
+    empreendimento_baselines = list_baseline_versions(selected_empreendimento)
+    unsent_baselines = list_unsent_baselines(selected_empreendimento)
     
-    if success:
-        # Marcar linha de base como não enviada para AWS
-        if 'unsent_baselines' not in st.session_state:
-            st.session_state.unsent_baselines = {}
-        
-        if empreendimento not in st.session_state.unsent_baselines:
-            st.session_state.unsent_baselines[empreendimento] = []
+    # Seção de envio para AWS
+    st.markdown("---")
+    st.markdown("### ☁️ Linhas de Base para Enviar")
+    
+    # O run_every é reavaliado a cada execução deste fragmento, então um envio
+    # iniciado aqui já liga a atualização periódica do andamento
+    run_every = UPLOAD_POLL_INTERVAL if upload_queue.has_active(_upload_scope()) else None
+    st.fragment(render_upload_progress, run_every=run_every)(selected_empreendimento)
+    
+    if unsent_baselines:
+        st.info(f"📋 {len(unsent_baselines)} linha(s) de base aguardando envio para AWS")
         
-        if version_name not in st.session_state.unsent_baselines[empreendimento]:
-            st.session_state.unsent_baselines[empreendimento].append(version_name)
+        if len(unsent_baselines) > 1 and st.button("☁️ Enviar todas", use_container_width=True, key="aws_send_all"):
+            queued = send_all_to_aws(selected_empreendimento)
+            if queued:
+                st.toast(f"⏫ {queued} linha(s) de base na fila de envio")
+            _rerun_fragment()
         
-        return version_name
+        for version_name in unsent_baselines:
+            status = upload_queue.status(_upload_scope(), selected_empreendimento, version_name)
+            col1, col2, col3 = st.columns([3, 1, 1])
+            with col1:
+                if status and status['status'] in ('pending', 'sending'):
+                    st.write(f"`{version_name}` ⏫")
+                elif status and status['status'] == 'failed':
+                    st.write(f"`{version_name}` ⚠️")
+                    st.caption(f"Falha no envio após {status['attempts']} tentativa(s): {status['error']}")
+                elif empreendimento_baselines[version_name]["sync_status"] == 'failed':
+                    st.write(f"`{version_name}` ⚠️")
+                    st.caption(f"Falha no envio: {empreendimento_baselines[version_name]['sync_error']}")
+                else:
+                    st.write(f"`{version_name}`")
+            with col2:
+                if st.button("☁️", key=f"aws_{version_name}"):
+                    if send_to_aws(selected_empreendimento, version_name):
+                        st.toast(f"⏫ {version_name} na fila de envio para AWS!")
+                        _rerun_fragment()
+            with col3:
+                if st.button("🗑️", key=f"del_{version_name}"):
+                    if delete_baseline(selected_empreendimento, version_name):
+                        st.toast(f"✅ {version_name} deletado!")
+                        st.rerun()
     else:
-        raise Exception("Falha ao salvar linha de base no banco de dados")
+        st.info("📭 Nenhuma linha de base aguardando envio")
+    
+    # Gerenciamento de todas as linhas de base
+    st.markdown("---")
+    st.markdown("### 💾 Todas as Linhas de Base")
+    
+    if empreendimento_baselines:
+        for version_name in sorted(empreendimento_baselines.keys()):
+            is_unsent = empreendimento_baselines[version_name]["sync_status"] != 'sent'
+            
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                if is_unsent:
+                    st.write(f"`{version_name}` ⏳")
+                else:
+                    st.write(f"`{version_name}` ✅")
+            with col2:
+                if st.button("🗑️", key=f"del_all_{version_name}"):
+                    if delete_baseline(selected_empreendimento, version_name):
+                        st.toast(f"✅ {version_name} deletado!")
+                        st.rerun()
+    else:
+        st.info("Nenhuma linha de base criada")
 
-# --- Função para enviar dados para AWS ---
+# --- Menu de Contexto (componente bidirecional) ---
 
-def send_to_aws(empreendimento, version_name):
-    """Simula o envio de dados para AWS"""
-    try:
-        # Simular processamento
-        import time
-        time.sleep(1)  # Simular delay de rede
-        
-        # Remover da lista de não enviados
-        if ('unsent_baselines' in st.session_state and 
-            empreendimento in st.session_state.unsent_baselines and 
-            version_name in st.session_state.unsent_baselines[empreendimento]):
-            
-            st.session_state.unsent_baselines[empreendimento].remove(version_name)
-            
-            # Se não há mais linhas de base não enviadas para este empreendimento, remover a entrada
-            if not st.session_state.unsent_baselines[empreendimento]:
-                del st.session_state.unsent_baselines[empreendimento]
-        
-        return True
-    except Exception as e:
-        st.error(f"Erro ao enviar para AWS: {e}")
-        return False
+CONTEXT_MENU_KEY = "circular_menu"
 
-# --- Processar ações do menu de contexto ---
+# O componente fala direto com a sessão em execução: a ação chega como valor
+# do componente e o resultado real volta nos argumentos da renderização seguinte
+_circular_menu = declare_component(
+    "circular_menu",
+    path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "circular_menu"),
+)
 
 def process_context_menu_actions():
-    """Processa ações do menu de contexto via query parameters"""
-    query_params = st.query_params
+    """Processa a ação enviada pelo menu de contexto antes de renderizar a página"""
+    request = st.session_state.get(CONTEXT_MENU_KEY)
+    # O valor do componente persiste entre execuções: cada pedido é processado uma única vez
+    if not request or request.get('request_id') == st.session_state.context_menu_handled:
+        return
+    st.session_state.context_menu_handled = request['request_id']
     
-    if 'context_action' in query_params and 'empreendimento' in query_params:
-        action = query_params['context_action']
-        empreendimento = query_params['empreendimento']
-        
-        # Limpar os parâmetros para evitar execução múltipla
-        st.query_params.clear()
-        
-        if action == 'take_baseline':
-            try:
-                version_name = take_baseline(st.session_state.df, empreendimento)
-                # Usar session_state para mostrar mensagem sem recarregar a página
-                st.session_state.context_menu_success = f"✅ {version_name} criado via menu de contexto!"
-                st.session_state.show_context_success = True
-                st.session_state.context_menu_trigger = True
-            except Exception as e:
-                st.session_state.context_menu_error = f"❌ Erro ao criar linha de base: {e}"
-                st.session_state.show_context_error = True
-
-# --- Menu de Contexto SEM RECARREGAMENTO VISÍVEL ---
+    action = request.get('action')
+    empreendimento = request.get('empreendimento')
+    
+    if action == 'take_baseline':
+        try:
+            version_name = take_baseline(empreendimento)
+            ok, message = True, f"✅ {version_name} criado via menu de contexto!"
+        except Exception as e:
+            ok, message = False, f"❌ Erro ao criar linha de base: {e}"
+    elif action == 'view_period':
+        st.session_state.show_comparison = True
+        ok, message = True, "⏳ Comparação de períodos aberta"
+    elif action == 'restore_baseline':
+        st.session_state.show_restore = True
+        ok, message = True, "🔄 Restauração de linha de base aberta"
+    else:
+        ok, message = False, f"❌ Ação desconhecida no menu de contexto: {action}"
+    
+    st.session_state.context_menu_result = {
+        "request_id": request['request_id'],
+        "ok": ok,
+        "message": message,
+    }
+    st.toast(message)
 
 def create_context_menu_component(selected_empreendimento):
-    """Cria o componente do menu de contexto sem recarregamento visível"""
-    
-    # Mostrar mensagens de sucesso/erro do menu de contexto
-    if st.session_state.get('show_context_success'):
-        # Usar um container vazio para a mensagem (não recarrega a página inteira)
-        success_container = st.empty()
-        success_container.success(st.session_state.context_menu_success)
-        st.session_state.show_context_success = False
-        
-        # Remover a mensagem após 3 segundos
-        import time
-        time.sleep(3)
-        success_container.empty()
-    
-    if st.session_state.get('show_context_error'):
-        error_container = st.empty()
-        error_container.error(st.session_state.context_menu_error)
-        st.session_state.show_context_error = False
-        
-        import time
-        time.sleep(3)
-        error_container.empty()
-    
-    # HTML completo com CSS e JavaScript para o menu visual
-    context_menu_html = f"""
-    <style>
-    #context-menu {{
-        position: fixed;
-        background: white;
-        border: 1px solid #ccc;
-        border-radius: 5px;
-        box-shadow: 2px 2px 10px rgba(0,0,0,0.2);
-        z-index: 10000;
-        display: none;
-        font-family: Arial, sans-serif;
-    }}
-    .context-menu-item {{
-        padding: 12px 20px;
-        cursor: pointer;
-        border-bottom: 1px solid #eee;
-        font-size: 14px;
-        transition: background-color 0.2s;
-    }}
-    .context-menu-item:hover {{
-        background: #f0f0f0;
-    }}
-    .context-menu-item:last-child {{
-        border-bottom: none;
-    }}
-    #gantt-area {{
-        height: 300px;
-        border: 2px dashed #ccc;
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        background-color: #f9f9f9;
-        cursor: pointer;
-        margin: 20px 0;
-        user-select: none;
-    }}
-    #baseline-status {{
-        margin-top: 10px;
-        padding: 10px;
-        border-radius: 5px;
-        text-align: center;
-        font-weight: bold;
-        display: none;
-    }}
-    .status-creating {{
-        background-color: #fff3cd;
-        border: 1px solid #ffeaa7;
-        color: #856404;
-    }}
-    .status-success {{
-        background-color: #d1ecf1;
-        border: 1px solid #bee5eb;
-        color: #0c5460;
-    }}
-    .status-error {{
-        background-color: #f8d7da;
-        border: 1px solid #f5c6cb;
-        color: #721c24;
-    }}
-    #hidden-iframe {{
-        position: absolute;
-        width: 1px;
-        height: 1px;
-        border: none;
-        opacity: 0;
-        pointer-events: none;
-    }}
-    .loading-overlay {{
-        position: fixed;
-        top: 0;
-        left: 0;
-        width: 100%;
-        height: 100%;
-        background: rgba(255, 255, 255, 0.8);
-        display: none;
-        justify-content: center;
-        align-items: center;
-        z-index: 10001;
-        font-family: Arial, sans-serif;
-    }}
-    .loading-spinner {{
-        background: white;
-        padding: 20px;
-        border-radius: 10px;
-        box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-        text-align: center;
-    }}
-    </style>
-
-    <div id="gantt-area">
-        <div style="text-align: center;">
-            <h3>Área do Gráfico de Gantt</h3>
-            <p>Clique com o botão direito para abrir o menu de linha de base</p>
-        </div>
-    </div>
-
-    <div id="baseline-status"></div>
-
-    <!-- Overlay de loading -->
-    <div id="loading-overlay" class="loading-overlay">
-        <div class="loading-spinner">
-            <h3>🔄 Criando Linha de Base</h3>
-            <p>Por favor, aguarde...</p>
-        </div>
-    </div>
-
-    <!-- Iframe invisível para carregamentos -->
-    <iframe id="hidden-iframe" name="hidden-iframe"></iframe>
-
-    <div id="context-menu">
-        <div class="context-menu-item" id="take-baseline">📸 Criar Linha de Base</div>
-        <div class="context-menu-item" id="restore-baseline">🔄 Restaurar Linha de Base</div>
-        <div class="context-menu-item" id="delete-baseline">🗑️ Deletar Linha de Base</div>
-    </div>
-
-    <script>
-    // Elementos
-    const ganttArea = document.getElementById('gantt-area');
-    const contextMenu = document.getElementById('context-menu');
-    const statusDiv = document.getElementById('baseline-status');
-    const takeBaselineBtn = document.getElementById('take-baseline');
-    const loadingOverlay = document.getElementById('loading-overlay');
-    const hiddenIframe = document.getElementById('hidden-iframe');
-    
-    // Função para mostrar o menu
-    function showContextMenu(x, y) {{
-        contextMenu.style.left = x + 'px';
-        contextMenu.style.top = y + 'px';
-        contextMenu.style.display = 'block';
-    }}
-    
-    // Função para esconder o menu
-    function hideContextMenu() {{
-        contextMenu.style.display = 'none';
-    }}
-    
-    // Função para mostrar/ocultar loading
-    function showLoading() {{
-        loadingOverlay.style.display = 'flex';
-    }}
-    
-    function hideLoading() {{
-        loadingOverlay.style.display = 'none';
-    }}
-    
-    // Função para mostrar status
-    function showStatus(message, type) {{
-        statusDiv.textContent = message;
-        statusDiv.className = '';
-        statusDiv.classList.add(type);
-        statusDiv.style.display = 'block';
-        
-        // Auto-esconder após 3 segundos
-        setTimeout(() => {{
-            statusDiv.style.display = 'none';
-        }}, 3000);
-    }}
-    
-    // Função para criar linha de base via iframe invisível
-    function executeTakeBaseline() {{
-        showStatus('🔄 Criando linha de base...', 'status-creating');
-        showLoading();
-        
-        // Criar URL com parâmetros para o Streamlit processar
-        const timestamp = new Date().getTime();
-        const url = `?context_action=take_baseline&empreendimento={selected_empreendimento}&t=${{timestamp}}`;
-        
-        // Usar iframe invisível para carregar a URL
-        hiddenIframe.src = url;
-        
-        // Quando o iframe terminar de carregar
-        hiddenIframe.onload = function() {{
-            hideLoading();
-            showStatus('✅ Linha de base criada! Verifique a barra lateral para enviar para AWS.', 'status-success');
-            
-            // Forçar uma atualização suave da sidebar após 1 segundo
-            setTimeout(() => {{
-                // Disparar um evento customizado para atualizar a interface
-                const event = new Event('baselineCreated');
-                document.dispatchEvent(event);
-            }}, 1000);
-        }};
-        
-        hideContextMenu();
-    }}
-    
-    // Event Listeners
-    if (ganttArea) {{
-        ganttArea.addEventListener('contextmenu', function(e) {{
-            e.preventDefault();
-            e.stopPropagation();
-            showContextMenu(e.pageX, e.pageY);
-        }});
-    }}
-    
-    // Event listener para o botão de criar linha de base
-    if (takeBaselineBtn) {{
-        takeBaselineBtn.addEventListener('click', function() {{
-            executeTakeBaseline();
-        }});
-    }}
-    
-    // Event listeners para outros botões (placeholder)
-    const restoreBaselineBtn = document.getElementById('restore-baseline');
-    const deleteBaselineBtn = document.getElementById('delete-baseline');
-    
-    if (restoreBaselineBtn) {{
-        restoreBaselineBtn.addEventListener('click', function() {{
-            showStatus('🔄 Funcionalidade em desenvolvimento...', 'status-creating');
-            hideContextMenu();
-        }});
-    }}
-    
-    if (deleteBaselineBtn) {{
-        deleteBaselineBtn.addEventListener('click', function() {{
-            showStatus('🗑️ Funcionalidade em desenvolvimento...', 'status-creating');
-            hideContextMenu();
-        }});
-    }}
-    
-    // Fechar menu ao clicar fora
-    document.addEventListener('click', function(e) {{
-        if (contextMenu && !contextMenu.contains(e.target) && e.target !== ganttArea) {{
-            hideContextMenu();
-        }}
-    }});
-    
-    // Fechar menu com ESC
-    document.addEventListener('keydown', function(e) {{
-        if (e.key === 'Escape') {{
-            hideContextMenu();
-        }}
-    }});
-    
-    // Prevenir menu de contexto padrão na área do Gantt
-    document.addEventListener('contextmenu', function(e) {{
-        if (e.target.id === 'gantt-area' || e.target.closest('#gantt-area')) {{
-            e.preventDefault();
-        }}
-    }}, true);
-    
-    // Atualizar interface quando linha de base for criada
-    document.addEventListener('baselineCreated', function() {{
-        console.log('Linha de base criada - interface pode ser atualizada');
-        // Aqui você pode adicionar lógica para atualizar elementos específicos
-    }});
-    </script>
+    """Renderiza o menu circular e devolve a ele o resultado da última ação"""
+    _circular_menu(
+        empreendimento=selected_empreendimento,
+        result=st.session_state.context_menu_result,
+        key=CONTEXT_MENU_KEY,
+        default=None,
+    )
+
+# --- Gráfico de Gantt ---
+# Cada série (real, P0 e cada versão sobreposta) é um único traço WebGL com as barras
+# como segmentos separados por NaN, em vez de uma forma por tarefa. Projetos grandes
+# são paginados ou agrupados por fase, e a figura pronta fica memorizada na sessão.
+
+GANTT_MODE_TASKS = "Tarefas"
+GANTT_MODE_PHASES = "Fases"
+MS_PER_DAY = 86400000
+
+def _gantt_payloads(empreendimento, versions):
+    """Payloads [(versão, DataFrame)] das versões sobrepostas; as que não existem mais são ignoradas"""
+    payloads = []
+    for version_name in versions:
+        df_version = load_baseline_payload(empreendimento, version_name)
+        if df_version is not None:
+            payloads.append((version_name, df_version))
+    return payloads
+
+def _gantt_series(df_tasks, payloads):
+    """Séries [(nome, início, fim)] em epoch days alinhadas às linhas de df_tasks"""
+    series = [
+        ("Real", _epoch_days(df_tasks['Real_Inicio']), _epoch_days(df_tasks['Real_Fim'])),
+        ("P0", _epoch_days(df_tasks['P0_Previsto_Inicio']), _epoch_days(df_tasks['P0_Previsto_Fim']))
+    ]
+    task_index = pd.Index(df_tasks['ID_Tarefa'])
+    for version_name, df_version in payloads:
+        rows = task_index.get_indexer(df_version['ID_Tarefa'])
+        found = rows >= 0
+        inicio = np.full(len(df_tasks), EPOCH_DAY_NULL, dtype=np.int32)
+        fim = np.full(len(df_tasks), EPOCH_DAY_NULL, dtype=np.int32)
+        inicio[rows[found]] = _epoch_days(df_version['Inicio'])[found]
+        fim[rows[found]] = _epoch_days(df_version['Fim'])[found]
+        series.append((version_name.split('-')[0], inicio, fim))
+    return series
+
+def _collapse_by_phase(labels, series):
+    """Uma linha por fase (Tarefa): menor início e maior fim de cada série"""
+    codes, phases = pd.factorize(labels, sort=False)
+    collapsed = []
+    for name, inicio, fim in series:
+        # Início nulo vira o maior int32 para não vencer o mínimo (o fim nulo já é o menor)
+        starts = np.where(inicio == EPOCH_DAY_NULL, np.iinfo(np.int32).max, inicio)
+        group_start = np.full(len(phases), np.iinfo(np.int32).max, dtype=np.int32)
+        group_end = np.full(len(phases), EPOCH_DAY_NULL, dtype=np.int32)
+        np.minimum.at(group_start, codes, starts)
+        np.maximum.at(group_end, codes, fim)
+        group_start[group_start == np.iinfo(np.int32).max] = EPOCH_DAY_NULL
+        collapsed.append((name, group_start, group_end))
+    return np.asarray(phases, dtype=object), collapsed
+
+def _gantt_trace(name, inicio, fim, labels, lane, width, opacity=1.0):
+    """Traço Scattergl com uma barra por linha válida (segmentos início→fim separados por NaN)"""
+    valid = (inicio != EPOCH_DAY_NULL) & (fim != EPOCH_DAY_NULL)
+    rows = np.flatnonzero(valid)
+    starts = inicio[valid].astype(np.float64) * MS_PER_DAY
+    ends = fim[valid].astype(np.float64) * MS_PER_DAY
+    gaps = np.full(len(rows), np.nan)
+    x = np.column_stack([starts, ends, gaps]).ravel()
+    y = np.column_stack([rows + lane, rows + lane, gaps]).ravel()
+    hover = (
+        pd.Series(labels[valid], dtype=object).astype(str) + f"<br>{name}: "
+        + pd.Series(_date_strings(_epoch_days_to_datetime(inicio[valid]))).astype(str) + " → "
+        + pd.Series(_date_strings(_epoch_days_to_datetime(fim[valid]))).astype(str)
+    ).to_numpy()
+    text = np.column_stack([hover, hover, np.full(len(rows), None, dtype=object)]).ravel()
+    return go.Scattergl(
+        x=x, y=y, mode='lines', name=name, line=dict(width=width), opacity=opacity,
+        hovertext=text, hoverinfo='text', connectgaps=False
+    )
+
+def build_gantt_figure(labels, series):
+    """Figura do Gantt: a série real larga no centro de cada linha e as linhas de base finas sobre ela"""
+    n_rows = len(labels)
+    height = min(max(300, 20 * n_rows + 120), 900)
+    row_px = (height - 120) / max(n_rows, 1)
+    overlays = len(series) - 1
+    lanes = np.linspace(-0.25, 0.25, overlays) if overlays > 1 else [0.25]
+    fig = go.Figure()
+    fig.add_trace(_gantt_trace(*series[0], labels, lane=0.0, width=max(1, min(12, row_px * 0.6)), opacity=0.5))
+    for (name, inicio, fim), lane in zip(series[1:], lanes):
+        fig.add_trace(_gantt_trace(name, inicio, fim, labels, lane=lane, width=max(1, min(3, row_px * 0.15))))
+    show_labels = n_rows <= 60
+    fig.update_yaxes(
+        autorange='reversed', tickvals=np.arange(n_rows) if show_labels else None,
+        ticktext=list(labels) if show_labels else None, showticklabels=show_labels, showgrid=False
+    )
+    fig.update_xaxes(type='date')
+    fig.update_layout(
+        height=height, margin=dict(l=10, r=10, t=30, b=10),
+        legend=dict(orientation='h', y=1.02, yanchor='bottom'), hovermode='closest'
+    )
+    return fig
+
+@timed("gantt.figure")
+def gantt_figure(df_tasks, empreendimento, versions, mode, page):
+    """Figura do Gantt memorizada por (empreendimento, versões, modo, página).
+
+    A entrada só é reaproveitada se os DataFrames de origem (tarefas e
+    payloads) forem os mesmos objetos: qualquer recarga gera outra figura.
     """
+    if 'gantt_figures' not in st.session_state:
+        st.session_state.gantt_figures = LRUCache(maxsize=GANTT_FIGURE_CACHE_SIZE)
+    cache = st.session_state.gantt_figures
+    key = (empreendimento, tuple(versions), mode, page)
+    payloads = _gantt_payloads(empreendimento, versions)
+    cached = cache.get(key)
+    if cached is not None:
+        cached_tasks, cached_payloads, fig = cached
+        if cached_tasks is df_tasks and len(cached_payloads) == len(payloads) and all(
+            a is b for (_, a), (_, b) in zip(cached_payloads, payloads)
+        ):
+            return fig
+    
+    series = _gantt_series(df_tasks, payloads)
+    labels = df_tasks['Tarefa'].to_numpy(dtype=object)
+    if mode == GANTT_MODE_PHASES:
+        labels, series = _collapse_by_phase(labels, series)
+    
+    # Linhas na ordem do início real (sem início real, pelo P0), depois a página pedida
+    order_key = np.where(series[0][1] == EPOCH_DAY_NULL, series[1][1], series[0][1])
+    order = np.argsort(order_key, kind='stable')[page * GANTT_MAX_ROWS:(page + 1) * GANTT_MAX_ROWS]
+    fig = build_gantt_figure(
+        labels[order], [(name, inicio[order], fim[order]) for name, inicio, fim in series]
+    )
+    cache[key] = (df_tasks, payloads, fig)
+    return fig
+
+@st.fragment
+def display_gantt(df_filtered, empreendimento, empreendimento_baselines):
+    """Gantt real × P0 × linhas de base escolhidas; os controles reexecutam só este fragmento"""
+    if df_filtered.empty:
+        st.info("Nenhuma tarefa no empreendimento")
+        return
+    
+    versions = sorted(empreendimento_baselines.keys(), key=_version_sort_key)
+    col1, col2, col3 = st.columns([3, 1, 1])
+    overlays = col1.multiselect(
+        "Linhas de base sobrepostas", versions, default=versions[-1:],
+        max_selections=GANTT_MAX_OVERLAYS, key=f"gantt_versions_{empreendimento}"
+    )
+    overlays = [v for v in versions if v in overlays]
+    
+    # Projetos grandes abrem agrupados por fase; o detalhe por tarefa é paginado
+    modes = [GANTT_MODE_TASKS, GANTT_MODE_PHASES]
+    mode = col2.radio(
+        "Detalhe", modes, index=0 if len(df_filtered) <= GANTT_MAX_ROWS else 1,
+        key=f"gantt_mode_{empreendimento}"
+    )
+    n_rows = len(df_filtered) if mode == GANTT_MODE_TASKS else df_filtered['Tarefa'].nunique()
+    pages = -(-n_rows // GANTT_MAX_ROWS)
+    page = 0
+    if pages > 1:
+        page = col3.number_input(
+            f"Página (de {pages})", min_value=1, max_value=pages, value=1, key=f"gantt_page_{empreendimento}_{mode}"
+        ) - 1
     
-    # Usar html() para injetar o componente completo
-    html(context_menu_html, height=400)
+    fig = gantt_figure(df_filtered, empreendimento, overlays, mode, page)
+    st.plotly_chart(fig, use_container_width=True)
 
 # --- Visualização de Comparação de Período ---
 
-def display_period_comparison(df_filtered, empreendimento_baselines):
-    st.subheader(f"⏳ Comparação de Período - {df_filtered['Empreendimento'].iloc[0]}")
+P0_VERSION_LABEL = "P0 (Planejamento Original)"
+
+def display_period_comparison(df_filtered, empreendimento, empreendimento_baselines):
+    """Comparação entre versões pelo motor de comparação: um par (A × B) ou N versões contra a primeira"""
+    st.subheader(f"⏳ Comparação de Período - {empreendimento}")
     
-    version_options = ["P0 (Planejamento Original)"]
-    version_options.extend(sorted(empreendimento_baselines.keys()))
+    # P0 primeiro, depois as versões gravadas em ordem cronológica
+    version_options = [P0_VERSION_LABEL]
+    version_options.extend(sorted(empreendimento_baselines.keys(), key=_version_sort_key))
     
-    col1, col2 = st.columns(2)
-    with col1:
-        version_a = st.selectbox("Linha de Base A", version_options, index=0, key="version_a")
-    with col2:
-        default_index_b = 1 if len(version_options) > 1 else 0
-        version_b = st.selectbox("Linha de Base B", version_options, index=default_index_b, key="version_b")
-        
-    if version_a == version_b:
-        st.warning("Selecione duas linhas de base diferentes")
+    default_versions = version_options[:1] + version_options[-1:] if len(version_options) > 1 else version_options
+    selected = st.multiselect(
+        "Linhas de Base (a primeira é a referência)", version_options,
+        default=default_versions, key="compare_versions"
+    )
+    selected = [v for v in version_options if v in selected]
+    
+    if len(selected) < 2:
+        st.warning("Selecione duas ou mais linhas de base diferentes")
         return
-
-    def load_version_data(version_name):
-        if version_name == "P0 (Planejamento Original)":
-            df_version = df_filtered[['ID_Tarefa', 'P0_Previsto_Inicio', 'P0_Previsto_Fim']].copy()
-            df_version = df_version.rename(columns={'P0_Previsto_Inicio': 'Inicio', 'P0_Previsto_Fim': 'Fim'})
-        else:
-            version_data_list = empreendimento_baselines[version_name]['data']
-            df_version = pd.DataFrame(version_data_list)
-            version_prefix = version_name.split('-')[0]
-            col_inicio = f'{version_prefix}_Previsto_Inicio'
-            col_fim = f'{version_prefix}_Previsto_Fim'
-            df_version = df_version.rename(columns={col_inicio: 'Inicio', col_fim: 'Fim'})
-            
-        df_version['Inicio'] = pd.to_datetime(df_version['Inicio'])
-        df_version['Fim'] = pd.to_datetime(df_version['Fim'])
-        return df_version[['ID_Tarefa', 'Inicio', 'Fim']]
-
-    df_a = load_version_data(version_a)
-    df_b = load_version_data(version_b)
-    df_merged = df_a.merge(df_b, on='ID_Tarefa', suffixes=('_A', '_B'))
     
-    df_merged['Duracao_A'] = (df_merged['Fim_A'] - df_merged['Inicio_A']).dt.days
-    df_merged['Duracao_B'] = (df_merged['Fim_B'] - df_merged['Inicio_B']).dt.days
-    df_merged['Diferenca_Duracao'] = df_merged['Duracao_B'] - df_merged['Duracao_A']
-    df_merged['Desvio_Inicio'] = (df_merged['Inicio_B'] - df_merged['Inicio_A']).dt.days
-    df_merged['Desvio_Fim'] = (df_merged['Fim_B'] - df_merged['Fim_A']).dt.days
+    # O P0 vem do DataFrame atual (não é uma versão gravada) e é alinhado na consulta
+    live = {P0_VERSION_LABEL: df_filtered[['ID_Tarefa', 'P0_Previsto_Inicio', 'P0_Previsto_Fim']].rename(
+        columns={'P0_Previsto_Inicio': 'Inicio', 'P0_Previsto_Fim': 'Fim'}
+    )}
+    engine = get_comparison_engine()
+    if len(selected) == 2:
+        df_result = engine.compare(empreendimento, selected[0], selected[1], live=live)
+    else:
+        df_result = engine.drift(empreendimento, selected, live=live)
+    if df_result is None:
+        st.warning("Linha de base não encontrada. Ela pode ter sido removida.")
+        return
     
     df_context = df_filtered[['ID_Tarefa', 'Tarefa']].drop_duplicates()
-    df_final = df_context.merge(df_merged, on='ID_Tarefa')
+    # Tarefas de versões antigas que não existem mais no cronograma ficam sem nome, mas aparecem
+    df_final = df_context.merge(df_result, on='ID_Tarefa', how='right')
     
     st.dataframe(df_final, use_container_width=True)
 
+# --- Histórico por Tarefa ---
+
+@st.fragment
+def display_task_history(df_filtered, empreendimento):
+    """Linha do tempo de desvios de uma tarefa (P0 e todas as versões); consultas reexecutam só este fragmento"""
+    st.markdown("#### 🔎 Histórico da Tarefa")
+    if df_filtered.empty:
+        st.info("Nenhuma tarefa no empreendimento")
+        return
+    
+    task_ids = df_filtered['ID_Tarefa'].to_numpy()
+    task_id = st.number_input(
+        "ID da Tarefa", min_value=int(task_ids.min()), max_value=int(task_ids.max()),
+        value=int(task_ids[0]), step=1, key=f"task_history_{empreendimento}"
+    )
+    task = df_filtered.loc[df_filtered['ID_Tarefa'] == task_id]
+    if task.empty:
+        st.warning(f"Tarefa {task_id} não existe no empreendimento")
+        return
+    task = task.iloc[0]
+    
+    history = get_comparison_engine().task_history(
+        empreendimento, task_id, p0=(task['P0_Previsto_Inicio'], task['P0_Previsto_Fim'])
+    )
+    st.caption(f"{task['Tarefa']} • {len(history) - 1} linha(s) de base com esta tarefa")
+    
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=history['Versao'], y=history['Inicio'], mode='lines+markers', name='Início'))
+    fig.add_trace(go.Scatter(x=history['Versao'], y=history['Fim'], mode='lines+markers', name='Fim'))
+    fig.update_layout(
+        height=320, margin=dict(l=10, r=10, t=30, b=10),
+        legend=dict(orientation='h', y=1.02, yanchor='bottom'), yaxis=dict(type='date')
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    st.dataframe(history, use_container_width=True, hide_index=True)
+
+# --- Visualização de Restauração ---
+
+def display_restore_view(empreendimento, empreendimento_baselines):
+    """Restaura o planejamento a partir de uma versão e mostra o planejamento vigente em qualquer data"""
+    st.subheader(f"🔄 Restaurar Linha de Base - {empreendimento}")
+    
+    versions = sorted(empreendimento_baselines.keys(), key=_version_sort_key, reverse=True)
+    if not versions:
+        st.info("Nenhuma linha de base")
+        return
+    
+    col1, col2 = st.columns([3, 1])
+    version_name = col1.selectbox("Versão a restaurar", versions, key="restore_version")
+    col2.write("")
+    if not get_project_data_cache().source.writable:
+        st.caption("A fonte de dados é somente leitura: a restauração vale só para esta sessão.")
+    if col2.button("🔄 Restaurar", use_container_width=True, key="restore_apply"):
+        try:
+            if restore_baseline(empreendimento, version_name):
+                st.toast(f"💾 Planejamento de {version_name} gravado na fonte de dados")
+            st.success(f"✅ Planejamento restaurado para {version_name}!")
+            st.rerun()
+        except Exception as e:
+            st.error(f"❌ Erro: {e}")
+    
+    st.markdown("#### Linha do Tempo")
+    as_of = st.date_input("Planejamento vigente em", value=datetime.now().date(), format="DD/MM/YYYY", key="restore_as_of")
+    try:
+        df_as_of = planned_as_of(empreendimento, as_of)
+    except (Error, OSError, ValueError, KeyError) as e:
+        st.error(f"Erro ao carregar tarefas do empreendimento: {e}")
+        return
+    origins = df_as_of['Versao'].value_counts(sort=False)
+    st.caption(" • ".join(f"{version}: {count} tarefa(s)" for version, count in origins.items() if count))
+    st.dataframe(df_as_of, use_container_width=True)
+
+# --- Visão do Portfólio ---
+
+def display_portfolio_view():
+    """Desvios agregados de todos os empreendimentos, a partir dos agregados memorizados"""
+    st.subheader("📈 Desvios do Portfólio")
+    
+    analytics = get_portfolio_analytics()
+    stats = analytics.version_stats()
+    if stats.empty:
+        st.info("Nenhuma linha de base no portfólio")
+        return
+    
+    projects = analytics.projects()
+    trend = analytics.trend()
+    
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Empreendimentos", stats['Empreendimento'].nunique())
+    col2.metric("Linhas de Base", len(stats))
+    col3.metric("Tarefas Atrasadas (última versão)", int(projects['Tarefas_Atrasadas'].sum()))
+    col4.metric("Desvio Total de Fim (dias)", int(stats['Desvio_Fim_Total'].sum()))
+    
+    st.markdown("#### Tendência por Versão")
+    st.line_chart(trend.set_index('Numero_Versao')[['Desvio_Fim_Medio', 'Desvio_Acumulado_Medio']])
+    st.dataframe(trend, use_container_width=True)
+    
+    st.markdown("#### Empreendimentos (última versão)")
+    st.dataframe(projects, use_container_width=True)
+
 # --- Aplicação Principal ---
 
 def main():
@@ -614,35 +3344,40 @@ def main():
     st.title("📊 Gráfico de Gantt com Versionamento")
     
     # Inicialização do session_state
-    if 'df' not in st.session_state:
-        st.session_state.df = create_mock_dataframe()
-    if 'unsent_baselines' not in st.session_state:
-        st.session_state.unsent_baselines = {}
+    if 'planned_overrides' not in st.session_state:
+        st.session_state.planned_overrides = {}
+    if 'planned_frames' not in st.session_state:
+        st.session_state.planned_frames = {}
     if 'show_comparison' not in st.session_state:
         st.session_state.show_comparison = False
-    if 'show_context_success' not in st.session_state:
-        st.session_state.show_context_success = False
-    if 'show_context_error' not in st.session_state:
-        st.session_state.show_context_error = False
-    if 'context_menu_trigger' not in st.session_state:
-        st.session_state.context_menu_trigger = False
+    if 'show_portfolio' not in st.session_state:
+        st.session_state.show_portfolio = False
+    if 'show_restore' not in st.session_state:
+        st.session_state.show_restore = False
+    if 'context_menu_handled' not in st.session_state:
+        st.session_state.context_menu_handled = None
+    if 'context_menu_result' not in st.session_state:
+        st.session_state.context_menu_result = None
     
-    # Inicialização do banco
-    create_baselines_table()
+    metrics = get_metrics()
     
-    # Processar ações do menu de contexto PRIMEIRO
-    process_context_menu_actions()
+    # Inicialização do banco (DDL executado uma vez por processo)
+    ensure_schema()
     
-    # Dados
-    df = st.session_state.df
-    baselines = load_baselines()
+    # Processar ações do menu de contexto PRIMEIRO
+    with metrics.span("main.context_menu_actions"):
+        process_context_menu_actions()
     
     # Sidebar
-    with st.sidebar:
-        empreendimentos = df['Empreendimento'].unique().tolist()
+    with st.sidebar, metrics.span("main.sidebar"):
+        empreendimentos = list_empreendimentos()
         selected_empreendimento = st.selectbox("🏢 Empreendimento", empreendimentos)
+        if selected_empreendimento is None:
+            st.info("Nenhum empreendimento na fonte de dados")
+            return
         
-        df_filtered = df[df['Empreendimento'] == selected_empreendimento].copy()
+        # Dados só do empreendimento selecionado (compartilhados pelo cache do processo)
+        df_filtered = load_project_tasks(selected_empreendimento)
         
         # Botões de ação na sidebar
         st.markdown("---")
@@ -650,92 +3385,75 @@ def main():
         
         if st.button("📸 Criar Linha de Base", use_container_width=True, key="sidebar_baseline"):
             try:
-                version_name = take_baseline(df, selected_empreendimento)
+                version_name = take_baseline(selected_empreendimento)
                 st.success(f"✅ {version_name} criado!")
                 st.rerun()
             except Exception as e:
                 st.error(f"❌ Erro: {e}")
         
+        with st.expander("📦 Linhas de Base em Lote"):
+            bulk_selection = st.multiselect(
+                "Empreendimentos", empreendimentos, default=empreendimentos, key="bulk_empreendimentos"
+            )
+            if st.button("📸 Criar para os selecionados", use_container_width=True, key="sidebar_bulk_baseline",
+                         disabled=not bulk_selection):
+                progress_bar = st.progress(0.0, text="Preparando...")
+                try:
+                    created = take_baselines(
+                        bulk_selection, progress=lambda fraction, text: progress_bar.progress(min(fraction, 1.0), text=text)
+                    )
+                    skipped = [empreendimento for empreendimento in bulk_selection if empreendimento not in created]
+                    if skipped:
+                        st.toast(f"⚠️ Sem tarefas, ignorado(s): {', '.join(skipped)}")
+                    st.success(f"✅ {len(created)} linha(s) de base criada(s)!")
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"❌ Erro: {e}")
+        
+        with st.expander("📤 Exportar / Importar"):
+            render_export_import(selected_empreendimento)
+        
         if st.button("⏳ Comparar Períodos", use_container_width=True, key="sidebar_compare"):
             st.session_state.show_comparison = not st.session_state.show_comparison
             st.rerun()
         
-        # Seção de envio para AWS
-        st.markdown("---")
-        st.markdown("### ☁️ Linhas de Base para Enviar")
-        
-        empreendimento_baselines = baselines.get(selected_empreendimento, {})
-        unsent_baselines = st.session_state.unsent_baselines.get(selected_empreendimento, [])
-        
-        if unsent_baselines:
-            st.info(f"📋 {len(unsent_baselines)} linha(s) de base aguardando envio para AWS")
-            
-            for version_name in unsent_baselines:
-                col1, col2, col3 = st.columns([3, 1, 1])
-                with col1:
-                    st.write(f"`{version_name}`")
-                with col2:
-                    if st.button("☁️", key=f"aws_{version_name}"):
-                        if send_to_aws(selected_empreendimento, version_name):
-                            st.success(f"✅ {version_name} enviado para AWS!")
-                            st.rerun()
-                with col3:
-                    if st.button("🗑️", key=f"del_{version_name}"):
-                        if delete_baseline(selected_empreendimento, version_name):
-                            # Remover da lista de não enviados também
-                            if version_name in st.session_state.unsent_baselines.get(selected_empreendimento, []):
-                                st.session_state.unsent_baselines[selected_empreendimento].remove(version_name)
-                            st.success(f"✅ {version_name} deletado!")
-                            st.rerun()
-        else:
-            st.info("📭 Nenhuma linha de base aguardando envio")
+        if st.button("🔄 Restaurar Linha de Base", use_container_width=True, key="sidebar_restore"):
+            st.session_state.show_restore = not st.session_state.show_restore
+            st.rerun()
         
-        # Gerenciamento de todas as linhas de base
-        st.markdown("---")
-        st.markdown("### 💾 Todas as Linhas de Base")
+        if st.button("📈 Visão do Portfólio", use_container_width=True, key="sidebar_portfolio"):
+            st.session_state.show_portfolio = not st.session_state.show_portfolio
+            st.rerun()
         
-        if empreendimento_baselines:
-            for version_name in sorted(empreendimento_baselines.keys()):
-                is_unsent = version_name in unsent_baselines
-                
-                col1, col2 = st.columns([3, 1])
-                with col1:
-                    if is_unsent:
-                        st.write(f"`{version_name}` ⏳")
-                    else:
-                        st.write(f"`{version_name}` ✅")
-                with col2:
-                    if st.button("🗑️", key=f"del_all_{version_name}"):
-                        if delete_baseline(selected_empreendimento, version_name):
-                            # Remover da lista de não enviados também
-                            if version_name in st.session_state.unsent_baselines.get(selected_empreendimento, []):
-                                st.session_state.unsent_baselines[selected_empreendimento].remove(version_name)
-                            st.success(f"✅ {version_name} deletado!")
-                            st.rerun()
-        else:
-            st.info("Nenhuma linha de base criada")
+        # Listas e ações de linhas de base (fragmento com reexecução própria)
+        render_baseline_sidebar(selected_empreendimento)
     
     # Visualização principal
     col1, col2 = st.columns([2, 1])
     
-    with col1:
+    with col1, metrics.span("main.project_data"):
         st.subheader("Dados do Projeto")
         st.dataframe(df_filtered, use_container_width=True)
     
-    with col2:
+    with col2, metrics.span("main.baseline_list"):
         st.subheader("Linhas de Base")
-        empreendimento_baselines = baselines.get(selected_empreendimento, {})
-        unsent_baselines = st.session_state.unsent_baselines.get(selected_empreendimento, [])
+        empreendimento_baselines = list_baseline_versions(selected_empreendimento)
         
         if empreendimento_baselines:
             for version in sorted(empreendimento_baselines.keys()):
-                if version in unsent_baselines:
+                if empreendimento_baselines[version]["sync_status"] != 'sent':
                     st.write(f"• {version} ⏳")
                 else:
                     st.write(f"• {version} ✅")
         else:
             st.info("Nenhuma linha de base")
     
+    # Gráfico de Gantt
+    st.markdown("---")
+    st.subheader("📊 Gráfico de Gantt")
+    with metrics.span("main.gantt"):
+        display_gantt(df_filtered, selected_empreendimento, empreendimento_baselines)
+    
     # Menu de contexto
     st.markdown("---")
     st.subheader("Menu de Contexto (Clique com Botão Direito)")
@@ -746,12 +3464,42 @@ def main():
     # Comparação de períodos
     if st.session_state.show_comparison:
         st.markdown("---")
-        display_period_comparison(df_filtered, empreendimento_baselines)
+        with metrics.span("main.comparison"):
+            display_period_comparison(df_filtered, selected_empreendimento, empreendimento_baselines)
+            display_task_history(df_filtered, selected_empreendimento)
+    
+    # Restauração e linha do tempo
+    if st.session_state.show_restore:
+        st.markdown("---")
+        with metrics.span("main.restore"):
+            display_restore_view(selected_empreendimento, empreendimento_baselines)
+    
+    # Desvios de todo o portfólio
+    if st.session_state.show_portfolio:
+        st.markdown("---")
+        with metrics.span("main.portfolio"):
+            display_portfolio_view()
     
     # Status de linhas de base não enviadas
-    total_unsent = sum(len(baselines) for baselines in st.session_state.unsent_baselines.values())
+    total_unsent = count_unsent_baselines()
     if total_unsent > 0:
         st.warning(f"⚠️ Você tem {total_unsent} linha(s) de base não enviadas para AWS. Envie-as pela barra lateral.")
+    
+    # Painel de diagnóstico (ligado na configuração ou com ?debug=1 na URL)
+    if METRICS_DEBUG_PANEL or st.query_params.get("debug") == "1":
+        with st.sidebar:
+            render_metrics_panel()
+
+def run_app():
+    """Executa main() como uma reexecução medida; o resumo é publicado mesmo quando st.rerun() a interrompe"""
+    metrics = get_metrics()
+    metrics.begin_run()
+    start = time.perf_counter()
+    try:
+        with metrics.span("main.rerun"):
+            main()
+    finally:
+        publish_run_metrics(metrics.end_run(), time.perf_counter() - start)
 
 if __name__ == "__main__":
-    main()
+    run_app()
@@ -0,0 +1,411 @@
+"""Benchmarks do ciclo de vida das linhas de base.
+
+Gera dados sintéticos (N empreendimentos × M tarefas × K versões) e mede
+take_baseline, save_baseline, list_baseline_versions, load_baseline_payload,
+a comparação de versões, os agregados do portfólio e a execução completa da
+página. Cada operação reporta percentis de latência, pico de memória
+(tracemalloc) e, por tamanho, os bytes de cada formato de payload.
+
+O armazenamento (--backend) é sempre o do app:
+    docker   (padrão) um MySQL descartável num contêiner (docker run mysql:8),
+             esvaziado a cada tamanho e removido ao final; as latências
+             incluem as consultas reais
+    secrets  o MySQL de [aws_db] nos secrets (use um banco dedicado: o
+             benchmark grava versões de teste)
+    mock     o banco mock em session_state; mede só o código Python, não o
+             armazenamento
+
+O SQL do app é do MySQL (ON DUPLICATE KEY, GET_LOCK, information_schema),
+por isso o banco local é um MySQL e não um SQLite. --compare avisa quando os
+dois relatórios usam armazenamentos diferentes.
+
+Uso:
+    python benchmark.py --projects 3 --tasks 10,1000,100000 --versions 5 --output atual.json
+    python benchmark.py --backend mock --tasks 10,1000 --skip-rerun
+    python benchmark.py --compare base.json atual.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from contextlib import contextmanager
+from datetime import datetime
+
+import mysql.connector
+import numpy as np
+import pandas as pd
+
+# Sem `streamlit run` o Streamlit avisa a cada chamada que não há ScriptRunContext
+logging.disable(logging.WARNING)
+warnings.filterwarnings("ignore")
+
+import streamlit as st
+
+import app
+
+# Fração de tarefas com datas reais alteradas entre uma versão e a seguinte
+SLIP_FRACTION = 0.1
+# Regressão: p50 novo acima de (1 + limite) × p50 anterior e pelo menos esta diferença absoluta
+REGRESSION_THRESHOLD = 0.2
+REGRESSION_MIN_MS = 1.0
+# MySQL local do backend docker: imagem, porta no host e espera máxima (s) até aceitar conexões
+MYSQL_DOCKER_IMAGE = "mysql:8.0"
+MYSQL_DOCKER_PORT = 33306
+MYSQL_DOCKER_STARTUP_TIMEOUT = 180
+
+# --- Dados Sintéticos ---
+
+def synthetic_tasks(n_projects, n_tasks, rng):
+    """DataFrame de tarefas no formato das fontes de dados (TASK_COLUMNS)"""
+    total = n_projects * n_tasks
+    start = np.datetime64('2025-01-01') + rng.integers(0, 365, total).astype('timedelta64[D]')
+    duration = rng.integers(1, 60, total).astype('timedelta64[D]')
+    real_delay = rng.integers(-5, 15, total).astype('timedelta64[D]')
+    return pd.DataFrame({
+        'ID_Tarefa': np.arange(1, total + 1),
+        'Empreendimento': np.repeat([f'Empreendimento {i:04d}' for i in range(n_projects)], n_tasks),
+        'Tarefa': [f'Tarefa {i % 500}' for i in range(total)],
+        'Real_Inicio': start + real_delay,
+        'Real_Fim': start + duration + real_delay,
+        'P0_Previsto_Inicio': start,
+        'P0_Previsto_Fim': start + duration,
+    })
+
+class SyntheticDataSource(app.MockDataSource):
+    """Fonte em memória com os dados sintéticos, indexada por empreendimento como a fonte mock"""
+
+    def __init__(self, df, chunksize):
+        app.ProjectDataSource.__init__(self, chunksize)
+        df = app._compact_task_frame(app._normalize_task_chunk(df))
+        self._projects = {
+            empreendimento: df.iloc[positions].reset_index(drop=True)
+            for empreendimento, positions in df.groupby('Empreendimento', observed=True).indices.items()
+        }
+
+    def slip(self, rng, fraction=SLIP_FRACTION):
+        """Atrasa o fim real de uma fração das tarefas, para que versões seguidas sejam diferentes"""
+        for empreendimento, df in self._projects.items():
+            df = df.copy()
+            rows = rng.random(len(df)) < fraction
+            df.loc[rows, 'Real_Fim'] += pd.to_timedelta(rng.integers(1, 20, rows.sum()), unit='D')
+            self._projects[empreendimento] = df
+
+# --- Armazenamento ---
+
+@contextmanager
+def docker_mysql(image=MYSQL_DOCKER_IMAGE, port=MYSQL_DOCKER_PORT):
+    """MySQL descartável num contêiner: sobe, espera aceitar conexões, produz o DB_CONFIG e remove ao final"""
+    name = f"baseline-bench-{os.getpid()}"
+    config = {'host': '127.0.0.1', 'user': 'root', 'password': 'bench', 'database': 'bench', 'port': port}
+    try:
+        subprocess.run([
+            'docker', 'run', '-d', '--rm', '--name', name, '-p', f"127.0.0.1:{port}:3306",
+            '-e', f"MYSQL_ROOT_PASSWORD={config['password']}", '-e', f"MYSQL_DATABASE={config['database']}", image
+        ], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise SystemExit(f"Não foi possível iniciar o MySQL no docker ({e}); use --backend secrets ou mock")
+    try:
+        # A imagem reinicia o servidor depois de criar o banco: espera a conexão TCP funcionar
+        deadline = time.monotonic() + MYSQL_DOCKER_STARTUP_TIMEOUT
+        while True:
+            try:
+                mysql.connector.connect(**config).close()
+                break
+            except mysql.connector.Error:
+                if time.monotonic() > deadline:
+                    raise SystemExit(f"O MySQL do contêiner {name} não respondeu em {MYSQL_DOCKER_STARTUP_TIMEOUT}s")
+                time.sleep(1)
+        yield config
+    finally:
+        subprocess.run(['docker', 'rm', '-f', name], capture_output=True)
+
+def use_storage(backend, db_config):
+    """Aponta o app para o armazenamento escolhido; os recursos em cache (pool, schema, catálogo) são refeitos"""
+    if backend == 'mock':
+        app.USE_MOCK_DB = True
+    elif backend == 'docker':
+        app.DB_CONFIG = dict(db_config)
+        app.USE_MOCK_DB = False
+    elif app.USE_MOCK_DB:
+        raise SystemExit("--backend secrets exige [aws_db] nos secrets")
+    st.cache_resource.clear()
+
+def truncate_baselines():
+    """Esvazia as tabelas de linhas de base (só no MySQL descartável do backend docker)"""
+    conn = app.get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+        for table in ('baseline_tasks', 'baselines', 'baseline_sequences'):
+            cursor.execute(f"TRUNCATE TABLE {table}")
+        cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+    finally:
+        app.release_db_connection(conn, cursor)
+
+def reset_session(backend):
+    """Estado de sessão vazio, como o de uma sessão nova do app; no docker, também o banco vazio"""
+    for key in list(st.session_state.keys()):
+        del st.session_state[key]
+    st.session_state.planned_overrides = {}
+    st.session_state.planned_frames = {}
+    app.ensure_schema()
+    if backend == 'docker':
+        truncate_baselines()
+        st.cache_resource.clear()
+        app.ensure_schema()
+
+def install_source(source):
+    """Faz o app ler as tarefas da fonte sintética, com um cache novo"""
+    cache = app.ProjectDataCache(source, app.PROJECT_CACHE_MAXSIZE, app.CATALOG_CACHE_TTL)
+    app.get_project_data_cache = lambda: cache
+    return cache
+
+# --- Medição ---
+
+def measure(fn, repeat):
+    """Executa fn `repeat` vezes medindo a latência; uma execução extra mede o pico de memória"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    timings = np.array(timings)
+    return {
+        'n': repeat,
+        'p50_ms': float(np.percentile(timings, 50)),
+        'p90_ms': float(np.percentile(timings, 90)),
+        'p99_ms': float(np.percentile(timings, 99)),
+        'mean_ms': float(timings.mean()),
+        'min_ms': float(timings.min()),
+        'max_ms': float(timings.max()),
+        'peak_mem_mb': peak / 1e6,
+    }
+
+def payload_sizes(df_previous, df_version):
+    """Bytes de uma versão em cada formato de armazenamento/envio"""
+    df_changed, removed_ids = app._diff_baseline_frames(df_previous, df_version)
+    return {
+        'json': len(app._frame_json(df_version).encode('utf-8')),
+        'compact_numpy': len(app.encode_compact_payload(df_version, codec=app.COMPACT_CODEC_NUMPY)),
+        'compact_arrow': len(app.encode_compact_payload(df_version, codec=app.COMPACT_CODEC_ARROW)),
+        'delta_compact': len(app.encode_compact_payload(df_changed, codec=app.COMPACT_CODEC_NUMPY))
+                         + len(app._encode_task_ids(removed_ids) or b''),
+        'changed_tasks': len(df_changed),
+    }
+
+def version_names(empreendimento):
+    return sorted(app.list_baseline_versions(empreendimento), key=app._version_sort_key)
+
+def run_scenario(n_projects, n_tasks, n_versions, repeat, rng, backend):
+    """Mede as operações do ciclo de vida para um tamanho de empreendimento"""
+    results = {}
+    reset_session(backend)
+    source = SyntheticDataSource(synthetic_tasks(n_projects, n_tasks, rng), app.PROJECT_DATA_CHUNKSIZE)
+    cache = install_source(source)
+    empreendimentos = cache.empreendimentos()
+    target = empreendimentos[0]
+
+    # K versões por empreendimento, com tarefas atrasadas entre uma e outra
+    for _ in range(n_versions):
+        source.slip(rng)
+        cache._projects.clear()
+        app.take_baselines(empreendimentos)
+    versions = version_names(target)
+
+    def take_baseline():
+        source.slip(rng)
+        cache._projects.clear()
+        app.take_baseline(target)
+    results['take_baseline'] = measure(take_baseline, repeat)
+
+    results['take_baselines_bulk'] = measure(lambda: app.take_baselines(empreendimentos), repeat)
+
+    df_version = app.load_baseline_payload(target, versions[-1])
+    counter = iter(range(10 ** 6))
+    results['save_baseline'] = measure(
+        lambda: app.save_baseline(target, f"P{900000 + next(counter)}-(bench)", df_version, "bench"), repeat
+    )
+
+    # Catálogo de versões: consulta ao armazenamento (cache invalidado) e leitura em memória
+    def list_versions_cold():
+        app.get_baseline_catalog().invalidate(target)
+        app.list_baseline_versions(target)
+    results['list_baseline_versions_cold'] = measure(list_versions_cold, repeat)
+    results['list_baseline_versions_warm'] = measure(lambda: app.list_baseline_versions(target), repeat)
+
+    def load_payload_cold():
+        app.get_baseline_catalog().invalidate(target, versions[-1])
+        app.load_baseline_payload(target, versions[-1])
+    results['load_baseline_payload_cold'] = measure(load_payload_cold, repeat)
+    results['load_baseline_payload_warm'] = measure(lambda: app.load_baseline_payload(target, versions[-1]), repeat)
+
+    # Comparação: montagem da matriz (motor novo) e consultas com a matriz pronta
+    versions = version_names(target)
+    results['compare_pair_cold'] = measure(
+        lambda: app.ComparisonEngine().compare(target, versions[0], versions[-1]), repeat
+    )
+    engine = app.ComparisonEngine()
+    engine.compare(target, versions[0], versions[-1])
+    results['compare_pair_warm'] = measure(lambda: engine.compare(target, versions[0], versions[-1]), repeat)
+    results['drift_all_versions'] = measure(lambda: engine.drift(target, versions), repeat)
+
+    results['portfolio_stats'] = measure(lambda: app.PortfolioAnalytics(app.CATALOG_CACHE_TTL).version_stats(), repeat)
+
+    sizes = payload_sizes(app.load_baseline_payload(target, versions[0]), app.load_baseline_payload(target, versions[1]))
+    return results, sizes
+
+def run_rerun_scenario(n_projects, n_tasks, repeat, rng, timeout, db_config):
+    """Execução completa da página (main) via AppTest, lendo os dados sintéticos de um Parquet"""
+    from streamlit.testing.v1 import AppTest
+
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'tasks.parquet')
+        synthetic_tasks(n_projects, n_tasks, rng).to_parquet(path)
+
+        def new_app():
+            at = AppTest.from_file(app_path, default_timeout=timeout)
+            at.secrets['project_data'] = {'source': 'parquet', 'path': path}
+            if db_config is not None:
+                at.secrets['aws_db'] = dict(db_config)
+            return at
+
+        def checked(at):
+            # Uma exceção na página tornaria a medição enganosa
+            if at.exception:
+                raise RuntimeError(f"A página falhou durante o benchmark: {at.exception[0].message}")
+            return at
+
+        def rerun_cold():
+            st.cache_resource.clear()
+            checked(new_app().run())
+        results = {'rerun_cold': measure(rerun_cold, repeat)}
+
+        at = checked(new_app().run())
+        results['rerun_warm'] = measure(lambda: checked(at.run()), repeat)
+        results['rerun_after_baseline'] = measure(
+            lambda: checked(at.sidebar.button(key="sidebar_baseline").click().run()), repeat
+        )
+    return results
+
+# --- Relatório ---
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args):
+    if args.backend == 'docker':
+        with docker_mysql() as db_config:
+            run_benchmark(args, db_config)
+    else:
+        run_benchmark(args, None)
+
+def run_benchmark(args, db_config):
+    use_storage(args.backend, db_config)
+    rng = np.random.default_rng(args.seed)
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'backend': args.backend,
+            'storage_format': app.BASELINE_STORAGE_FORMAT,
+            'delta_baselines': app.DELTA_BASELINES,
+        },
+        'params': {
+            'projects': args.projects, 'tasks': args.tasks, 'versions': args.versions,
+            'repeat': args.repeat, 'seed': args.seed,
+        },
+        'results': {},
+        'payload_bytes': {},
+    }
+    for n_tasks in args.tasks:
+        print(f"tarefas={n_tasks}...", file=sys.stderr)
+        results, sizes = run_scenario(args.projects, n_tasks, args.versions, args.repeat, rng, args.backend)
+        if not args.skip_rerun:
+            results.update(run_rerun_scenario(args.projects, n_tasks, args.repeat, rng, args.timeout, db_config))
+        for name, stats in results.items():
+            report['results'][f"tasks={n_tasks}/{name}"] = stats
+        report['payload_bytes'][f"tasks={n_tasks}"] = sizes
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    print_results(report)
+
+def print_results(report):
+    print(f"\n{'operação':<45} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'mem MB':>9}", file=sys.stderr)
+    for name, stats in report['results'].items():
+        print(
+            f"{name:<45} {stats['p50_ms']:>10.2f} {stats['p90_ms']:>10.2f} {stats['p99_ms']:>10.2f} "
+            f"{stats['peak_mem_mb']:>9.2f}", file=sys.stderr
+        )
+
+def compare(base_path, new_path):
+    """Compara dois relatórios pelo p50; retorna 1 se alguma operação regrediu"""
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    regressions = []
+    backends = (base['meta'].get('backend'), new['meta'].get('backend'))
+    if backends[0] != backends[1]:
+        print(f"⚠️ Armazenamentos diferentes ({backends[0]} × {backends[1]}): as latências não são comparáveis\n")
+    print(f"{'operação':<45} {'base p50':>10} {'novo p50':>10} {'razão':>7}")
+    for name, stats in new['results'].items():
+        if name not in base['results']:
+            continue
+        old_p50, new_p50 = base['results'][name]['p50_ms'], stats['p50_ms']
+        ratio = new_p50 / old_p50 if old_p50 else float('inf')
+        regressed = new_p50 > old_p50 * (1 + REGRESSION_THRESHOLD) and new_p50 - old_p50 >= REGRESSION_MIN_MS
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<45} {old_p50:>10.2f} {new_p50:>10.2f} {ratio:>7.2f}{'  ⚠️' if regressed else ''}")
+    if regressions:
+        print(f"\n{len(regressions)} regressão(ões) acima de {REGRESSION_THRESHOLD:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do ciclo de vida das linhas de base")
+    parser.add_argument('--projects', type=int, default=3, help="empreendimentos (N)")
+    parser.add_argument('--tasks', type=lambda value: [int(n) for n in value.split(',')], default=[10, 1000, 100000],
+                        help="tarefas por empreendimento (M), separadas por vírgula")
+    parser.add_argument('--versions', type=int, default=5, help="versões existentes por empreendimento (K)")
+    parser.add_argument('--repeat', type=int, default=5, help="execuções medidas por operação")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--backend', choices=['docker', 'secrets', 'mock'], default='docker',
+                        help="armazenamento: MySQL descartável no docker, o MySQL dos secrets ou o mock")
+    parser.add_argument('--timeout', type=float, default=120, help="timeout (s) de cada execução da página")
+    parser.add_argument('--skip-rerun', action='store_true', help="não medir a execução completa da página")
+    parser.add_argument('--output', help="arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NOVO'), help="compara dois relatórios JSON")
+    args = parser.parse_args()
+    if args.compare:
+        sys.exit(compare(*args.compare))
+    run(args)
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,104 @@
 /* Lógica JavaScript para o Menu Circular Minimalista */
 
-function createSnapshot(empreendimento) {
-    // Navega para a mesma URL mas com parâmetros que indicam para criar snapshot
-    const currentUrl = window.location.href.split('?')[0];
-    const encodedEmpreendimento = encodeURIComponent(empreendimento);
-    // CORREÇÃO: Adicionando o parâmetro 't' para forçar o Streamlit a recarregar a página e processar o parâmetro.
-    const newUrl = currentUrl + '?take_snapshot=true&empreendimento=' + encodedEmpreendimento + '&t=' + Date.now();
-    window.location.href = newUrl;
+// --- Protocolo de componentes do Streamlit ---
+// O menu roda no iframe do componente e conversa com a sessão via postMessage:
+// a ação vai como valor do componente e o resultado volta nos argumentos da próxima renderização.
+
+function sendMessage(type, data) {
+    window.parent.postMessage(Object.assign({ isStreamlitMessage: true, type: type }, data), '*');
+}
+
+function setComponentValue(value) {
+    sendMessage('streamlit:setComponentValue', { value: value, dataType: 'json' });
+}
+
+function setFrameHeight() {
+    sendMessage('streamlit:setFrameHeight', { height: document.body.scrollHeight });
+}
+
+let empreendimento = null;
+let pendingRequest = null;
+let statusTimer = null;
+
+const ACTION_MESSAGES = {
+    take_baseline: '🔄 Criando linha de base...',
+    view_period: '🔄 Abrindo comparação de períodos...',
+    restore_baseline: '🔄 Abrindo restauração de linha de base...'
+};
+
+function showStatus(message, type) {
+    const statusDiv = document.getElementById('baseline-status');
+    statusDiv.textContent = message;
+    statusDiv.className = type;
+    statusDiv.style.display = 'block';
+    setFrameHeight();
+
+    clearTimeout(statusTimer);
+    if (type !== 'status-creating') {
+        // Auto-esconder após 3 segundos
+        statusTimer = setTimeout(() => {
+            statusDiv.style.display = 'none';
+            setFrameHeight();
+        }, 3000);
+    }
+}
+
+function sendAction(action) {
+    if (pendingRequest !== null) {
+        return; // Aguarda o resultado da ação anterior
+    }
+    pendingRequest = Date.now();
+    showStatus(ACTION_MESSAGES[action], 'status-creating');
+    setComponentValue({ action: action, empreendimento: empreendimento, request_id: pendingRequest });
+}
+
+function onRender(args) {
+    empreendimento = args.empreendimento;
+    const result = args.result;
+
+    // Só o resultado do pedido em andamento interessa; os anteriores já foram mostrados
+    if (pendingRequest !== null && result && result.request_id === pendingRequest) {
+        pendingRequest = null;
+        showStatus(result.message, result.ok ? 'status-success' : 'status-error');
+    }
+}
+
+window.addEventListener('message', function(event) {
+    if (event.data.type === 'streamlit:render') {
+        onRender(event.data.args);
+    }
+});
+
+function createSnapshot() {
+    sendAction('take_baseline');
 }
 
-function viewPeriod(empreendimento) {
-    // Navega para a mesma URL mas com parâmetros que indicam para visualizar período
-    const currentUrl = window.location.href.split('?')[0];
-    const encodedEmpreendimento = encodeURIComponent(empreendimento);
-    // CORREÇÃO: Adicionando o parâmetro 't' para forçar o Streamlit a recarregar a página e processar o parâmetro.
-    const newUrl = currentUrl + '?view_period=true&empreendimento=' + encodedEmpreendimento + '&t=' + Date.now();
-    window.location.href = newUrl;
+function viewPeriod() {
+    sendAction('view_period');
 }
 
-function injectCircularMenu(empreendimento) {
-    // CORREÇÃO: O seletor deve ser mais robusto, mas o ID 'gantt-chart-area' é o alvo.
+function restoreBaseline() {
+    sendAction('restore_baseline');
+}
+
+function injectCircularMenu() {
     const ganttArea = document.getElementById('gantt-chart-area');
-    
+
     if (ganttArea) {
         ganttArea.addEventListener('contextmenu', function(e) {
             e.preventDefault(); // Previne o menu de contexto padrão do navegador
-            
+
             // Remove menu existente se houver
             const existingMenu = document.getElementById('circular-context-menu');
             if (existingMenu) {
                 existingMenu.remove();
             }
-            
+
             // Cria o container do menu circular
             const menuContainer = document.createElement('div');
             menuContainer.id = 'circular-context-menu';
             menuContainer.className = 'circular-menu';
-            
+
             // Define a posição inicial do menu (no ponto do clique)
             const x = e.pageX;
             const y = e.pageY;
@@ -44,14 +106,14 @@ function injectCircularMenu(empreendimento) {
             menuContainer.style.top = y + 'px';
 
             // --- Itens do Menu ---
-            
+
             // 1. Fotografar Linha de Base
             const item1 = document.createElement('div');
             item1.className = 'menu-item';
             item1.innerHTML = '<span class="menu-item-icon">📸</span>';
             item1.title = 'Fotografar Linha de Base';
             item1.onclick = () => {
-                createSnapshot(empreendimento);
+                createSnapshot();
                 menuContainer.remove();
             };
 
@@ -61,11 +123,21 @@ function injectCircularMenu(empreendimento) {
             item2.innerHTML = '<span class="menu-item-icon">⏳</span>';
             item2.title = 'Visualizar Período entre Linhas de Base';
             item2.onclick = () => {
-                viewPeriod(empreendimento);
+                viewPeriod();
+                menuContainer.remove();
+            };
+
+            // 3. Restaurar Linha de Base
+            const item3 = document.createElement('div');
+            item3.className = 'menu-item';
+            item3.innerHTML = '<span class="menu-item-icon">🔄</span>';
+            item3.title = 'Restaurar Linha de Base';
+            item3.onclick = () => {
+                restoreBaseline();
                 menuContainer.remove();
             };
 
-            // 3. Botão de Fechar (Opcional, mas útil)
+            // 4. Botão de Fechar (Opcional, mas útil)
             const closeButton = document.createElement('div');
             closeButton.className = 'menu-toggle';
             closeButton.innerHTML = '✖';
@@ -76,26 +148,27 @@ function injectCircularMenu(empreendimento) {
 
             menuContainer.appendChild(item1);
             menuContainer.appendChild(item2);
+            menuContainer.appendChild(item3);
             menuContainer.appendChild(closeButton);
-            
+
             document.body.appendChild(menuContainer);
-            
+
             // Força o reflow para garantir que a transição funcione
-            void menuContainer.offsetWidth; 
-            
+            void menuContainer.offsetWidth;
+
             // Torna o menu visível para iniciar a transição
             menuContainer.classList.add('visible');
 
             // --- Lógica de Posicionamento Circular ---
             const radius = 80; // Raio do círculo
-            const items = [item1, item2];
+            const items = [item1, item2, item3];
             const totalItems = items.length;
             const angleStep = 360 / totalItems; // Ângulo entre os itens
 
             items.forEach((item, index) => {
                 // Calcula o ângulo em radianos (começando de cima, -90 graus)
                 const angle = (index * angleStep - 90) * (Math.PI / 180);
-                
+
                 // Calcula a posição (x, y) no círculo
                 const itemX = radius * Math.cos(angle);
                 const itemY = radius * Math.sin(angle);
@@ -112,7 +185,7 @@ function injectCircularMenu(empreendimento) {
                     document.removeEventListener('click', closeMenu);
                 }
             }
-            
+
             // Adiciona o listener para fechar o menu
             setTimeout(() => {
                 document.addEventListener('click', closeMenu);
@@ -120,3 +193,17 @@ function injectCircularMenu(empreendimento) {
         });
     }
 }
+
+// Fechar menu com ESC
+document.addEventListener('keydown', function(e) {
+    if (e.key === 'Escape') {
+        const existingMenu = document.getElementById('circular-context-menu');
+        if (existingMenu) {
+            existingMenu.remove();
+        }
+    }
+});
+
+injectCircularMenu();
+sendMessage('streamlit:componentReady', { apiVersion: 1 });
+setFrameHeight();
@@ -0,0 +1,169 @@
+"""Fila de envio para a AWS contra um endpoint HTTP local (stub), sem banco (armazenamento mock)."""
+import logging
+import os
+import sys
+import threading
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Sem `streamlit run` o Streamlit avisa a cada chamada que não há ScriptRunContext
+logging.disable(logging.WARNING)
+warnings.filterwarnings("ignore")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import streamlit as st
+
+import app
+
+EMPREENDIMENTO = "Empreendimento Teste"
+
+
+class StubEndpoint:
+    """Endpoint de envio local: responde com os status programados (o último se repete) e registra as chamadas"""
+
+    def __init__(self, statuses, delay=None):
+        self.statuses = list(statuses)
+        self.delay = delay
+        self.requests = []
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                with stub._lock:
+                    stub.requests.append((self.path, body))
+                    status = stub.statuses[min(len(stub.requests), len(stub.statuses)) - 1]
+                if stub.delay:
+                    stub.delay.wait(5)
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/upload"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def upload_queue(monkeypatch):
+    """Fila nova (1 thread) apontada para o stub, sem espera entre tentativas"""
+    monkeypatch.setattr(app, 'USE_MOCK_DB', True)
+    monkeypatch.setattr(app, 'UPLOAD_MAX_ATTEMPTS', 3)
+    monkeypatch.setattr(app, 'UPLOAD_BACKOFF_MULTIPLIER', 0)
+    monkeypatch.setattr(app, 'UPLOAD_TIMEOUT', 5)
+    for key in list(st.session_state.keys()):
+        del st.session_state[key]
+    app.ensure_schema()
+    upload_queue = app.UploadQueue(workers=1, maxsize=10)
+    monkeypatch.setattr(app, 'get_upload_queue', lambda: upload_queue)
+    yield upload_queue
+    upload_queue.shutdown(timeout=5)
+
+
+def use_endpoint(monkeypatch, statuses, delay=None):
+    endpoint = StubEndpoint(statuses, delay)
+    monkeypatch.setattr(app, 'AWS_UPLOAD_URL', endpoint.url)
+    return endpoint
+
+
+def add_version(version_name, n_tasks=3):
+    df_version = pd.DataFrame({
+        'ID_Tarefa': np.arange(1, n_tasks + 1, dtype=np.int32),
+        'Inicio': pd.Timestamp('2025-01-01'),
+        'Fim': pd.Timestamp('2025-02-01'),
+    })
+    st.session_state.mock_baselines.setdefault(EMPREENDIMENTO, {})[version_name] = {
+        "date": "01/01/2025", "data": df_version, "sync_status": 'pending'
+    }
+
+
+def sync_status(version_name):
+    app.sync_mock_upload_status()
+    return st.session_state.mock_baselines[EMPREENDIMENTO][version_name]["sync_status"]
+
+
+def test_successful_upload_goes_from_pending_to_sent(monkeypatch, upload_queue):
+    release = threading.Event()
+    endpoint = use_endpoint(monkeypatch, [200], delay=release)
+    try:
+        add_version("P1-(01/01/2025)")
+        assert app.send_to_aws(EMPREENDIMENTO, "P1-(01/01/2025)")
+        assert sync_status("P1-(01/01/2025)") == 'pending'
+        release.set()
+        assert upload_queue.shutdown(timeout=5)
+        assert sync_status("P1-(01/01/2025)") == 'sent'
+        path, body = endpoint.requests[0]
+        assert path.startswith("/upload?") and "version_name=P1" in path
+        assert app.decode_baseline_payload("P1-(01/01/2025)", body)['ID_Tarefa'].tolist() == [1, 2, 3]
+    finally:
+        endpoint.close()
+
+
+def test_server_errors_are_retried_until_success(monkeypatch, upload_queue):
+    endpoint = use_endpoint(monkeypatch, [503, 502, 200])
+    try:
+        add_version("P1-(01/01/2025)")
+        assert app.send_to_aws(EMPREENDIMENTO, "P1-(01/01/2025)")
+        assert upload_queue.shutdown(timeout=5)
+        assert len(endpoint.requests) == 3
+        assert sync_status("P1-(01/01/2025)") == 'sent'
+    finally:
+        endpoint.close()
+
+
+def test_persistent_server_errors_end_as_failed(monkeypatch, upload_queue):
+    endpoint = use_endpoint(monkeypatch, [503])
+    try:
+        add_version("P1-(01/01/2025)")
+        assert app.send_to_aws(EMPREENDIMENTO, "P1-(01/01/2025)")
+        assert upload_queue.shutdown(timeout=5)
+        assert len(endpoint.requests) == app.UPLOAD_MAX_ATTEMPTS
+        assert sync_status("P1-(01/01/2025)") == 'failed'
+        assert "503" in st.session_state.mock_baselines[EMPREENDIMENTO]["P1-(01/01/2025)"]["sync_error"]
+    finally:
+        endpoint.close()
+
+
+def test_client_errors_are_not_retried(monkeypatch, upload_queue):
+    endpoint = use_endpoint(monkeypatch, [404])
+    try:
+        add_version("P1-(01/01/2025)")
+        assert app.send_to_aws(EMPREENDIMENTO, "P1-(01/01/2025)")
+        assert upload_queue.shutdown(timeout=5)
+        assert len(endpoint.requests) == 1
+        assert sync_status("P1-(01/01/2025)") == 'failed'
+    finally:
+        endpoint.close()
+
+
+def test_shutdown_drains_queued_uploads_and_refuses_new_ones(monkeypatch, upload_queue):
+    release = threading.Event()
+    endpoint = use_endpoint(monkeypatch, [200], delay=release)
+    try:
+        versions = [f"P{n}-(01/01/2025)" for n in range(1, 6)]
+        for version_name in versions:
+            add_version(version_name)
+        assert app.send_all_to_aws(EMPREENDIMENTO) == len(versions)
+        # A única thread está presa no primeiro envio: os demais continuam na fila
+        assert [sync_status(v) for v in versions] == ['pending'] * len(versions)
+        release.set()
+        assert upload_queue.shutdown(timeout=10)
+        assert len(endpoint.requests) == len(versions)
+        assert [sync_status(v) for v in versions] == ['sent'] * len(versions)
+        add_version("P6-(01/01/2025)")
+        assert not upload_queue.submit(app._upload_scope(), EMPREENDIMENTO, "P6-(01/01/2025)", b"")
+    finally:
+        endpoint.close()